@@ -1,39 +1,41 @@
 import streamlit as st
 import pandas as pd
 import time
-import re
 import datetime
-import os
-from dotenv import load_dotenv
-import psycopg2
 from psycopg2 import extras, OperationalError, InterfaceError
-from sqlalchemy import create_engine, text
+from check_results import show_check_results, store_results
+from checks import HANDLE_MATCH_LIMIT, check_ids_batch, check_ids_mixed, find_by_handles, handle_index_ready
+from db import DB_URL, get_db_connection, get_engine
+from migrations import APP_MIGRATIONS, SchemaError, require_schema
+from import_journal import clear_journal, journal_key, load_committed
+from key_snapshot import is_current, load_snapshot, refresh_snapshot
+from latency_panel import show_latency_panel, start_sql_session
+from ingest import CHUNK_SIZE, DEFAULT_WORKERS, IMPORT_MODES, MAX_WORKERS, insert_chunks_unnest, parallel_insert_chunks, preview_new_keys
+from pipeline import MIXED_TARGET, READ_CHUNK_ROWS, TABLE_OPTIONS, clean_import_frame, find_required_columns, map_columns, normalize_colname, read_import_csv_streaming, read_import_upload
+from sql_log import sql_label
+from table_stats import read_estimates, read_stats, refresh_error, refresh_in_background
+from upload_cache import cached_stage, file_digest
 
 st.set_page_config(page_title="UPI/Bank Import & Check", layout="wide")
-
-# Load environment variables
-load_dotenv()
-
-# Database Configuration from .env
-DB_URL = os.getenv("DB_URL")
+start_sql_session()
 
 if not DB_URL:
     st.error("❌ DB_URL not found in .env file. Please add your database connection string.")
     st.stop()
 
-# Convert SQLAlchemy format to psycopg2 format if needed
-if DB_URL and 'postgresql+psycopg2://' in DB_URL:
-    DB_URL = DB_URL.replace('postgresql+psycopg2://', 'postgresql://')
+engine = get_engine()
 
 @st.cache_resource
-def get_engine():
-    return create_engine(
-        DB_URL,
-        pool_pre_ping=True,
-        connect_args={"connect_timeout": 30},
-    )
+def get_schema_check():
+    require_schema(engine, APP_MIGRATIONS)
+    return True
 
-engine = get_engine()
+try:
+    get_schema_check()
+except SchemaError as e:
+    # Index builds on the key tables can take hours: run them from a shell, not a page
+    st.error(f"❌ {e}")
+    st.stop()
 
 st.markdown("""
     <style>
@@ -50,67 +52,6 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# Table options and their required columns + conflict column + filter value
-TABLE_OPTIONS = {
-    "UPI": {
-        "table_name": "all_upiiD",
-        "required": ["Upi_vpa", "Inserted_date"],
-        "conflict_col": "Upi_vpa",
-        "filter_value": "UPI"
-    },
-    "Bank Account": {
-        "table_name": "all_bank_acc",
-        "required": ["Bank_account_number", "Inserted_date"],
-        "conflict_col": "Bank_account_number",
-        "filter_value": "Bank Account"
-    }
-}
-
-def get_db_connection():
-    """Create database connection with keepalive settings"""
-    return psycopg2.connect(
-        DB_URL,
-        connect_timeout=10,
-        keepalives=1,
-        keepalives_idle=30,
-        keepalives_interval=10,
-        keepalives_count=5
-    )
-
-def normalize_colname(name: str) -> str:
-    return re.sub(r'[^a-z0-9]', '', str(name).lower())
-
-
-def map_columns(df_columns):
-    mapping = {}
-    for col in df_columns:
-        mapping[normalize_colname(col)] = col
-    return mapping
-
-
-def find_required_columns(df_cols, required_list):
-    mapping = map_columns(df_cols)
-    found = {}
-    missing = []
-    for req in required_list:
-        norm_req = normalize_colname(req)
-        if norm_req in mapping:
-            found[req] = mapping[norm_req]
-        else:
-            parts = re.split(r'[^a-z0-9]+', req.lower())
-            matched = None
-            for dfcol in df_cols:
-                n = normalize_colname(dfcol)
-                if all(p for p in parts if p and p in n):
-                    matched = dfcol
-                    break
-            if matched:
-                found[req] = matched
-            else:
-                missing.append(req)
-    return found, missing
-
-
 def import_with_retries(records,
                         table_name,
                         on_conflict,
@@ -196,134 +137,44 @@ def import_with_retries(records,
     return {"inserted": 0, "errors": [{"error": "Max retries exceeded"}]}
 
 
-# ============================================================================
-# CHECK FUNCTIONS
-# ============================================================================
-
-def check_id_in_db(id_value: str, table_name: str, search_column: str) -> dict:
-    """Check if ID exists in database using direct SQL query"""
-    conn = None
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        
-        query = f'SELECT * FROM "{table_name}" WHERE "{search_column}" = %s LIMIT 1'
-        cur.execute(query, (id_value.strip(),))
-        
-        result = cur.fetchone()
-        
-        cur.close()
-        conn.close()
-        
-        if result:
-            return {
-                "exists": True,
-                "record": dict(result),
-                "error": None
-            }
-        else:
-            return {
-                "exists": False,
-                "record": None,
-                "error": None
-            }
-    except Exception as e:
-        if conn:
-            try:
-                conn.close()
-            except:
-                pass
-        return {
-            "exists": False,
-            "record": None,
-            "error": str(e)
-        }
-
-
-def check_ids_batch(ids_list: list, table_name: str, search_column: str) -> pd.DataFrame:
-    """Check multiple IDs in batch"""
-    results = []
-    
-    # Use batch query for better performance
-    conn = None
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        
-        # Query all IDs at once
-        placeholders = ','.join(['%s'] * len(ids_list))
-        query = f'SELECT "{search_column}" FROM "{table_name}" WHERE "{search_column}" IN ({placeholders})'
-        cur.execute(query, ids_list)
-        
-        found_ids = set(row[search_column] for row in cur.fetchall())
-        
-        cur.close()
-        conn.close()
-        
-        # Build results
-        for id_val in ids_list:
-            exists = id_val in found_ids
-            results.append({
-                "ID": id_val,
-                "Exists": "✅ Yes" if exists else "❌ No",
-                "Status": "Found" if exists else "Not Found"
-            })
-            
-    except Exception as e:
-        if conn:
-            try:
-                conn.close()
-            except:
-                pass
-        # Fallback to individual checks
-        st.warning(f"Batch check failed: {e}. Falling back to individual checks...")
-        for id_val in ids_list:
-            check_result = check_id_in_db(id_val, table_name, search_column)
-            results.append({
-                "ID": id_val,
-                "Exists": "✅ Yes" if check_result["exists"] else "❌ No",
-                "Status": check_result["error"] if check_result["error"] else "Found" if check_result["exists"] else "Not Found"
-            })
-    
-    return pd.DataFrame(results)
-
-
 st.title("Total Database Summary")
 
 try:
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    # Total UPI IDs and latest date
-    cur.execute('SELECT COUNT(*), MAX("Inserted_date") FROM "all_upiiD"')
-    upi_result = cur.fetchone()
-    upi_count = upi_result[0]
-    upi_latest_date = upi_result[1]
-
-    # Total Bank Accounts and latest date
-    cur.execute('SELECT COUNT(*), MAX("Inserted_date") FROM "all_bank_acc"')
-    bank_result = cur.fetchone()
-    bank_count = bank_result[0]
-    bank_latest_date = bank_result[1]
-
-    cur.close()
-    conn.close()
+    # Maintained counters: no full-table scan per rerun
+    stats_tables = [TABLE_OPTIONS["UPI"]["table_name"], TABLE_OPTIONS["Bank Account"]["table_name"]]
+    with sql_label("header stats"):
+        try:
+            table_stats = read_stats(engine, stats_tables)
+            for stats_table, table_stat in table_stats.items():
+                if not table_stat["exact"]:
+                    refresh_in_background(engine, stats_table)
+        except Exception as e:
+            st.caption(f"⚠️ Stats table unavailable, showing estimates: {e}")
+            table_stats = read_estimates(engine, stats_tables)
 
     # ===== DISPLAY =====
     col1, col2 = st.columns(2)
 
-    with col1:
-        latest_date_str = f" (Latest: {upi_latest_date.strftime('%Y-%m-%d')})" if upi_latest_date else ""
-        st.metric("Total UPI IDs", f"{upi_count:,}{latest_date_str}")
-
-    with col2:
-        latest_date_str = f" (Latest: {bank_latest_date.strftime('%Y-%m-%d')})" if bank_latest_date else ""
-        st.metric("Total Bank Accounts", f"{bank_count:,}{latest_date_str}")
+    for col, label, stats_table in ((col1, "Total UPI IDs", stats_tables[0]), (col2, "Total Bank Accounts", stats_tables[1])):
+        table_stat = table_stats[stats_table]
+        with col:
+            latest_date_str = f" (Latest: {table_stat['latest'].strftime('%Y-%m-%d')})" if table_stat["latest"] else ""
+            approx = "" if table_stat["exact"] else "~"
+            st.metric(label, f"{approx}{table_stat['count']:,}{latest_date_str}")
+            if not table_stat["exact"]:
+                failed = refresh_error(stats_table)
+                if failed:
+                    st.caption(f"⚠️ Estimate from table statistics; exact count failed: {failed}")
+                else:
+                    st.caption("Estimate from table statistics; exact count pending.")
 
 except Exception as e:
     st.error("Failed to fetch data from Nhost DB")
     st.exception(e)
 
+# Statements of earlier reruns plus the header above (later steps may stop the script)
+show_latency_panel()
+
 # ============================================================================
 # MAIN UI: TWO-COLUMN LAYOUT
 # ============================================================================
@@ -340,85 +191,62 @@ with col1:
     target_label = st.selectbox("Select target to import", list(TABLE_OPTIONS.keys()), key="import_target")
     target_cfg = TABLE_OPTIONS[target_label]
     TABLE_NAME = target_cfg["table_name"]
-    REQUIRED_COLS = target_cfg["required"]
     CONFLICT_COL = target_cfg["conflict_col"]
-    FILTER_VALUE = target_cfg["filter_value"]
     
     st.markdown(f"**Target table:** `{TABLE_NAME}`")
     
     uploaded_file = st.file_uploader("Upload CSV file", type=["csv", "txt"], key="import_file")
+    stream_upload = st.checkbox(
+        f"Stream large file in chunks of {READ_CHUNK_ROWS:,} rows (lower memory)",
+        value=False, key="import_stream"
+    )
     
     if uploaded_file:
+        st.write(f"**Applying filters for {target_label}...**")
+        
         try:
-            df = pd.read_csv(uploaded_file, dtype=str)
-            st.info(f"📄 Loaded {len(df)} rows with {len(df.columns)} columns")
+            digest = file_digest(uploaded_file)
+            if stream_upload:
+                df_clean, stats = cached_stage(
+                    digest, f"streamed:{target_label}",
+                    lambda: read_import_csv_streaming(uploaded_file, target_cfg)
+                )
+            else:
+                df_clean, stats = cached_stage(
+                    digest, f"cleaned:{target_label}",
+                    lambda: clean_import_frame(
+                        cached_stage(digest, f"parsed:{target_label}",
+                                     lambda: read_import_upload(uploaded_file, target_cfg)),
+                        target_cfg
+                    )
+                )
         except Exception as e:
             st.error(f"Could not read CSV: {e}")
             st.stop()
         
-        st.write(f"**Applying filters for {target_label}...**")
-        
-        mask = (
-            (df["Feature_type"].astype(str).str.strip() == "BS Money Laundering") &
-            (df["Upi_bank_account_wallet"].astype(str).str.strip().isin([FILTER_VALUE])) &
-            (df["Search_for"].astype(str).str.strip().isin(["App", "Web"]))
-        )
-
-        filtered_df = df[mask].copy()
-        st.write(f"✅ After filtering: {len(filtered_df)} rows (removed {len(df) - len(filtered_df)} rows)")
-        
-        if len(filtered_df) == 0:
-            st.warning("⚠️ No rows matched the filter criteria. Please check your CSV data.")
+        # Checked first: without the required columns no rows are read at all
+        if stats["missing"]:
+            st.error(f"❌ CSV must contain columns: {', '.join(stats['missing'])}")
+            st.error(f"Available columns: {', '.join(stats['columns'])}")
             st.stop()
         
-        # Find required columns
-        found_cols_map, missing = find_required_columns(filtered_df.columns.tolist(), REQUIRED_COLS)
-        
-        if missing:
-            st.error(f"❌ CSV must contain columns: {', '.join(missing)}")
-            st.error(f"Available columns: {', '.join(filtered_df.columns.tolist())}")
-            st.stop()
+        st.info(f"📄 Loaded {stats['rows']} rows with {len(stats['columns'])} columns")
         
-        # Select and rename columns
-        actual_cols = [found_cols_map[c] for c in REQUIRED_COLS]
-        df_clean = filtered_df[actual_cols].copy()
-        rename_map = {found_cols_map[c]: c for c in REQUIRED_COLS}
-        df_clean = df_clean.rename(columns=rename_map)
+        st.write(f"✅ After filtering: {stats['filtered']} rows (removed {stats['rows'] - stats['filtered']} rows)")
         
-        # Validate key column
-        key_col = CONFLICT_COL
-        if key_col not in df_clean.columns:
-            st.error(f"Internal error: expected key column '{key_col}' not found.")
+        if stats["filtered"] == 0:
+            st.warning("⚠️ No rows matched the filter criteria. Please check your CSV data.")
             st.stop()
         
-        # ---------- CLEANING ----------
-        df_clean = df_clean.dropna(subset=[key_col])
-        df_clean[key_col] = df_clean[key_col].astype(str).str.strip()
-        
-        if key_col.lower() == "upi_vpa":
-            df_clean[key_col] = df_clean[key_col].str.lower()
-        
-        df_clean = df_clean[df_clean[key_col] != ""]
-        df_clean = df_clean.drop_duplicates(subset=[key_col])
-        
-        st.write(f"🧹 After cleaning: {len(df_clean)} unique records")
+        key_col = CONFLICT_COL
+        st.write(f"🧹 After cleaning: {stats['cleaned']} unique records")
         
         # --------------------------
         # INSERTED_DATE NORMALIZE & TODAY CHECK
         # --------------------------
         if "Inserted_date" in df_clean.columns:
-            parsed_dates = pd.to_datetime(df_clean["Inserted_date"], errors="coerce")
-            
-            nat_mask = parsed_dates.isna()
-            nat_count = int(nat_mask.sum())
-            
-            if nat_count > 0:
-                st.warning(f"⚠️ {nat_count} row(s) have unparseable dates and will be removed.")
-                df_clean = df_clean[~nat_mask].copy()
-                parsed_dates = parsed_dates[~nat_mask]
-            
-            # Python date object — matches PostgreSQL date type
-            df_clean["Inserted_date"] = parsed_dates.dt.date
+            if stats["nat"] > 0:
+                st.warning(f"⚠️ {stats['nat']} row(s) have unparseable dates and were removed.")
 
             today = datetime.date.today()
             today_mask = df_clean["Inserted_date"] == today
@@ -450,17 +278,75 @@ with col1:
         with st.expander("📋 Preview data (first 10 rows)", expanded=False):
             st.dataframe(df_clean.head(10), use_container_width=True)
         
-        CHUNK_SIZE = 10_000
+        # --------------------------
+        # DRY RUN: WHAT WILL ACTUALLY BE NEW
+        # --------------------------
+        if st.button("🔬 Preview new vs existing (dry run)", use_container_width=True):
+            with st.spinner("Comparing keys with database..."):
+                try:
+                    preview = preview_new_keys(engine, df_clean, TABLE_NAME, key_col, chunk_size=CHUNK_SIZE)
+                except Exception as e:
+                    st.error(f"❌ Preview failed: {e}")
+                    st.stop()
+
+            total_preview = preview["new"] + preview["existing"]
+            col_new, col_existing, col_time = st.columns(3)
+            col_new.metric("🆕 New", f"{preview['new']:,}", f"{(preview['new']/total_preview*100):.1f}%")
+            col_existing.metric("📦 Already present", f"{preview['existing']:,}", f"{(preview['existing']/total_preview*100):.1f}%")
+            col_time.metric("⏱️ Preview Time", f"{preview['elapsed']:.1f}s")
+
+            st.dataframe(preview["by_date"], use_container_width=True, hide_index=True)
+
+            st.download_button(
+                label="📥 Download New Keys",
+                data=preview["new_keys"].to_csv(index=False),
+                file_name=f"new_keys_{target_label.lower().replace(' ', '_')}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                mime="text/csv",
+                use_container_width=True
+            )
+        
+        import_mode = st.selectbox("Import mode", list(IMPORT_MODES.keys()), key="import_mode")
+        write_chunks = IMPORT_MODES[import_mode]
+        write_kwargs = {}
+        if write_chunks is parallel_insert_chunks:
+            write_kwargs["workers"] = st.number_input(
+                "Parallel workers (one pooled connection each)",
+                min_value=1, max_value=MAX_WORKERS, value=DEFAULT_WORKERS, step=1, key="import_workers"
+            )
+        
+        # --------------------------
+        # RESUME FROM IMPORT JOURNAL (chunked INSERT mode only)
+        # --------------------------
+        restart_journal = False
+        if write_chunks is insert_chunks_unnest:
+            try:
+                run_key = journal_key(digest, TABLE_NAME, CHUNK_SIZE, total_rows)
+                committed = load_committed(engine, run_key)
+            except Exception as e:
+                st.warning(f"⚠️ Import journal unavailable, import will not be resumable: {e}")
+                run_key, committed = None, {}
+            
+            total_chunks = -(-total_rows // CHUNK_SIZE)
+            if run_key and committed:
+                first_pending = next((n for n in range(total_chunks) if n not in committed), None)
+                if first_pending is None:
+                    st.info(f"ℹ️ The journal shows all {total_chunks:,} chunks of this file were already imported into `{TABLE_NAME}`.")
+                    restart_journal = st.checkbox("Import again from row 0 (clears the journal for this file)",
+                                                  value=False, key="import_restart")
+                else:
+                    st.warning(f"⚠️ A previous import of this file committed {len(committed):,} / {total_chunks:,} chunks.")
+                    restart_journal = not st.checkbox(
+                        f"Resume from chunk {first_pending + 1} (uncheck to start over from row 0)",
+                        value=True, key="import_resume"
+                    )
+            if run_key:
+                write_kwargs["journal"] = run_key
+        
         st.info(f"💡 Import will execute in chunks of {CHUNK_SIZE:,} rows with live progress")
         
         btn = st.button("🚀 Start Import", use_container_width=True, type="primary")
         
         if btn:
-            start_time = time.time()
-
-            inserted_total = 0
-            skipped_total  = 0
-
             # --- Live UI elements ---
             progress_bar    = st.progress(0)
             status_text     = st.empty()
@@ -469,59 +355,44 @@ with col1:
             skipped_metric  = metrics_cols[1].empty()
             elapsed_metric  = metrics_cols[2].empty()
 
+            start_time = time.time()
+
+            def show_progress(label, processed, inserted_total, skipped_total):
+                pct     = processed / total_rows
+                elapsed = time.time() - start_time
+
+                progress_bar.progress(pct)
+                status_text.write(
+                    f"⏳ {label} — "
+                    f"{processed:,} / {total_rows:,} rows ({pct*100:.1f}%)"
+                )
+                inserted_metric.metric("✅ Inserted", f"{inserted_total:,}")
+                skipped_metric.metric("⏭️ Skipped (duplicates)", f"{skipped_total:,}")
+                elapsed_metric.metric("⏱️ Elapsed", f"{elapsed:.1f}s")
+
             try:
-                for i in range(0, total_rows, CHUNK_SIZE):
-                    chunk = df_clean.iloc[i:i + CHUNK_SIZE]
-
-                    # Build arrays for unnest insert
-                    dates = chunk["Inserted_date"].tolist() if "Inserted_date" in chunk.columns else [None] * len(chunk)
-                    keys  = chunk[key_col].tolist()
-
-                    with engine.begin() as conn:
-                        result = conn.execute(
-                            text(f"""
-                                INSERT INTO "{TABLE_NAME}" ("Inserted_date", "{key_col}")
-                                SELECT d, u
-                                FROM unnest(
-                                    CAST(:dates AS date[]),
-                                    CAST(:keys  AS text[])
-                                ) AS t(d, u)
-                                ON CONFLICT DO NOTHING
-                            """),
-                            {
-                                "dates": dates,
-                                "keys":  keys
-                            }
-                        )
-
-                        inserted = result.rowcount
-                        skipped  = len(chunk) - inserted
-                        inserted_total += inserted
-                        skipped_total  += skipped
-
-                    # --- Update progress ---
-                    processed = min(i + CHUNK_SIZE, total_rows)
-                    pct       = processed / total_rows
-                    elapsed   = time.time() - start_time
-
-                    progress_bar.progress(pct)
-                    status_text.write(
-                        f"⏳ Processing chunk {i // CHUNK_SIZE + 1} — "
-                        f"{processed:,} / {total_rows:,} rows ({pct*100:.1f}%)"
-                    )
-                    inserted_metric.metric("✅ Inserted", f"{inserted_total:,}")
-                    skipped_metric.metric("⏭️ Skipped (duplicates)", f"{skipped_total:,}")
-                    elapsed_metric.metric("⏱️ Elapsed", f"{elapsed:.1f}s")
+                if restart_journal:
+                    clear_journal(engine, write_kwargs["journal"])
+
+                result = write_chunks(engine, df_clean, TABLE_NAME, key_col,
+                                      chunk_size=CHUNK_SIZE, on_progress=show_progress, **write_kwargs)
+                if result["inserted"] and load_snapshot(TABLE_NAME):
+                    # Catch the key snapshot up so checks can keep answering misses locally
+                    status_text.write("⏳ Updating the local key snapshot...")
+                    try:
+                        refresh_snapshot(TABLE_NAME, key_col)
+                    except Exception as e:
+                        st.warning(f"⚠️ Key snapshot not updated (checks use the database until it is refreshed): {e}")
 
                 # --- Final summary ---
-                elapsed = time.time() - start_time
+                elapsed = result["elapsed"]
                 progress_bar.progress(1.0)
                 status_text.success(f"🎉 Import complete in {elapsed:.1f}s!")
 
                 st.divider()
                 col_a, col_b, col_c = st.columns(3)
-                col_a.metric("✅ Total Inserted", f"{inserted_total:,}")
-                col_b.metric("⏭️ Total Skipped", f"{skipped_total:,}")
+                col_a.metric("✅ Total Inserted", f"{result['inserted']:,}")
+                col_b.metric("⏭️ Total Skipped", f"{result['skipped']:,}")
                 col_c.metric("⏱️ Total Time", f"{elapsed:.1f}s")
 
             except Exception as e:
@@ -534,14 +405,59 @@ with col2:
     st.header("🔍 Check IDs")
     st.markdown("**Search for IDs in database**")
     
-    check_target = st.selectbox("Select target to check", list(TABLE_OPTIONS.keys()), key="check_target")
-    check_cfg = TABLE_OPTIONS[check_target]
+    check_target = st.selectbox("Select target to check", list(TABLE_OPTIONS.keys()) + [MIXED_TARGET], key="check_target")
+    mixed_check = check_target == MIXED_TARGET
+    check_labels = list(TABLE_OPTIONS.keys()) if mixed_check else [check_target]
+    check_cfg = TABLE_OPTIONS[check_labels[0]]
     CHECK_TABLE = check_cfg["table_name"]
     SEARCH_COLUMN = check_cfg["conflict_col"]
     
-    st.markdown(f"**Searching in:** `{CHECK_TABLE}`")
+    if mixed_check:
+        st.markdown("**Searching in:** " + ", ".join(f"`{TABLE_OPTIONS[l]['table_name']}`" for l in check_labels)
+                    + " (IDs with `@` → UPI, digits → bank account, others → both)")
+    else:
+        st.markdown(f"**Searching in:** `{CHECK_TABLE}`")
     
-    check_method = st.radio("Check method", ["Single/Multiple IDs", "Batch Upload"], horizontal=True)
+    # --- Local key snapshot: answers misses without a DB round-trip while current ---
+    check_snapshots = {l: load_snapshot(TABLE_OPTIONS[l]["table_name"]) for l in check_labels}
+    check_snapshots = {l: snap for l, snap in check_snapshots.items() if snap}
+    col_snap, col_refresh = st.columns([3, 1])
+    with col_snap:
+        if check_snapshots:
+            use_snapshot = st.checkbox(
+                "Use local key snapshot (" + "; ".join(
+                    f"{snap['count']:,} keys up to {snap['watermark']}" for snap in check_snapshots.values()
+                ) + ")",
+                value=False, key="check_use_snapshot"
+            )
+            # One version read per table, and only when the snapshot is used
+            stale = [l for l, snap in check_snapshots.items() if not is_current(snap)] if use_snapshot else []
+            if stale:
+                st.caption(f"⚠️ Snapshot out of date for {', '.join(stale)}: checked in the database until refreshed.")
+        else:
+            use_snapshot = False
+            st.caption("No local key snapshot for this table yet.")
+    with col_refresh:
+        if st.button("🔄 Refresh snapshot", use_container_width=True):
+            with st.spinner("Refreshing key snapshot..."):
+                try:
+                    for l in check_labels:
+                        refresh_snapshot(TABLE_OPTIONS[l]["table_name"], TABLE_OPTIONS[l]["conflict_col"])
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"Snapshot refresh failed: {e}")
+    snapshot_args = check_snapshots if use_snapshot else {}
+    
+    def run_check(ids):
+        if mixed_check:
+            return check_ids_mixed(ids, on_warning=st.warning, snapshots=snapshot_args)
+        return check_ids_batch(ids, CHECK_TABLE, SEARCH_COLUMN, on_warning=st.warning,
+                               snapshot=snapshot_args.get(check_target))
+    
+    check_methods = ["Single/Multiple IDs", "Batch Upload"]
+    if check_target == "UPI":
+        check_methods.append("Handle / PSP search")
+    check_method = st.radio("Check method", check_methods, horizontal=True)
     
     if check_method == "Single/Multiple IDs":
         st.markdown("**Enter IDs (one per line or comma-separated)**")
@@ -558,31 +474,60 @@ with col2:
             
             st.info(f"📊 Found {len(ids_list)} ID(s) to check")
             
+            results_key = f"check_results_single_{check_target}"
             if st.button("🔎 Search All", use_container_width=True, type="primary"):
                 with st.spinner("Searching..."):
-                    results_df = check_ids_batch(ids_list, CHECK_TABLE, SEARCH_COLUMN)
-                    
-                    # Show summary
-                    col_exists, col_not_exists = st.columns(2)
-                    with col_exists:
-                        exists_count = (results_df["Exists"] == "✅ Yes").sum()
-                        st.metric("Found", exists_count, f"{(exists_count/len(results_df)*100):.1f}%")
-                    with col_not_exists:
-                        not_exists_count = (results_df["Exists"] == "❌ No").sum()
-                        st.metric("Not Found", not_exists_count, f"{(not_exists_count/len(results_df)*100):.1f}%")
-                    
-                    # Show results table
-                    st.dataframe(results_df, use_container_width=True, height=300)
-                    
-                    # Download option
-                    csv = results_df.to_csv(index=False)
-                    st.download_button(
-                        label="📥 Download Results",
-                        data=csv,
-                        file_name=f"check_results_{check_target.lower().replace(' ', '_')}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                        mime="text/csv",
-                        use_container_width=True
-                    )
+                    store_results(results_key, run_check(ids_list))
+            
+            if results_key in st.session_state:
+                show_check_results(st.session_state[results_key], results_key,
+                                   f"check_results_{check_target.lower().replace(' ', '_')}", height=300)
+    
+    elif check_method == "Handle / PSP search":
+        st.markdown("**Find VPAs with the same handle under any PSP** (e.g. `name` finds `name@ybl`, `name@okaxis`)")
+        handle_input = st.text_area("Enter handles or VPAs (one per line or comma-separated)",
+                                    placeholder="name\nname@ybl", height=100, key="handle_input")
+        handle_prefix = st.checkbox("Prefix match (handles starting with the text)", value=False, key="handle_prefix")
+        
+        try:
+            conn = get_db_connection()
+            cur = conn.cursor()
+            index_ready = handle_index_ready(cur)
+            cur.close()
+            conn.close()
+        except Exception as e:
+            st.error(f"❌ Could not check the handle index: {e}")
+            st.stop()
+        
+        if not index_ready:
+            st.warning(f"⚠️ The handle index on `{CHECK_TABLE}` is not ready; run `python migrations.py` "
+                       f"(it is built concurrently, without blocking imports).")
+            st.stop()
+        
+        if handle_input:
+            handles = [h.strip() for h in handle_input.replace(",", "\n").split("\n") if h.strip()]
+            st.info(f"📊 Found {len(handles)} handle(s) to search")
+            
+            if st.button("🔎 Search Handles", use_container_width=True, type="primary"):
+                with st.spinner("Searching handles..."):
+                    try:
+                        conn = get_db_connection()
+                        cur = conn.cursor()
+                        matches = find_by_handles(cur, handles, prefix=handle_prefix)
+                        cur.close()
+                        conn.close()
+                    except Exception as e:
+                        st.error(f"❌ Handle search failed: {e}")
+                        st.stop()
+                
+                st.metric("Matching VPAs", f"{len(matches):,}")
+                if len(matches):
+                    per_query = matches.groupby("Query").agg(VPAs=("Upi_vpa", "count"), PSPs=("PSP", "nunique"))
+                    if (per_query["VPAs"] >= HANDLE_MATCH_LIMIT).any():
+                        st.caption(f"Showing at most {HANDLE_MATCH_LIMIT:,} matches per handle.")
+                    st.dataframe(per_query, use_container_width=True)
+                    matches["First Seen"] = matches["First Seen"].dt.date
+                    st.dataframe(matches, use_container_width=True, height=400, hide_index=True)
     
     else:
         batch_file = st.file_uploader("Upload CSV with IDs to check", type=["csv", "txt"], key="check_file")
@@ -595,39 +540,33 @@ with col2:
                 st.error(f"Could not read CSV: {e}")
                 st.stop()
             
-            found_cols_map, _ = find_required_columns(batch_df.columns.tolist(), [SEARCH_COLUMN])
+            search_columns = [TABLE_OPTIONS[l]["conflict_col"] for l in check_labels]
+            if mixed_check:
+                # Exact (normalized) header matches only: every matched column is read
+                header_map = map_columns(batch_df.columns.tolist())
+                found_cols_map = {c: header_map[normalize_colname(c)] for c in search_columns
+                                  if normalize_colname(c) in header_map}
+            else:
+                found_cols_map, _ = find_required_columns(batch_df.columns.tolist(), search_columns)
             
-            if SEARCH_COLUMN not in found_cols_map:
-                id_column = batch_df.columns[0]
-                st.warning(f"⚠️ Column '{SEARCH_COLUMN}' not found. Using first column '{id_column}' as ID column")
+            if not found_cols_map:
+                id_columns = [batch_df.columns[0]]
+                st.warning(f"⚠️ Column '{' / '.join(search_columns)}' not found. Using first column '{id_columns[0]}' as ID column")
             else:
-                id_column = found_cols_map[SEARCH_COLUMN]
-                st.info(f"✅ Using column '{id_column}' for IDs")
+                id_columns = list(dict.fromkeys(found_cols_map.values()))
+                st.info(f"✅ Using column(s) {', '.join(repr(c) for c in id_columns)} for IDs")
             
-            batch_ids = batch_df[id_column].astype(str).str.strip().tolist()
-            batch_ids = [id for id in batch_ids if id]  # Remove empty strings
+            # With both key columns (mixed check), the IDs of every column are checked
+            id_values = pd.concat([batch_df[c].dropna().astype(str).str.strip() for c in id_columns])
+            batch_ids = [id for id in id_values.tolist() if id]  # Remove empty strings
             
             st.info(f"📊 Found {len(batch_ids)} IDs to check")
             
+            results_key = f"check_results_batch_{check_target}"
             if st.button("🔎 Check All", use_container_width=True, type="primary"):
                 with st.spinner("Checking all IDs..."):
-                    results_df = check_ids_batch(batch_ids, CHECK_TABLE, SEARCH_COLUMN)
-                    
-                    col_exists, col_not_exists = st.columns(2)
-                    with col_exists:
-                        exists_count = (results_df["Exists"] == "✅ Yes").sum()
-                        st.metric("Found", exists_count, f"{(exists_count/len(results_df)*100):.1f}%")
-                    with col_not_exists:
-                        not_exists_count = (results_df["Exists"] == "❌ No").sum()
-                        st.metric("Not Found", not_exists_count, f"{(not_exists_count/len(results_df)*100):.1f}%")
-                    
-                    st.dataframe(results_df, use_container_width=True, height=400)
-                    
-                    csv = results_df.to_csv(index=False)
-                    st.download_button(
-                        label="📥 Download Results",
-                        data=csv,
-                        file_name=f"check_results_{check_target.lower().replace(' ', '_')}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                        mime="text/csv",
-                        use_container_width=True
-                    )
\ No newline at end of file
+                    store_results(results_key, run_check(batch_ids))
+            
+            if results_key in st.session_state:
+                show_check_results(st.session_state[results_key], results_key,
+                                   f"check_results_{check_target.lower().replace(' ', '_')}")
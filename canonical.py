@@ -0,0 +1,66 @@
+import pandas as pd
+
+
+# ================= HELPERS =================
+def _on_uniques(values, transform) -> pd.Series:
+    """Apply a vectorized string transform once per distinct value.
+
+    Exports repeat the same keys many times, so the values are factorized and
+    only the uniques are transformed. Missing values come back as None.
+    """
+    s = values if isinstance(values, pd.Series) else pd.Series(values, dtype=object)
+    codes, uniques = pd.factorize(s)
+    cleaned = transform(pd.Series(uniques, dtype=object).astype(str)).to_numpy(dtype=object)
+    out = cleaned.take(codes) if len(cleaned) else codes.astype(object)
+    out[codes == -1] = None
+    return pd.Series(out, index=s.index, name=s.name, dtype=object)
+
+
+# ================= CANONICAL FORMS =================
+def canonical_vpa(values) -> pd.Series:
+    """UPI VPA / free-text key: trimmed, lowercased, spaces removed"""
+    return _on_uniques(values, lambda s: s.str.strip().str.lower().str.replace(" ", "", regex=False))
+
+
+def canonical_bank(values) -> pd.Series:
+    """Bank account number: trimmed (leading zeros and case are significant)"""
+    return _on_uniques(values, lambda s: s.str.strip())
+
+
+def canonical_loose(values) -> pd.Series:
+    """Report matching form: VPA rules plus dots and commas removed"""
+    return _on_uniques(
+        values,
+        lambda s: s.str.strip().str.lower().str.replace(r"[ .,]", "", regex=True)
+    )
+
+
+# Key column -> canonical form used when importing and checking it
+CANONICAL_BY_COLUMN = {
+    "Upi_vpa": canonical_vpa,
+    "Bank_account_number": canonical_bank,
+}
+
+
+def canonicalize(values, key_col) -> pd.Series:
+    """Canonical form of `values` for key column `key_col` (trim only for unknown columns)"""
+    return CANONICAL_BY_COLUMN.get(key_col, canonical_bank)(values)
+
+
+# Key column -> forms keys were stored in before the canonical forms above:
+# the old import.py only trimmed VPAs, the app trimmed and lowercased them
+LEGACY_FORMS_BY_COLUMN = {
+    "Upi_vpa": [
+        lambda s: s.str.strip(),
+        lambda s: s.str.strip().str.lower(),
+    ],
+}
+
+
+def legacy_forms(values, key_col) -> list:
+    """Older stored forms of `values` (one Series each) still tried by lookups.
+
+    Rows written before canonicalization keep those forms until the stored
+    keys are normalized, so exact-form inputs must still find them.
+    """
+    return [_on_uniques(values, form) for form in LEGACY_FORMS_BY_COLUMN.get(key_col, [])]
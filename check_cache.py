@@ -0,0 +1,104 @@
+import os
+import sqlite3
+import threading
+import time
+
+# ================= CONFIG =================
+CACHE_PATH = os.getenv("CHECK_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".check_cache.sqlite3"))
+# Seconds a cached answer is trusted
+CACHE_TTL = int(os.getenv("CHECK_CACHE_TTL", str(6 * 3600)))
+# Oldest entries are evicted above this many rows
+CACHE_MAX_ROWS = int(os.getenv("CHECK_CACHE_MAX_ROWS", "1000000"))
+# Bound on "?" placeholders per statement (SQLite's default limit is 999)
+SQLITE_VARS = 900
+
+_local = threading.local()
+
+
+# ================= CONNECTION =================
+def _get_conn():
+    """One SQLite connection per thread; WAL lets several server processes read while one writes"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(CACHE_PATH, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        columns = [r[1] for r in conn.execute("PRAGMA table_info(check_cache)")]
+        if columns and "version" not in columns:
+            # Unversioned answers from an older release cannot be trusted
+            conn.execute("DROP TABLE check_cache")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS check_cache (
+                table_name TEXT    NOT NULL,
+                id         TEXT    NOT NULL,
+                found      INTEGER NOT NULL,
+                first_seen TEXT,
+                checked_at REAL    NOT NULL,
+                version    INTEGER NOT NULL,
+                PRIMARY KEY (table_name, id)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS check_cache_checked_at ON check_cache (checked_at)")
+        _local.conn = conn
+    return conn
+
+
+# ================= CACHE =================
+# Every answer is stored with the table version (key_table_changes, see
+# table_stats.py) read before its lookup, and only reused while the table is
+# still at that version. Any insert, upsert or delete, by any writer or by
+# hand, bumps the version, so no write path has to invalidate the cache.
+
+def cache_get(table_name, ids, version) -> dict:
+    """Return {id: (found, first_seen)} for ids answered at table `version` (None: no hits)"""
+    hits = {}
+    if version is None:
+        return hits
+    try:
+        conn = _get_conn()
+        cutoff = time.time() - CACHE_TTL
+        for i in range(0, len(ids), SQLITE_VARS):
+            part = ids[i:i + SQLITE_VARS]
+            rows = conn.execute(
+                f"SELECT id, found, first_seen FROM check_cache "
+                f"WHERE table_name = ? AND version = ? AND checked_at >= ? AND id IN ({','.join('?' * len(part))})",
+                [table_name, version, cutoff, *part]
+            ).fetchall()
+            hits.update((r[0], (bool(r[1]), r[2])) for r in rows)
+    except sqlite3.Error:
+        return {}
+    return hits
+
+
+def cache_put(table_name, ids, found, version):
+    """Store answers for `ids` looked up at table `version`; `found` maps the ids that exist to their first-seen date.
+
+    `version` must be read before the lookup: a write committing in between
+    then leaves the answers at an older version, where they are never reused.
+    """
+    if version is None:
+        return
+    now = time.time()
+    rows = [
+        (table_name, id_val, id_val in found, str(found[id_val]) if found.get(id_val) else None, now, version)
+        for id_val in ids
+    ]
+    try:
+        conn = _get_conn()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany("INSERT OR REPLACE INTO check_cache VALUES (?, ?, ?, ?, ?, ?)", rows)
+        conn.execute("DELETE FROM check_cache WHERE checked_at < ? OR (table_name = ? AND version < ?)",
+                     (now - CACHE_TTL, table_name, version))
+        excess = conn.execute("SELECT COUNT(*) FROM check_cache").fetchone()[0] - CACHE_MAX_ROWS
+        if excess > 0:
+            conn.execute("""
+                DELETE FROM check_cache WHERE (table_name, id) IN (
+                    SELECT table_name, id FROM check_cache ORDER BY checked_at LIMIT ?
+                )
+            """, (excess,))
+        conn.execute("COMMIT")
+    except sqlite3.Error:
+        try:
+            conn.execute("ROLLBACK")
+        except Exception:
+            pass
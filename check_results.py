@@ -0,0 +1,112 @@
+import datetime
+import gzip
+import io
+
+import pandas as pd
+import streamlit as st
+
+# ================= CONFIG =================
+RESULTS_PAGE_SIZE = 500
+# Rows encoded per step of the gzip CSV export
+EXPORT_CHUNK_ROWS = 100_000
+
+EXPORT_FORMATS = {
+    "CSV (gzip)": {"ext": "csv.gz", "mime": "application/gzip"},
+    "Parquet": {"ext": "parquet", "mime": "application/octet-stream"},
+}
+
+
+# ================= EXPORT =================
+def to_csv_gzip(results, chunk_rows=EXPORT_CHUNK_ROWS) -> bytes:
+    """Gzip CSV of the results, encoded chunk by chunk.
+
+    Only one chunk of CSV text exists at a time; what is kept is the
+    compressed output.
+    """
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode="wb", compresslevel=6) as gz:
+        for i in range(0, max(len(results), 1), chunk_rows):
+            chunk = results.iloc[i:i + chunk_rows]
+            gz.write(chunk.to_csv(index=False, header=(i == 0)).encode("utf-8"))
+    return buf.getvalue()
+
+
+def to_parquet_bytes(results) -> bytes:
+    buf = io.BytesIO()
+    results.to_parquet(buf, index=False)
+    return buf.getvalue()
+
+
+def export_results(results, fmt) -> bytes:
+    if fmt == "Parquet":
+        return to_parquet_bytes(results)
+    return to_csv_gzip(results)
+
+
+# ================= DISPLAY =================
+def display_page(results, page, page_size=RESULTS_PAGE_SIZE) -> pd.DataFrame:
+    """Format one page of compact results for display (emoji only on shown rows)"""
+    start = (page - 1) * page_size
+    view = results.iloc[start:start + page_size].copy()
+    view["Exists"] = view["Exists"].map({True: "✅ Yes", False: "❌ No"})
+    view["First Seen"] = view["First Seen"].dt.date
+    if view["Error"].isna().all():
+        view = view.drop(columns=["Error"])
+    return view
+
+
+def show_check_results(results, key, file_stem, height=400):
+    """Summary metrics, paged results table and on-demand compressed export"""
+    total = len(results)
+    if total == 0:
+        st.info("No IDs were checked.")
+        return
+
+    exists_count = int(results["Exists"].sum())
+    error_count = int((results["Status"] == "Error").sum())
+    col_exists, col_not_exists = st.columns(2)
+    with col_exists:
+        st.metric("Found", exists_count, f"{(exists_count/total*100):.1f}%")
+    with col_not_exists:
+        not_exists_count = total - exists_count - error_count
+        st.metric("Not Found", not_exists_count, f"{(not_exists_count/total*100):.1f}%")
+    if error_count:
+        st.warning(f"⚠️ {error_count:,} ID(s) could not be checked (see the Error column).")
+
+    total_pages = -(-total // RESULTS_PAGE_SIZE)
+    page = 1
+    if total_pages > 1:
+        page = st.number_input(f"Page (of {total_pages:,})", min_value=1, max_value=total_pages,
+                               step=1, key=f"{key}_page")
+        start = (page - 1) * RESULTS_PAGE_SIZE
+        st.caption(f"Rows {start + 1:,}–{min(start + RESULTS_PAGE_SIZE, total):,} of {total:,}")
+    st.dataframe(display_page(results, page), use_container_width=True, height=height)
+
+    # Export is built only when asked for, not on every rerun
+    col_fmt, col_prepare = st.columns([2, 1])
+    with col_fmt:
+        fmt = st.selectbox("Download format", list(EXPORT_FORMATS.keys()), key=f"{key}_format",
+                           label_visibility="collapsed")
+    with col_prepare:
+        if st.button("📦 Prepare download", use_container_width=True, key=f"{key}_prepare"):
+            with st.spinner("Compressing results..."):
+                st.session_state[f"{key}_export"] = (fmt, export_results(results, fmt))
+
+    prepared = st.session_state.get(f"{key}_export")
+    if prepared and prepared[0] == fmt:
+        spec = EXPORT_FORMATS[fmt]
+        st.download_button(
+            label=f"📥 Download Results ({len(prepared[1]) / 1024 / 1024:.1f} MB)",
+            data=prepared[1],
+            file_name=f"{file_stem}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.{spec['ext']}",
+            mime=spec["mime"],
+            use_container_width=True,
+            key=f"{key}_download"
+        )
+
+
+def store_results(key, results):
+    """Keep a check's results across reruns (paging, export) and drop any stale export"""
+    st.session_state[key] = results
+    st.session_state.pop(f"{key}_export", None)
+    st.session_state[f"{key}_page"] = 1
@@ -0,0 +1,370 @@
+import contextvars
+import io
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from canonical import canonical_vpa, canonicalize, legacy_forms
+from check_cache import cache_get, cache_put
+from db import get_db_connection
+from key_snapshot import contains, is_current
+from pipeline import TABLE_OPTIONS
+from sql_log import sql_label
+from table_stats import read_table_version
+
+# ================= CONFIG =================
+# IDs sent per "= ANY(array)" statement; bounds statement size
+CHECK_CHUNK_SIZE = 10_000
+# Above this many distinct IDs, COPY them into a temp table and join instead
+TEMP_TABLE_THRESHOLD = 200_000
+# Connections the fallback may open if the previous one is lost mid-bisect
+FALLBACK_CONNECT_ATTEMPTS = 2
+# Categories of the "Status" column in check results
+RESULT_STATUSES = ["Found", "Not Found", "Error"]
+# classify_ids label for IDs that look like neither a VPA nor an account number
+UNKNOWN_TYPE = "Unknown"
+
+# VPA handle (part before "@") expression index for handle / prefix lookups (built by migrations.py)
+HANDLE_TABLE = "all_upiiD"
+HANDLE_INDEX = "all_upiiD_handle_idx"
+HANDLE_EXPR = 'split_part("Upi_vpa", \'@\', 1)'
+# Matches returned per queried handle or prefix
+HANDLE_MATCH_LIMIT = 1_000
+
+
+# ================= LOOKUPS =================
+def find_existing_ids(cur, ids, table_name, search_column, chunk_size=CHECK_CHUNK_SIZE):
+    """Return {id: Inserted_date} for the `ids` present in the table, one array parameter per chunk"""
+    found = {}
+    query = f'SELECT "{search_column}", "Inserted_date" FROM "{table_name}" WHERE "{search_column}" = ANY(%s::text[])'
+    for i in range(0, len(ids), chunk_size):
+        cur.execute(query, (ids[i:i + chunk_size],))
+        found.update(cur.fetchall())
+    return found
+
+
+def find_existing_ids_temp(cur, ids, table_name, search_column):
+    """Return {id: Inserted_date} for the `ids` present in the table via COPY into a temp table + join"""
+    cur.execute('CREATE TEMP TABLE "_check_ids" ("id" text) ON COMMIT DROP')
+    buf = io.StringIO("".join(f"{i}\n" for i in ids))
+    cur.copy_expert('COPY "_check_ids" ("id") FROM STDIN WITH (FORMAT text)', buf)
+    cur.execute(f'''
+        SELECT t."{search_column}", t."Inserted_date"
+        FROM "{table_name}" t
+        JOIN (SELECT DISTINCT "id" FROM "_check_ids") c ON t."{search_column}" = c."id"
+    ''')
+    return dict(cur.fetchall())
+
+
+def fetch_records(conn, ids, table_name, search_column, chunk_size=CHECK_CHUNK_SIZE) -> pd.DataFrame:
+    """Return the full table rows of `ids`, one array-parameter query per chunk.
+
+    `conn` is a DB-API connection (e.g. engine.raw_connection() from a pool);
+    it is only read from and left open. IDs are matched in canonical form
+    (or a legacy stored form, see canonical.py) and rows come back in input
+    order.
+    """
+    forms = [canonicalize(ids, search_column)] + legacy_forms(ids, search_column)
+    # Input-major order: each ID's canonical form, then its legacy forms
+    keys = [k for k in dict.fromkeys(itertools.chain.from_iterable(zip(*forms))) if k]
+    query = f'SELECT * FROM "{table_name}" WHERE "{search_column}" = ANY(%s::text[])'
+    rows, columns = [], []
+    cur = conn.cursor()
+    try:
+        for i in range(0, len(keys), chunk_size):
+            cur.execute(query, (keys[i:i + chunk_size],))
+            columns = [d[0] for d in cur.description]
+            rows.extend(cur.fetchall())
+    finally:
+        cur.close()
+        conn.rollback()
+
+    records = pd.DataFrame(rows, columns=columns)
+    if len(records):
+        order = {k: n for n, k in enumerate(keys)}
+        records = records.sort_values(search_column, key=lambda col: col.map(order), kind="stable")
+        records = records.reset_index(drop=True)
+    return records
+
+
+def _copy_safe(ids):
+    """COPY text format treats backslash, tab and newlines specially"""
+    return not any(("\\" in i) or ("\t" in i) or ("\n" in i) or ("\r" in i) for i in ids)
+
+
+# ================= CHECK FUNCTIONS =================
+def bisect_existing_ids(conn, ids, table_name, search_column, errors):
+    """Fallback lookup: retry a failed batch in halves on the same connection.
+
+    A half that succeeds is answered; a half that fails is split again, so
+    only the IDs that fail on their own end up in `errors` ({id: message}).
+    Costs O(k log n) extra queries for k bad IDs instead of one connection
+    per ID. Raises if the connection itself is lost.
+    """
+    try:
+        cur = conn.cursor()
+        try:
+            return find_existing_ids(cur, ids, table_name, search_column)
+        finally:
+            cur.close()
+    except Exception as e:
+        if conn.closed:
+            raise
+        conn.rollback()
+        if len(ids) == 1:
+            errors[ids[0]] = str(e)
+            return {}
+        mid = len(ids) // 2
+        found = bisect_existing_ids(conn, ids[:mid], table_name, search_column, errors)
+        found.update(bisect_existing_ids(conn, ids[mid:], table_name, search_column, errors))
+        return found
+
+
+def _fallback_lookup(ids, table_name, search_column, errors):
+    """Bisecting fallback over one connection, reconnecting once if it is lost"""
+    for attempt in range(FALLBACK_CONNECT_ATTEMPTS):
+        conn = None
+        try:
+            conn = get_db_connection()
+            found = bisect_existing_ids(conn, ids, table_name, search_column, errors)
+            conn.rollback()
+            return found
+        except Exception as e:
+            errors.clear()
+            last_error = str(e)
+        finally:
+            if conn:
+                try:
+                    conn.close()
+                except:
+                    pass
+    errors.update((id_val, last_error) for id_val in ids)
+    return {}
+
+
+@sql_label("check_ids_batch")
+def check_ids_batch(ids_list: list, table_name: str, search_column: str,
+                    on_warning=None, snapshot=None, use_cache=True) -> pd.DataFrame:
+    """Check multiple IDs in batch.
+
+    Distinct IDs are sent as bounded "= ANY(array)" chunks, or COPYed into a
+    temp table and joined when there are very many. Answers from the shared
+    check cache (see check_cache.py) are reused while the table is at the
+    version they were looked up at, and new database answers are stored
+    there. With a key snapshot (see key_snapshot.py) that is still current,
+    IDs whose hash is not in it are answered locally and only hash hits are
+    confirmed in the database. If the batch query fails, it is retried in
+    halves (see bisect_existing_ids) and only IDs that fail on their own are
+    reported with their error. IDs are looked up in their canonical form
+    and in the legacy forms older rows may still be stored in (see
+    canonical.py).
+
+    Returns one row per input ID as given, in input order (duplicates
+    included): ID, Exists (bool), Status (categorical Found / Not Found /
+    Error), First Seen (datetime) and Error (message or None).
+    """
+    keys = canonicalize(ids_list, search_column).fillna("").tolist()
+    forms = [pd.Series(keys, dtype=object)] + [f.fillna("") for f in legacy_forms(ids_list, search_column)]
+    # Every stored form is looked up (and cached) as an exact string
+    unique_ids = [k for k in dict.fromkeys(itertools.chain.from_iterable(forms)) if k]
+    
+    # Read before the lookup, so cached answers are tagged with a version they were valid at
+    version = read_table_version(table_name) if unique_ids and (use_cache or snapshot is not None) else None
+    
+    found_ids = {}
+    if use_cache and unique_ids:
+        cached = cache_get(table_name, unique_ids, version)
+        found_ids = {id_val: first_seen for id_val, (found, first_seen) in cached.items() if found}
+        unique_ids = [id_val for id_val in unique_ids if id_val not in cached]
+    
+    if snapshot is not None and unique_ids and is_current(snapshot, version):
+        maybe = contains(snapshot, unique_ids)
+        unique_ids = [id_val for id_val, hit in zip(unique_ids, maybe) if hit]
+    
+    errors = {}
+    if unique_ids:
+        conn = None
+        try:
+            conn = get_db_connection()
+            cur = conn.cursor()
+            
+            if len(unique_ids) > TEMP_TABLE_THRESHOLD and _copy_safe(unique_ids):
+                db_found = find_existing_ids_temp(cur, unique_ids, table_name, search_column)
+            else:
+                db_found = find_existing_ids(cur, unique_ids, table_name, search_column)
+            
+            conn.rollback()
+            cur.close()
+        except Exception as e:
+            if on_warning:
+                on_warning(f"Batch check failed: {e}. Retrying in smaller batches to isolate failing IDs...")
+            db_found = _fallback_lookup(unique_ids, table_name, search_column, errors)
+        finally:
+            if conn:
+                try:
+                    conn.close()
+                except:
+                    pass
+        
+        found_ids.update(db_found)
+        if use_cache:
+            cache_put(table_name, [k for k in unique_ids if k not in errors], db_found, version)
+    
+    # Build results: compact columns, one row per input ID (found under any of its forms)
+    exists = np.logical_or.reduce([f.isin(found_ids.keys()).to_numpy() for f in forms])
+    errored = np.logical_or.reduce([f.isin(errors.keys()).to_numpy() for f in forms]) & ~exists
+    status = np.where(errored, "Error", np.where(exists, "Found", "Not Found"))
+    first_seen = pd.concat([pd.to_datetime(f.map(found_ids), errors="coerce") for f in forms], axis=1).min(axis=1)
+    error = forms[0].map(errors)
+    for f in forms[1:]:
+        error = error.fillna(f.map(errors))
+    return pd.DataFrame({
+        "ID": pd.Series(ids_list, dtype=object),
+        "Exists": exists,
+        "Status": pd.Categorical(status, categories=RESULT_STATUSES),
+        "First Seen": first_seen,
+        "Error": error.where(errored, None) if errors else pd.Series(None, index=forms[0].index, dtype=object),
+    })
+
+
+# ================= MIXED CHECKS =================
+def strip_account_separators(ids) -> pd.Series:
+    """Account numbers typed as "123-45" / "123 45" in their stored form "12345" """
+    return pd.Series(ids, dtype=object).str.replace(r"[\s-]", "", regex=True)
+
+
+def classify_ids(ids) -> np.ndarray:
+    """TABLE_OPTIONS label per ID: "@" -> UPI, digits -> Bank Account, else UNKNOWN_TYPE"""
+    s = pd.Series(ids, dtype=object).fillna("").astype(str).str.strip()
+    digits = strip_account_separators(s).str.fullmatch(r"\d+")
+    return np.where(s.str.contains("@", regex=False), "UPI",
+                    np.where(digits, "Bank Account", UNKNOWN_TYPE))
+
+
+def check_ids_mixed(ids_list: list, on_warning=None, snapshots=None, use_cache=True) -> pd.DataFrame:
+    """Check a mixed list of VPAs and account numbers against both tables at once.
+
+    Each ID is routed by classify_ids; IDs of unknown type are checked in
+    both tables. The per-table checks (one check_ids_batch each) run
+    concurrently and are merged back in input order, with a "Type" column
+    and the "Table" the ID was found in. `snapshots` maps TABLE_OPTIONS
+    labels to key snapshots. Warnings are collected from the worker threads
+    and passed to `on_warning` afterwards.
+    """
+    kinds = classify_ids(ids_list)
+    snapshots = snapshots or {}
+    warnings = []
+
+    with ThreadPoolExecutor(max_workers=len(TABLE_OPTIONS)) as pool:
+        futures = {}
+        for label, cfg in TABLE_OPTIONS.items():
+            positions = np.flatnonzero((kinds == label) | (kinds == UNKNOWN_TYPE))
+            if len(positions):
+                ids = pd.Series([ids_list[i] for i in positions], dtype=object)
+                if label == "Bank Account":
+                    # The separators classify_ids allowed are not part of the stored number
+                    ids = ids.where(kinds[positions] != label, strip_account_separators(ids))
+                # Each worker runs in a copy of this context, so its SQL keeps the session tag
+                futures[label] = (positions, pool.submit(
+                    contextvars.copy_context().run, check_ids_batch, ids.tolist(), cfg["table_name"], cfg["conflict_col"],
+                    warnings.append, snapshots.get(label), use_cache
+                ))
+        partial = {label: (positions, future.result()) for label, (positions, future) in futures.items()}
+
+    if on_warning:
+        for message in warnings:
+            on_warning(message)
+
+    n = len(ids_list)
+    exists = np.zeros(n, dtype=bool)
+    errored = np.zeros(n, dtype=bool)
+    table = np.full(n, None, dtype=object)
+    first_seen = pd.Series(pd.NaT, index=range(n), dtype="datetime64[ns]")
+    error = pd.Series(None, index=range(n), dtype=object)
+    for label, (positions, res) in partial.items():
+        hit = res["Exists"].to_numpy()
+        exists[positions[hit]] = True
+        table[positions[hit]] = TABLE_OPTIONS[label]["table_name"]
+        first_seen.iloc[positions[hit]] = res["First Seen"].to_numpy()[hit]
+        failed = (res["Status"] == "Error").to_numpy()
+        errored[positions[failed]] = True
+        error.iloc[positions[failed]] = res["Error"].to_numpy()[failed]
+
+    errored &= ~exists
+    status = np.where(exists, "Found", np.where(errored, "Error", "Not Found"))
+    return pd.DataFrame({
+        "ID": pd.Series(ids_list, dtype=object),
+        "Type": pd.Categorical(kinds, categories=list(TABLE_OPTIONS) + [UNKNOWN_TYPE]),
+        "Exists": exists,
+        "Status": pd.Categorical(status, categories=RESULT_STATUSES),
+        "Table": pd.Categorical(table, categories=[cfg["table_name"] for cfg in TABLE_OPTIONS.values()]),
+        "First Seen": first_seen,
+        "Error": error.where(errored, None),
+    })
+
+
+# ================= HANDLE LOOKUPS =================
+def _handle_bounds(prefix):
+    """[lo, hi) range covering every string that starts with `prefix`"""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def handle_index_ready(cur):
+    """True when the handle index exists and is valid (a failed CONCURRENTLY build leaves it invalid)"""
+    cur.execute('''
+        SELECT i.indisvalid FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s
+    ''', (HANDLE_INDEX,))
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+@sql_label("handle search")
+def find_by_handles(cur, handles, prefix=False, limit=HANDLE_MATCH_LIMIT) -> pd.DataFrame:
+    """VPAs whose handle (the part before "@") equals, or starts with, each query.
+
+    Queries may be bare handles or full VPAs (the PSP suffix is ignored).
+    Every query is answered from the handle index: equality for exact
+    handles, a [prefix, next-prefix) range for prefixes, at most `limit`
+    rows each.
+    """
+    queries = [q.split("@", 1)[0] for q in canonical_vpa(handles).dropna()]
+    queries = [q for q in dict.fromkeys(queries) if q]
+    columns = ["Query", "Upi_vpa", "Handle", "PSP", "First Seen"]
+    if not queries:
+        return pd.DataFrame(columns=columns)
+
+    if prefix:
+        lows, highs = zip(*(_handle_bounds(q) for q in queries))
+        cur.execute(f'''
+            SELECT q.query, m."Upi_vpa", m."Inserted_date"
+            FROM unnest(%s::text[], %s::text[], %s::text[]) AS q(query, lo, hi)
+            CROSS JOIN LATERAL (
+                SELECT t."Upi_vpa", t."Inserted_date"
+                FROM "{HANDLE_TABLE}" t
+                WHERE {HANDLE_EXPR} ~>=~ q.lo
+                  AND {HANDLE_EXPR} ~<~ q.hi
+                LIMIT %s
+            ) m
+        ''', (queries, list(lows), list(highs), limit))
+    else:
+        cur.execute(f'''
+            SELECT q.query, m."Upi_vpa", m."Inserted_date"
+            FROM unnest(%s::text[]) AS q(query)
+            CROSS JOIN LATERAL (
+                SELECT t."Upi_vpa", t."Inserted_date"
+                FROM "{HANDLE_TABLE}" t
+                WHERE {HANDLE_EXPR} = q.query
+                LIMIT %s
+            ) m
+        ''', (queries, limit))
+
+    matches = pd.DataFrame(cur.fetchall(), columns=["Query", "Upi_vpa", "First Seen"])
+    parts = matches["Upi_vpa"].astype(str).str.partition("@")
+    matches["Handle"] = parts[0]
+    matches["PSP"] = parts[2]
+    matches["First Seen"] = pd.to_datetime(matches["First Seen"], errors="coerce")
+    return matches[columns].sort_values(["Query", "Handle", "PSP"], kind="stable").reset_index(drop=True)
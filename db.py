@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.pool import QueuePool
+
+from sql_log import TimedCursor, note_checkout
+
+# Load environment variables
+load_dotenv()
+
+# Database Configuration from .env
+DB_URL = os.getenv("DB_URL")
+
+# Convert SQLAlchemy format to psycopg2 format if needed
+if DB_URL and 'postgresql+psycopg2://' in DB_URL:
+    DB_URL = DB_URL.replace('postgresql+psycopg2://', 'postgresql://')
+
+# ================= POOL CONFIG =================
+# Connections kept open, plus overflow connections opened under load
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "10"))
+# Seconds to wait for a free connection before failing
+POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Reconnect connections older than this, or idle in the pool longer than this (seconds)
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+POOL_IDLE_RECYCLE = int(os.getenv("DB_POOL_IDLE_RECYCLE", "300"))
+
+CONNECT_ARGS = {
+    "connect_timeout": 10,
+    "keepalives": 1,
+    "keepalives_idle": 30,
+    "keepalives_interval": 10,
+    "keepalives_count": 5,
+    # Every cursor (raw psycopg2 and SQLAlchemy's) records its statements in sql_log
+    "cursor_factory": TimedCursor,
+}
+
+_engine = None
+_engine_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_checkout_stats = {"checkouts": 0, "wait_total": 0.0, "wait_max": 0.0}
+
+
+# ================= POOL =================
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited (incl. opening a connection)"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            note_checkout(waited)
+            with _stats_lock:
+                _checkout_stats["checkouts"] += 1
+                _checkout_stats["wait_total"] += waited
+                _checkout_stats["wait_max"] = max(_checkout_stats["wait_max"], waited)
+
+
+def _on_checkin(dbapi_connection, connection_record):
+    connection_record.info["checked_in_at"] = time.monotonic()
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    # Connections idle past POOL_IDLE_RECYCLE are dropped; the pool retries with a fresh one
+    checked_in_at = connection_record.info.get("checked_in_at")
+    if checked_in_at is not None and time.monotonic() - checked_in_at > POOL_IDLE_RECYCLE:
+        raise exc.DisconnectionError("connection idle too long, recycling")
+
+
+def get_engine(pool_size=None):
+    """The process-wide SQLAlchemy engine; its pool also backs get_db_connection().
+
+    `pool_size` can only raise the pool size, and only before the first call
+    (e.g. import.py sizing the pool for its workers).
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = create_engine(
+                DB_URL,
+                poolclass=TimedQueuePool,
+                pool_size=max(POOL_SIZE, pool_size or 0),
+                max_overflow=POOL_MAX_OVERFLOW,
+                pool_timeout=POOL_TIMEOUT,
+                pool_recycle=POOL_RECYCLE,
+                pool_pre_ping=True,
+                connect_args=CONNECT_ARGS,
+            )
+            event.listen(_engine, "checkin", _on_checkin)
+            event.listen(_engine, "checkout", _on_checkout)
+        return _engine
+
+
+def get_db_connection():
+    """Check out a pooled psycopg2 connection; close() returns it to the pool"""
+    return get_engine().raw_connection()
+
+
+def pool_status():
+    """Pool occupancy and checkout wait statistics"""
+    pool = get_engine().pool
+    with _stats_lock:
+        stats = dict(_checkout_stats)
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "checkouts": stats["checkouts"],
+        "avg_wait_ms": stats["wait_total"] / stats["checkouts"] * 1000 if stats["checkouts"] else 0.0,
+        "max_wait_ms": stats["wait_max"] * 1000,
+    }
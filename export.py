@@ -1,20 +1,10 @@
 import pandas as pd
-import psycopg2
-import os
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+from db import get_db_connection
 
 try:
-    # Get database URL from .env file
-    DB_URL = os.getenv("DB_URL")
-
-    if DB_URL and 'postgresql+psycopg2://' in DB_URL:
-        DB_URL = DB_URL.replace('postgresql+psycopg2://', 'postgresql://')
-    
-    # Connect to database
-    conn = psycopg2.connect(DB_URL)
+    # Pooled connection: the export is timed in the SQL log like every other query
+    conn = get_db_connection()
     
     # Fetch data from table
     df = pd.read_sql_query('SELECT * FROM "all_upiiD"', conn)
@@ -3,27 +3,23 @@ import pandas as pd
 import time
 import re
 import datetime
-import os
-from dotenv import load_dotenv
-import psycopg2
 from psycopg2 import extras, OperationalError, InterfaceError
-
-# Load environment variables
-load_dotenv()
-
-# Database Configuration from .env
-DB_URL = os.getenv("DB_URL")
+from canonical import canonicalize
+from check_results import show_check_results, store_results
+from checks import check_ids_batch, fetch_records
+from db import DB_URL, get_db_connection, get_engine
+from partitioning import ensure_partitions, is_partitioned
 
 if not DB_URL:
     st.error("❌ DB_URL not found in .env file. Please add your database connection string.")
     st.stop()
 
-# Convert SQLAlchemy format to psycopg2 format if needed
-if DB_URL and 'postgresql+psycopg2://' in DB_URL:
-    DB_URL = DB_URL.replace('postgresql+psycopg2://', 'postgresql://')
-
 st.set_page_config(page_title="UPI/Bank Import & Check", layout="wide")
 
+# Rows per page in "Details of Found IDs"
+DETAILS_PAGE_SIZE = 50
+
+
 # Table options and their required columns + conflict column + filter value
 TABLE_OPTIONS = {
     "UPI": {
@@ -40,17 +36,6 @@ TABLE_OPTIONS = {
     }
 }
 
-def get_db_connection():
-    """Create database connection with keepalive settings"""
-    return psycopg2.connect(
-        DB_URL,
-        connect_timeout=10,
-        keepalives=1,
-        keepalives_idle=30,
-        keepalives_interval=10,
-        keepalives_count=5
-    )
-
 def normalize_colname(name: str) -> str:
     return re.sub(r'[^a-z0-9]', '', str(name).lower())
 
@@ -100,6 +85,13 @@ def import_with_retries(records,
     inserted = 0
     errors = []
 
+    # A row cannot move to another month's partition through ON CONFLICT DO UPDATE,
+    # so on partitioned tables existing keys are deleted and re-inserted instead
+    with get_engine().connect() as sa_conn:
+        replace_rows = is_partitioned(sa_conn, table_name)
+    if replace_rows:
+        ensure_partitions(get_engine(), table_name, [row.get("Inserted_date") for row in records])
+
     idx = 0
     while idx < total:
         chunk = records[idx: idx + chunk_size]
@@ -125,11 +117,18 @@ def import_with_retries(records,
                 
                 # Build INSERT query with ON CONFLICT
                 cols_str = ', '.join([f'"{col}"' for col in columns])
+                if replace_rows:
+                    cur.execute(
+                        f'DELETE FROM "{table_name}" WHERE "{on_conflict}" = ANY(%s::text[])',
+                        ([row[on_conflict] for row in chunk],)
+                    )
+                    conflict_clause = "ON CONFLICT DO NOTHING"
+                else:
+                    conflict_clause = f'ON CONFLICT ("{on_conflict}") DO UPDATE SET "Inserted_date" = EXCLUDED."Inserted_date"'
                 insert_query = f"""
                     INSERT INTO "{table_name}" ({cols_str})
                     VALUES %s
-                    ON CONFLICT ("{on_conflict}") DO UPDATE SET
-                    "Inserted_date" = EXCLUDED."Inserted_date"
+                    {conflict_clause}
                 """
                 
                 # Execute batch insert
@@ -185,98 +184,6 @@ def import_with_retries(records,
     return {"inserted": inserted, "errors": errors}
 
 
-# ============================================================================
-# CHECK FUNCTIONS
-# ============================================================================
-
-def check_id_in_db(id_value: str, table_name: str, search_column: str) -> dict:
-    """Check if ID exists in database using direct SQL query"""
-    conn = None
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        
-        query = f'SELECT * FROM "{table_name}" WHERE "{search_column}" = %s LIMIT 1'
-        cur.execute(query, (id_value.strip(),))
-        
-        result = cur.fetchone()
-        
-        cur.close()
-        conn.close()
-        
-        if result:
-            return {
-                "exists": True,
-                "record": dict(result),
-                "error": None
-            }
-        else:
-            return {
-                "exists": False,
-                "record": None,
-                "error": None
-            }
-    except Exception as e:
-        if conn:
-            try:
-                conn.close()
-            except:
-                pass
-        return {
-            "exists": False,
-            "record": None,
-            "error": str(e)
-        }
-
-
-def check_ids_batch(ids_list: list, table_name: str, search_column: str) -> pd.DataFrame:
-    """Check multiple IDs in batch"""
-    results = []
-    
-    # Use batch query for better performance
-    conn = None
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        
-        # Query all IDs at once
-        placeholders = ','.join(['%s'] * len(ids_list))
-        query = f'SELECT "{search_column}" FROM "{table_name}" WHERE "{search_column}" IN ({placeholders})'
-        cur.execute(query, ids_list)
-        
-        found_ids = set(row[search_column] for row in cur.fetchall())
-        
-        cur.close()
-        conn.close()
-        
-        # Build results
-        for id_val in ids_list:
-            exists = id_val in found_ids
-            results.append({
-                "ID": id_val,
-                "Exists": "✅ Yes" if exists else "❌ No",
-                "Status": "Found" if exists else "Not Found"
-            })
-            
-    except Exception as e:
-        if conn:
-            try:
-                conn.close()
-            except:
-                pass
-        # Fallback to individual checks
-        st.warning(f"Batch check failed: {e}. Falling back to individual checks...")
-        for id_val in ids_list:
-            check_result = check_id_in_db(id_val, table_name, search_column)
-            results.append({
-                "ID": id_val,
-                "Exists": "✅ Yes" if check_result["exists"] else "❌ No",
-                "Status": check_result["error"] if check_result["error"] else "Found" if check_result["exists"] else "Not Found"
-            })
-    
-    return pd.DataFrame(results)
-
-
 # ============================================================================
 # MAIN UI: TWO-COLUMN LAYOUT
 # ============================================================================
@@ -348,11 +255,7 @@ with col1:
         
         # Clean data
         df_clean = df_clean.dropna(subset=[key_col])
-        df_clean[key_col] = df_clean[key_col].astype(str).str.strip()
-        
-        # Apply specific transformations based on type
-        if key_col.lower() == "upi_vpa":
-            df_clean[key_col] = df_clean[key_col].str.lower()
+        df_clean[key_col] = canonicalize(df_clean[key_col], key_col)
         
         # Remove empty strings after strip
         df_clean = df_clean[df_clean[key_col] != ""]
@@ -462,40 +365,43 @@ with col2:
             
             st.info(f"📊 Found {len(ids_list)} ID(s) to check")
             
+            results_key = f"extract_results_single_{CHECK_TABLE}"
             if st.button("🔎 Search All", use_container_width=True, type="primary"):
                 with st.spinner("Searching..."):
-                    results_df = check_ids_batch(ids_list, CHECK_TABLE, SEARCH_COLUMN)
-                    
-                    # Show summary
-                    col_exists, col_not_exists = st.columns(2)
-                    with col_exists:
-                        exists_count = (results_df["Exists"] == "✅ Yes").sum()
-                        st.metric("Found", exists_count, f"{(exists_count/len(results_df)*100):.1f}%")
-                    with col_not_exists:
-                        not_exists_count = (results_df["Exists"] == "❌ No").sum()
-                        st.metric("Not Found", not_exists_count, f"{(not_exists_count/len(results_df)*100):.1f}%")
+                    results_df = check_ids_batch(ids_list, CHECK_TABLE, SEARCH_COLUMN, on_warning=st.warning)
                     
-                    # Show results table
-                    st.dataframe(results_df, use_container_width=True, height=300)
-                    
-                    # Show details for found IDs
-                    found_ids = results_df[results_df["Exists"] == "✅ Yes"]["ID"].tolist()
+                    # Fetch details of all found IDs in one query over a pooled connection
+                    found_ids = results_df.loc[results_df["Exists"], "ID"].tolist()
+                    details_df = None
                     if found_ids:
-                        st.subheader("📋 Details of Found IDs")
-                        for id_val in found_ids:
-                            result = check_id_in_db(id_val, CHECK_TABLE, SEARCH_COLUMN)
-                            with st.expander(f"🔍 {id_val}"):
-                                st.json(result["record"])
+                        conn = get_db_connection()
+                        try:
+                            details_df = fetch_records(conn, found_ids, CHECK_TABLE, SEARCH_COLUMN)
+                        except Exception as e:
+                            st.warning(f"Could not load details of found IDs: {e}")
+                        finally:
+                            conn.close()
                     
-                    # Download option
-                    csv = results_df.to_csv(index=False)
-                    st.download_button(
-                        label="📥 Download Results",
-                        data=csv,
-                        file_name=f"check_results_{check_target.lower().replace(' ', '_')}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                        mime="text/csv",
-                        use_container_width=True
-                    )
+                    # Keep results across reruns so they and the details can be paged
+                    store_results(results_key, results_df)
+                    st.session_state["extract_details"] = details_df
+                    st.session_state["extract_details_page"] = 1
+            
+            if results_key in st.session_state:
+                show_check_results(st.session_state[results_key], results_key,
+                                   f"check_results_{check_target.lower().replace(' ', '_')}", height=300)
+                details_df = st.session_state.get("extract_details")
+                
+                # Show details for found IDs, one page at a time
+                if details_df is not None and len(details_df):
+                    st.subheader("📋 Details of Found IDs")
+                    total_pages = -(-len(details_df) // DETAILS_PAGE_SIZE)
+                    page = st.number_input(f"Page (of {total_pages})", min_value=1, max_value=total_pages,
+                                           step=1, key="extract_details_page")
+                    start = (page - 1) * DETAILS_PAGE_SIZE
+                    st.caption(f"Rows {start + 1:,}–{min(start + DETAILS_PAGE_SIZE, len(details_df)):,} of {len(details_df):,}")
+                    st.dataframe(details_df.iloc[start:start + DETAILS_PAGE_SIZE],
+                                 use_container_width=True, hide_index=True)
     
     else:
         batch_file = st.file_uploader("Upload CSV with IDs to check", type=["csv", "txt"], key="check_file")
@@ -522,25 +428,11 @@ with col2:
             
             st.info(f"📊 Found {len(batch_ids)} IDs to check")
             
+            results_key = f"extract_results_batch_{CHECK_TABLE}"
             if st.button("🔎 Check All", use_container_width=True, type="primary"):
                 with st.spinner("Checking all IDs..."):
-                    results_df = check_ids_batch(batch_ids, CHECK_TABLE, SEARCH_COLUMN)
-                    
-                    col_exists, col_not_exists = st.columns(2)
-                    with col_exists:
-                        exists_count = (results_df["Exists"] == "✅ Yes").sum()
-                        st.metric("Found", exists_count, f"{(exists_count/len(results_df)*100):.1f}%")
-                    with col_not_exists:
-                        not_exists_count = (results_df["Exists"] == "❌ No").sum()
-                        st.metric("Not Found", not_exists_count, f"{(not_exists_count/len(results_df)*100):.1f}%")
-                    
-                    st.dataframe(results_df, use_container_width=True, height=400)
-                    
-                    csv = results_df.to_csv(index=False)
-                    st.download_button(
-                        label="📥 Download Results",
-                        data=csv,
-                        file_name=f"check_results_{check_target.lower().replace(' ', '_')}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                        mime="text/csv",
-                        use_container_width=True
-                    )
\ No newline at end of file
+                    store_results(results_key, check_ids_batch(batch_ids, CHECK_TABLE, SEARCH_COLUMN, on_warning=st.warning))
+            
+            if results_key in st.session_state:
+                show_check_results(st.session_state[results_key], results_key,
+                                   f"check_results_{check_target.lower().replace(' ', '_')}")
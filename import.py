@@ -1,111 +1,281 @@
+import argparse
+import datetime
+import hashlib
 import os
+import queue
 import sys
+import threading
 import time
-import pandas as pd
-from sqlalchemy import create_engine, text
-from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# ================= LOAD ENV =================
-load_dotenv()
+from db import DB_URL, get_engine
+from import_journal import journal_key
+from key_snapshot import load_snapshot, refresh_snapshot
+from ingest import CHUNK_SIZE, DEFAULT_WORKERS, copy_staged_insert, insert_chunks_unnest, parallel_insert_chunks
+from migrations import IMPORT_MIGRATIONS, SchemaError, require_schema
+from pipeline import TABLE_OPTIONS, add_stats, clean_import_frame, iter_import_batches, read_import_upload
 
-DB_URL = os.getenv("DB_URL")
+# ================= LOAD ENV =================
 if not DB_URL:
     print("Error: DB_URL not found in .env file.")
     sys.exit(1)
 
 # ================= CONFIG =================
-EXCEL_FILE = "data.xlsx"
-TABLE_NAME = "all_upiiD"
-CHUNK_SIZE = 10_000
+# CLI name -> writer, same writers as the Streamlit "Import mode" selector
+WRITERS = {
+    "unnest": insert_chunks_unnest,
+    "copy": copy_staged_insert,
+    "parallel": parallel_insert_chunks,
+}
 
-# ================= MAIN =================
-def main():
-    start = time.time()
+# CLI name -> TABLE_OPTIONS label
+TARGETS = {
+    "upi": "UPI",
+    "bank": "Bank Account",
+}
 
-    print(f"Reading Excel file: {EXCEL_FILE} (this may take time for large files...)")
 
-    df = pd.read_excel(
-        EXCEL_FILE,
-        usecols=["Inserted_date", "Upi_vpa"],
-        engine="openpyxl",
-        parse_dates=["Inserted_date"],
-    )
+# ================= HELPERS =================
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
 
-    # ---------- CLEANING ----------
-    df["Inserted_date"] = pd.to_datetime(
-        df["Inserted_date"], errors="coerce"
-    ).dt.date
 
-    df["Upi_vpa"] = df["Upi_vpa"].astype(str).str.strip()
-    df.replace("nan", None, inplace=True)
-    df.dropna(subset=["Upi_vpa"], inplace=True)
+def prefetch(iterable, depth=2):
+    """Run `iterable` in a background thread, buffering up to `depth` items.
 
-    # Deduplicate before DB insert
-    df.drop_duplicates(subset=["Upi_vpa"], inplace=True)
+    Lets the next batch be read and cleaned while the current one is inserted.
+    If the consumer stops early (an error, or closing the generator), the
+    producer is told to stop and closes `iterable`, releasing its file.
+    """
+    buf = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
 
-    total_rows = len(df)
-    print(f" Total rows to import (after dedup): {total_rows:,}")
+    def put(item):
+        while not stop.is_set():
+            try:
+                buf.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                pass
+        return False
 
-    # ---------- DB ENGINE ----------
-    engine = create_engine(
-        DB_URL,
-        pool_pre_ping=True,
-        connect_args={"connect_timeout": 30},
-    )
+    def produce():
+        items = iter(iterable)
+        try:
+            for item in items:
+                if not put(item):
+                    break
+            else:
+                put(done)
+        except Exception as e:
+            put(e)
+        finally:
+            close = getattr(items, "close", None)
+            if close:
+                close()
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = buf.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def load_batches(path, target_cfg, args):
+    """Yield cleaned (df_clean, stats) batches of one input file.
+
+    --stream yields bounded batches (CSV chunks or read-only XLSX rows) as they
+    are read; otherwise the whole file is one batch.
+    """
+    apply_filter = not args.no_filter
+    if args.stream:
+        yield from prefetch(iter_import_batches(path, target_cfg, apply_filter=apply_filter))
+        return
+    df = read_import_upload(path, target_cfg, apply_filter=apply_filter)
+    yield clean_import_frame(df, target_cfg, apply_filter=apply_filter)
 
-    print(f" Importing in chunks of {CHUNK_SIZE:,} rows (skipping duplicates)...")
-
-    inserted_total = 0
-    skipped_total = 0
-
-    # ================= INSERT LOOP =================
-    for i in range(0, total_rows, CHUNK_SIZE):
-        chunk = df.iloc[i:i + CHUNK_SIZE]
-
-        dates = chunk["Inserted_date"].tolist()
-        upis  = chunk["Upi_vpa"].tolist()
-
-        with engine.begin() as conn:
-            result = conn.execute(
-                text(f"""
-                    INSERT INTO "{TABLE_NAME}" ("Inserted_date", "Upi_vpa")
-                    SELECT d, u
-                    FROM unnest(
-                        CAST(:dates AS date[]),
-                        CAST(:upis  AS text[])
-                    ) AS t(d, u)
-                    ON CONFLICT DO NOTHING
-                """),
-                {
-                    "dates": dates,
-                    "upis": upis
-                }
-            )
-
-            inserted = result.rowcount
-            skipped  = len(chunk) - inserted
-            inserted_total += inserted
-            skipped_total  += skipped
-
-        # ---------- PROGRESS ----------
-        processed = min(i + CHUNK_SIZE, total_rows)
-        pct = (processed / total_rows) * 100
-        elapsed = time.time() - start
-
-        print(
-            f"   Processed {processed:,}  {total_rows:,} "
-            f"({pct:.1f}%) inserted={inserted_total:,} "
-            f" skipped={skipped_total:,} {elapsed:.1f}s"
+
+def today_rows(df_clean):
+    if df_clean is None or "Inserted_date" not in df_clean.columns:
+        return 0
+    return int((df_clean["Inserted_date"] == datetime.date.today()).sum())
+
+
+def check_today(path, target_cfg, args):
+    """Pre-scan a streamed file for today's date before any batch is written.
+
+    Streamed batches are committed one by one, so the abort rule of the
+    whole-file path has to be applied to the complete file up front.
+    """
+    today_count = 0
+    for df_clean, stats in iter_import_batches(path, target_cfg, apply_filter=not args.no_filter):
+        if stats["missing"]:
+            return
+        today_count += today_rows(df_clean)
+    if today_count:
+        raise ValueError(
+            f"{today_count:,} row(s) contain today's date ({datetime.date.today().isoformat()}); "
+            f"re-run with --remove-today to drop them"
+        )
+
+
+def drop_today(df_clean, args, tag):
+    """Apply the Streamlit import's today-date rule to a cleaned batch"""
+    if "Inserted_date" not in df_clean.columns:
+        return df_clean
+    today = datetime.date.today()
+    today_mask = df_clean["Inserted_date"] == today
+    today_count = int(today_mask.sum())
+    if not today_count:
+        return df_clean
+    if not args.remove_today:
+        raise ValueError(
+            f"{today_count:,} row(s) contain today's date ({today.isoformat()}); "
+            f"re-run with --remove-today to drop them"
         )
+    print(f"[{tag}] Removed {today_count:,} row(s) with today's date")
+    return df_clean[~today_mask]
+
+
+def import_file(engine, path, target_cfg, args):
+    """Import one file; returns the summed writer result dict (plus "file")"""
+    tag = os.path.basename(path)
+    table_name = target_cfg["table_name"]
+    key_col = target_cfg["conflict_col"]
+    write_chunks = WRITERS[args.mode]
+    digest = file_sha256(path) if args.mode == "unnest" else None
+
+    totals = {"rows": 0, "filtered": 0, "cleaned": 0, "nat": 0, "missing": [], "columns": []}
+    result = {"file": path, "inserted": 0, "skipped": 0, "elapsed": 0.0}
+
+    print(f"[{tag}] Reading {path} ...")
+    if args.stream and not args.remove_today:
+        check_today(path, target_cfg, args)
+    # Closed explicitly: a failed import must stop the prefetch thread and release the file
+    batches = load_batches(path, target_cfg, args)
+    try:
+        for batch_no, (df_clean, stats) in enumerate(batches):
+            add_stats(totals, stats)
+            if stats["missing"]:
+                raise ValueError(f"missing columns {stats['missing']} (available: {stats['columns']})")
+            if df_clean is None or len(df_clean) == 0:
+                continue
+
+            df_clean = drop_today(df_clean, args, tag)
+            total_rows = len(df_clean)
+            if total_rows == 0:
+                continue
+
+            kwargs = {}
+            if args.mode == "parallel":
+                kwargs["workers"] = args.workers
+            if args.mode == "unnest":
+                # Streamed batches are journaled separately so each can resume on its own
+                run_hash = f"{digest}#{batch_no}" if args.stream else digest
+                kwargs["journal"] = journal_key(run_hash, table_name, args.chunk_size, total_rows)
+
+            def show_progress(label, processed, inserted_total, skipped_total):
+                pct = processed / total_rows * 100
+                print(
+                    f"[{tag}]   batch {batch_no + 1} {label}: {processed:,} / {total_rows:,} ({pct:.1f}%) "
+                    f"inserted={result['inserted'] + inserted_total:,} "
+                    f"skipped={result['skipped'] + skipped_total:,}"
+                )
+
+            print(f"[{tag}] Importing batch {batch_no + 1}: {total_rows:,} rows into {table_name} "
+                  f"({args.mode}, chunks of {args.chunk_size:,})")
+            batch_result = write_chunks(engine, df_clean, table_name, key_col,
+                                        chunk_size=args.chunk_size, on_progress=show_progress, **kwargs)
+            for k in ("inserted", "skipped", "elapsed"):
+                result[k] += batch_result[k]
+    finally:
+        batches.close()
+
+    print(
+        f"[{tag}] Loaded {totals['rows']:,} rows, {totals['filtered']:,} after filtering, "
+        f"{totals['cleaned']:,} unique, {totals['nat']:,} unparseable dates removed"
+    )
+    print(
+        f"[{tag}] DONE in {result['elapsed']:.1f}s "
+        f"Inserted: {result['inserted']:,} Skipped (duplicates): {result['skipped']:,}"
+    )
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Headless bulk import of CSV / XLSX / gzip exports into all_upiiD or all_bank_acc"
+    )
+    parser.add_argument("files", nargs="+", help="input files (.csv, .txt, .csv.gz, .xlsx, .xls)")
+    parser.add_argument("--target", choices=sorted(TARGETS), default="upi", help="table to import into")
+    parser.add_argument("--mode", choices=sorted(WRITERS), default="copy", help="insert strategy")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="connections for --mode parallel")
+    parser.add_argument("--file-workers", type=int, default=1, help="files imported concurrently")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="rows per chunk")
+    parser.add_argument("--stream", action="store_true",
+                        help="read CSV / XLSX in bounded batches and insert each batch while the next is read "
+                             "(.xls files are read whole)")
+    parser.add_argument("--no-filter", action="store_true",
+                        help="skip the Feature_type/wallet/Search_for filter (file is pre-filtered)")
+    parser.add_argument("--remove-today", action="store_true", help="drop rows dated today instead of aborting")
+    return parser.parse_args(argv)
+
+
+# ================= MAIN =================
+def main(argv=None):
+    args = parse_args(argv)
+    target_cfg = TABLE_OPTIONS[TARGETS[args.target]]
+    start = time.time()
+
+    # ---------- DB ENGINE (shared pool, sized for the workers) ----------
+    engine = get_engine(pool_size=args.file_workers * (args.workers if args.mode == "parallel" else 1))
+    try:
+        require_schema(engine, IMPORT_MIGRATIONS)
+    except SchemaError as e:
+        print(f"Error: {e}")
+        return 1
+
+    results = []
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, args.file_workers)) as pool:
+        futures = {pool.submit(import_file, engine, path, target_cfg, args): path for path in args.files}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                results.append(future.result())
+            except Exception as e:
+                failed.append(path)
+                print(f"[{os.path.basename(path)}] FAILED: {e}")
 
+    inserted_total = sum(r["inserted"] for r in results)
+    skipped_total = sum(r["skipped"] for r in results)
+    if inserted_total and load_snapshot(target_cfg["table_name"]):
+        # Once, after all files: checks ignore the snapshot until it catches up
+        print(f"Updating the key snapshot of {target_cfg['table_name']} ...")
+        try:
+            refresh_snapshot(target_cfg["table_name"], target_cfg["conflict_col"])
+        except Exception as e:
+            print(f"Warning: key snapshot not updated: {e}")
     elapsed = time.time() - start
     print(
-        f"\n DONE in {elapsed:.1f}s "
+        f"\n DONE {len(results)}/{len(args.files)} file(s) in {elapsed:.1f}s "
         f" Inserted: {inserted_total:,} "
         f" Skipped (duplicates): {skipped_total:,}"
     )
+    return 1 if failed else 0
 
 
 # ================= ENTRY =================
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
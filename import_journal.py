@@ -0,0 +1,73 @@
+from sqlalchemy import text
+
+# ================= CONFIG =================
+JOURNAL_TABLE = "import_journal"
+
+
+# ================= JOURNAL =================
+def create_journal(conn):
+    """Create the import journal table if it does not exist yet (run by migrations.py)"""
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS "{JOURNAL_TABLE}" (
+            "file_hash"    text        NOT NULL,
+            "table_name"   text        NOT NULL,
+            "chunk_size"   integer     NOT NULL,
+            "total_rows"   integer     NOT NULL,
+            "chunk_no"     integer     NOT NULL,
+            "row_start"    integer     NOT NULL,
+            "row_end"      integer     NOT NULL,
+            "inserted"     integer     NOT NULL,
+            "skipped"      integer     NOT NULL,
+            "committed_at" timestamptz NOT NULL DEFAULT now(),
+            PRIMARY KEY ("file_hash", "table_name", "chunk_size", "total_rows", "chunk_no")
+        )
+    """))
+
+
+def journal_key(file_hash, table_name, chunk_size, total_rows):
+    """Identify one import run: same file, target, chunking and cleaned row count"""
+    return {
+        "file_hash": file_hash,
+        "table_name": table_name,
+        "chunk_size": int(chunk_size),
+        "total_rows": int(total_rows),
+    }
+
+
+_KEY_WHERE = """
+    "file_hash" = :file_hash AND "table_name" = :table_name
+    AND "chunk_size" = :chunk_size AND "total_rows" = :total_rows
+"""
+
+
+def load_committed(engine, key):
+    """Return {chunk_no: (inserted, skipped)} for chunks already committed under `key`"""
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(f'SELECT "chunk_no", "inserted", "skipped" FROM "{JOURNAL_TABLE}" WHERE {_KEY_WHERE}'),
+            key
+        ).fetchall()
+    return {r[0]: (r[1], r[2]) for r in rows}
+
+
+def record_chunk(conn, key, chunk_no, row_start, row_end, inserted, skipped):
+    """Record a committed chunk; call inside the chunk's own transaction"""
+    conn.execute(
+        text(f"""
+            INSERT INTO "{JOURNAL_TABLE}"
+                ("file_hash", "table_name", "chunk_size", "total_rows",
+                 "chunk_no", "row_start", "row_end", "inserted", "skipped")
+            VALUES
+                (:file_hash, :table_name, :chunk_size, :total_rows,
+                 :chunk_no, :row_start, :row_end, :inserted, :skipped)
+            ON CONFLICT DO NOTHING
+        """),
+        {**key, "chunk_no": chunk_no, "row_start": row_start, "row_end": row_end,
+         "inserted": inserted, "skipped": skipped}
+    )
+
+
+def clear_journal(engine, key):
+    """Forget all committed chunks of `key` (start the import over from row 0)"""
+    with engine.begin() as conn:
+        conn.execute(text(f'DELETE FROM "{JOURNAL_TABLE}" WHERE {_KEY_WHERE}'), key)
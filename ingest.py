@@ -0,0 +1,308 @@
+import contextvars
+import io
+import queue
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from sqlalchemy import text
+
+from import_journal import load_committed, record_chunk
+from partitioning import ensure_partitions
+from sql_log import sql_label
+
+# ================= CONFIG =================
+CHUNK_SIZE = 10_000
+DEFAULT_WORKERS = 4
+MAX_WORKERS = 8
+
+
+# ================= HELPERS =================
+def _chunk_arrays(chunk, key_col):
+    """Return (dates, keys) lists for a cleaned chunk"""
+    dates = chunk["Inserted_date"].tolist() if "Inserted_date" in chunk.columns else [None] * len(chunk)
+    keys = chunk[key_col].tolist()
+    return dates, keys
+
+
+def _route_rows(engine, df_clean, table_name):
+    """Create any monthly partitions the rows need (no-op for unpartitioned tables)"""
+    if "Inserted_date" in df_clean.columns:
+        ensure_partitions(engine, table_name, df_clean["Inserted_date"])
+
+
+def _chunk_to_csv(chunk, key_col):
+    """Serialize a cleaned chunk as headerless CSV in ("Inserted_date", key) order"""
+    buf = io.StringIO()
+    cols = ["Inserted_date", key_col] if "Inserted_date" in chunk.columns else [key_col]
+    chunk[cols].to_csv(buf, header=False, index=False)
+    buf.seek(0)
+    return buf
+
+
+def _unnest_insert_sql(table_name, key_col):
+    return text(f"""
+        INSERT INTO "{table_name}" ("Inserted_date", "{key_col}")
+        SELECT d, u
+        FROM unnest(
+            CAST(:dates AS date[]),
+            CAST(:keys  AS text[])
+        ) AS t(d, u)
+        ON CONFLICT DO NOTHING
+    """)
+
+
+def _stage_rows(cur, df_clean, key_col, chunk_size=CHUNK_SIZE, on_progress=None):
+    """Create a staging table and stream df_clean into it with COPY FROM STDIN.
+
+    The staging table is a session TEMP table (never WAL-logged, dropped on
+    commit), so a failed run leaves nothing behind in the target schema.
+    Returns the staging table name.
+    """
+    total_rows = len(df_clean)
+    stage = f"_stage_{uuid.uuid4().hex[:12]}"
+    cols_sql = f'"Inserted_date", "{key_col}"' if "Inserted_date" in df_clean.columns else f'"{key_col}"'
+
+    cur.execute(f'''
+        CREATE TEMP TABLE "{stage}" (
+            "Inserted_date" date,
+            "{key_col}"     text
+        ) ON COMMIT DROP
+    ''')
+
+    for i in range(0, total_rows, chunk_size):
+        chunk = df_clean.iloc[i:i + chunk_size]
+        cur.copy_expert(
+            f'COPY "{stage}" ({cols_sql}) FROM STDIN WITH (FORMAT csv)',
+            _chunk_to_csv(chunk, key_col)
+        )
+        if on_progress:
+            on_progress(f"Staging chunk {i // chunk_size + 1}",
+                        min(i + chunk_size, total_rows), 0, 0)
+
+    return stage
+
+
+# ================= WRITERS =================
+@sql_label("insert unnest")
+def insert_chunks_unnest(engine, df_clean, table_name, key_col,
+                         chunk_size=CHUNK_SIZE, on_progress=None, journal=None):
+    """Insert each chunk with one INSERT ... SELECT FROM unnest(...) ON CONFLICT DO NOTHING
+
+    With `journal` (an import_journal.journal_key), every chunk is recorded in
+    the import journal inside its own transaction, and chunks an earlier run
+    already committed are skipped, so a failed import resumes where it stopped.
+    """
+    start_time = time.time()
+    total_rows = len(df_clean)
+    inserted_total = 0
+    skipped_total = 0
+    _route_rows(engine, df_clean, table_name)
+    committed = load_committed(engine, journal) if journal else {}
+
+    for i in range(0, total_rows, chunk_size):
+        chunk_no = i // chunk_size
+        if chunk_no in committed:
+            inserted, skipped = committed[chunk_no]
+            inserted_total += inserted
+            skipped_total += skipped
+            if on_progress:
+                on_progress(f"Chunk {chunk_no + 1} already committed",
+                            min(i + chunk_size, total_rows), inserted_total, skipped_total)
+            continue
+
+        chunk = df_clean.iloc[i:i + chunk_size]
+        dates, keys = _chunk_arrays(chunk, key_col)
+
+        with engine.begin() as conn:
+            result = conn.execute(
+                _unnest_insert_sql(table_name, key_col),
+                {
+                    "dates": dates,
+                    "keys":  keys
+                }
+            )
+
+            inserted = result.rowcount
+            skipped = len(chunk) - inserted
+            inserted_total += inserted
+            skipped_total += skipped
+
+            if journal:
+                record_chunk(conn, journal, chunk_no, i, i + len(chunk), inserted, skipped)
+
+        if on_progress:
+            on_progress(f"Processing chunk {chunk_no + 1}",
+                        min(i + chunk_size, total_rows), inserted_total, skipped_total)
+
+    return {
+        "inserted": inserted_total,
+        "skipped": skipped_total,
+        "elapsed": time.time() - start_time,
+    }
+
+
+@sql_label("insert copy")
+def copy_staged_insert(engine, df_clean, table_name, key_col,
+                       chunk_size=CHUNK_SIZE, on_progress=None):
+    """COPY all rows into a staging table, then merge with ONE set-based INSERT ... SELECT"""
+    start_time = time.time()
+    total_rows = len(df_clean)
+    _route_rows(engine, df_clean, table_name)
+
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        stage = _stage_rows(cur, df_clean, key_col, chunk_size, on_progress)
+
+        # ---------- MERGE: one set-based insert ----------
+        cur.execute(f'''
+            INSERT INTO "{table_name}" ("Inserted_date", "{key_col}")
+            SELECT "Inserted_date", "{key_col}"
+            FROM "{stage}"
+            ON CONFLICT DO NOTHING
+        ''')
+        inserted_total = cur.rowcount
+        conn.commit()
+        cur.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    skipped_total = total_rows - inserted_total
+    if on_progress:
+        on_progress("Merged staged rows", total_rows, inserted_total, skipped_total)
+
+    return {
+        "inserted": inserted_total,
+        "skipped": skipped_total,
+        "elapsed": time.time() - start_time,
+    }
+
+
+def _write_partition(engine, part, table_name, key_col, chunk_size, done):
+    """Worker: write one key-hash partition over a single pooled connection"""
+    with engine.connect() as conn:
+        for i in range(0, len(part), chunk_size):
+            chunk = part.iloc[i:i + chunk_size]
+            dates, keys = _chunk_arrays(chunk, key_col)
+            with conn.begin():
+                result = conn.execute(
+                    _unnest_insert_sql(table_name, key_col),
+                    {"dates": dates, "keys": keys}
+                )
+            done.put((len(chunk), result.rowcount))
+
+
+@sql_label("insert parallel")
+def parallel_insert_chunks(engine, df_clean, table_name, key_col,
+                           chunk_size=CHUNK_SIZE, on_progress=None, workers=DEFAULT_WORKERS):
+    """Insert with several workers, each owning a disjoint key-hash partition.
+
+    Disjoint partitions mean two workers never race on the same unique-index
+    entry. Workers only report to a queue; progress is emitted from the calling
+    thread (Streamlit UI calls must stay on the script thread), in commit order.
+    """
+    start_time = time.time()
+    total_rows = len(df_clean)
+    workers = max(1, min(int(workers), total_rows))
+    _route_rows(engine, df_clean, table_name)
+
+    buckets = pd.util.hash_pandas_object(df_clean[key_col], index=False).to_numpy() % workers
+    parts = [df_clean[buckets == w] for w in range(workers)]
+
+    done = queue.Queue()
+    processed = 0
+    inserted_total = 0
+    skipped_total = 0
+    chunk_no = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(contextvars.copy_context().run, _write_partition, engine, part, table_name, key_col, chunk_size, done)
+            for part in parts if len(part)
+        ]
+
+        while True:
+            try:
+                rows, inserted = done.get(timeout=0.2)
+            except queue.Empty:
+                if all(f.done() for f in futures) and done.empty():
+                    break
+                continue
+
+            chunk_no += 1
+            processed += rows
+            inserted_total += inserted
+            skipped_total += rows - inserted
+            if on_progress:
+                on_progress(f"Committed chunk {chunk_no}", processed, inserted_total, skipped_total)
+
+        # Surface the first worker error, if any
+        for f in futures:
+            f.result()
+
+    return {
+        "inserted": inserted_total,
+        "skipped": skipped_total,
+        "elapsed": time.time() - start_time,
+    }
+
+
+# ================= DRY RUN =================
+@sql_label("preview new keys")
+def preview_new_keys(engine, df_clean, table_name, key_col,
+                     chunk_size=CHUNK_SIZE, on_progress=None):
+    """Report which cleaned keys are NOT yet in the target table, without writing.
+
+    Keys are COPYed into a temp table and anti-joined against the target in one
+    query; the transaction is rolled back so nothing is persisted.
+    Returns {"new_keys", "by_date", "new", "existing", "elapsed"}.
+    """
+    start_time = time.time()
+
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        stage = _stage_rows(cur, df_clean, key_col, chunk_size, on_progress)
+        cur.execute(f'''
+            SELECT s."Inserted_date", s."{key_col}"
+            FROM "{stage}" s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM "{table_name}" t
+                WHERE t."{key_col}" = s."{key_col}"
+            )
+        ''')
+        new_keys = pd.DataFrame(cur.fetchall(), columns=["Inserted_date", key_col])
+        cur.close()
+    finally:
+        conn.rollback()
+        conn.close()
+
+    if "Inserted_date" in df_clean.columns:
+        totals = df_clean.groupby("Inserted_date", dropna=False).size().rename("Total")
+    else:
+        totals = pd.Series({None: len(df_clean)}, name="Total")
+    new_counts = new_keys.groupby("Inserted_date", dropna=False).size().rename("New")
+    by_date = pd.concat([totals, new_counts], axis=1).fillna(0).astype(int)
+    by_date["Already present"] = by_date["Total"] - by_date["New"]
+    by_date = by_date[["New", "Already present", "Total"]].rename_axis("Inserted_date").reset_index()
+
+    return {
+        "new_keys": new_keys,
+        "by_date": by_date,
+        "new": len(new_keys),
+        "existing": len(df_clean) - len(new_keys),
+        "elapsed": time.time() - start_time,
+    }
+
+
+# Import modes offered by the import column: label -> writer function
+IMPORT_MODES = {
+    "Chunked INSERT (unnest)": insert_chunks_unnest,
+    "COPY staging + merge": copy_staged_insert,
+    "Parallel chunked INSERT": parallel_insert_chunks,
+}
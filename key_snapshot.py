@@ -0,0 +1,211 @@
+import datetime
+import json
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from db import get_db_connection
+from table_stats import changed_days_since, read_table_version, table_version
+
+# ================= CONFIG =================
+SNAPSHOT_DIR = os.getenv("KEY_SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".key_snapshots"))
+SNAPSHOT_FORMAT = 2
+FETCH_ROWS = 100_000
+NO_DATE = np.iinfo(np.int32).min
+
+_loaded = {}   # table_name -> (meta mtime, snapshot dict)
+_lock = threading.Lock()
+
+
+# ================= HELPERS =================
+def hash_keys(keys) -> np.ndarray:
+    """Stable 64-bit hashes of key strings (pandas' fixed-key SipHash)"""
+    return pd.util.hash_pandas_object(pd.Series(keys, dtype=object), index=False).to_numpy()
+
+
+def _to_days(dates) -> np.ndarray:
+    days = pd.to_datetime(pd.Series(dates, dtype=object), errors="coerce").to_numpy().astype("datetime64[D]")
+    out = days.astype(np.int64)
+    out[np.isnat(days)] = NO_DATE
+    return out.astype(np.int32)
+
+
+def _meta_path(table_name):
+    return os.path.join(SNAPSHOT_DIR, f"{table_name}.meta.json")
+
+
+def _array_path(table_name, gen, kind):
+    return os.path.join(SNAPSHOT_DIR, f"{table_name}.{gen}.{kind}.npy")
+
+
+# ================= SNAPSHOT =================
+def load_snapshot(table_name):
+    """Return the current snapshot of `table_name` (memory-mapped) or None.
+
+    The arrays are opened with mmap_mode="r", so every Streamlit worker process
+    shares the same OS page cache instead of holding its own copy.
+    """
+    meta_path = _meta_path(table_name)
+    try:
+        mtime = os.path.getmtime(meta_path)
+    except OSError:
+        return None
+
+    with _lock:
+        cached = _loaded.get(table_name)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get("format") != SNAPSHOT_FORMAT:
+            return None
+        try:
+            hashes = np.load(_array_path(table_name, meta["gen"], "hashes"), mmap_mode="r")
+            dates = np.load(_array_path(table_name, meta["gen"], "dates"), mmap_mode="r")
+        except OSError:
+            return None
+
+        snapshot = {**meta, "hashes": hashes, "dates": dates}
+        _loaded[table_name] = (mtime, snapshot)
+        return snapshot
+
+
+def is_current(snapshot, version=None):
+    """True if no row of the snapshot's table changed since it was built.
+
+    A stale snapshot may miss keys, so callers must not answer misses from
+    it. `version` is the table's current version if already read; a version
+    that cannot be read counts as stale (the caller falls through to the DB).
+    """
+    if version is None:
+        version = read_table_version(snapshot["table_name"])
+    return version is not None and version == snapshot["version"]
+
+
+def contains(snapshot, keys) -> np.ndarray:
+    """Boolean mask: True where a key's hash is in the snapshot (confirm hits in the DB)"""
+    hashes = snapshot["hashes"]
+    probe = hash_keys(keys)
+    if len(hashes) == 0:
+        return np.zeros(len(probe), dtype=bool)
+    pos = np.searchsorted(hashes, probe)
+    pos[pos == len(hashes)] = len(hashes) - 1
+    return hashes[pos] == probe
+
+
+def _fetch(table_name, key_col, current=None):
+    """Table version plus (key hash, date) arrays to merge into `current`.
+
+    Reads in one REPEATABLE READ snapshot, so the version matches the rows
+    exactly. With a current snapshot only the days changed since its
+    version are re-read (None if nothing changed); a change to rows without
+    a date forces a full read.
+    """
+    hash_parts, date_parts = [], []
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+        version = table_version(cur, table_name)
+        since = None
+        if current:
+            days = changed_days_since(cur, table_name, current["version"])
+            if not days:
+                return version, None
+            if days[0] is not None:
+                since = days[0]
+        cur.close()
+
+        cur = conn.cursor(name=f"snapshot_{uuid.uuid4().hex[:8]}")
+        cur.itersize = FETCH_ROWS
+        query = f'SELECT "{key_col}", "Inserted_date" FROM "{table_name}"'
+        if since is not None:
+            cur.execute(query + ' WHERE "Inserted_date" >= %s', (since,))
+        else:
+            cur.execute(query)
+        while True:
+            rows = cur.fetchmany(FETCH_ROWS)
+            if not rows:
+                break
+            keys, dates = zip(*rows)
+            hash_parts.append(hash_keys(keys))
+            date_parts.append(_to_days(dates))
+        cur.close()
+    finally:
+        conn.rollback()
+        conn.close()
+
+    if not hash_parts:
+        return version, (np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int32), since is None)
+    return version, (np.concatenate(hash_parts), np.concatenate(date_parts), since is None)
+
+
+def refresh_snapshot(table_name, key_col):
+    """Build the snapshot, or extend it with the days changed since it was built.
+
+    Every insert, update and delete records its days and a new table version
+    (see table_stats.py), so rows imported with an older Inserted_date are
+    picked up too. Keys deleted from the table stay in the snapshot; they
+    only cost a DB confirmation.
+    """
+    start = time.time()
+    current = load_snapshot(table_name)
+    version, fetched = _fetch(table_name, key_col, current)
+    if fetched is None:
+        if version == current["version"]:
+            return current
+        # No day changed after the snapshot's version: keep its keys, record the new version
+        hashes, dates = np.asarray(current["hashes"]), np.asarray(current["dates"])
+    else:
+        new_hashes, new_dates, full = fetched
+        if current and not full:
+            hashes = np.concatenate([np.asarray(current["hashes"]), new_hashes])
+            dates = np.concatenate([np.asarray(current["dates"]), new_dates])
+        else:
+            hashes, dates = new_hashes, new_dates
+
+    # Sort by hash (earliest date first) and keep one entry per hash
+    order = np.lexsort((dates, hashes))
+    hashes, dates = hashes[order], dates[order]
+    keep = np.ones(len(hashes), dtype=bool)
+    keep[1:] = hashes[1:] != hashes[:-1]
+    hashes, dates = hashes[keep], dates[keep]
+
+    valid = dates[dates != NO_DATE]
+    watermark = str(np.datetime64(int(valid.max()), "D")) if len(valid) else None
+
+    # Write a new generation, then switch the meta file atomically
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    gen = uuid.uuid4().hex[:12]
+    np.save(_array_path(table_name, gen, "hashes"), hashes)
+    np.save(_array_path(table_name, gen, "dates"), dates)
+    meta = {
+        "format": SNAPSHOT_FORMAT,
+        "gen": gen,
+        "table_name": table_name,
+        "key_col": key_col,
+        "count": int(len(hashes)),
+        "watermark": watermark,
+        "version": version,
+        "built_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "build_seconds": round(time.time() - start, 2),
+    }
+    tmp = _meta_path(table_name) + f".{gen}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, _meta_path(table_name))
+
+    # Old generations stay readable by processes that still map them (POSIX)
+    if current:
+        for kind in ("hashes", "dates"):
+            try:
+                os.remove(_array_path(table_name, current["gen"], kind))
+            except OSError:
+                pass
+
+    return load_snapshot(table_name)
@@ -0,0 +1,31 @@
+import time
+import uuid
+
+import streamlit as st
+
+from sql_log import SQL_LOG_PATH, latency_summary, recent_records, set_session
+
+
+# ================= SESSION =================
+def start_sql_session():
+    """Tag this script run's statements with the Streamlit session (call at the top of a page)"""
+    if "sql_session" not in st.session_state:
+        st.session_state.sql_session = uuid.uuid4().hex
+        st.session_state.sql_since = 0.0
+    set_session(st.session_state.sql_session)
+
+
+# ================= PANEL =================
+def show_latency_panel():
+    """Collapsible p50 / p95 latency per statement label for this session's SQL"""
+    with st.expander("⏱️ SQL latency (this session)", expanded=False):
+        records = recent_records(st.session_state.get("sql_session"), st.session_state.get("sql_since", 0.0))
+        if not records:
+            st.info("No SQL statements recorded in this session yet.")
+        else:
+            st.caption(f"{len(records):,} statement(s) · execution and pool checkout times in ms · "
+                       f"log: {SQL_LOG_PATH or 'disabled'}")
+            st.dataframe(latency_summary(records), use_container_width=True, hide_index=True)
+        if st.button("🧹 Reset", key="sql_latency_reset"):
+            st.session_state.sql_since = time.time()
+            st.rerun()
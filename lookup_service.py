@@ -0,0 +1,289 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from canonical import canonicalize, legacy_forms
+from check_cache import cache_get, cache_put
+from checks import CHECK_CHUNK_SIZE, bisect_existing_ids
+from db import DB_URL, get_db_connection, get_engine, pool_status
+from key_snapshot import contains, is_current, load_snapshot
+from pipeline import TABLE_OPTIONS
+from sql_log import sql_label
+from table_stats import read_table_version
+
+# ================= CONFIG =================
+HOST = os.getenv("LOOKUP_HOST", "127.0.0.1")
+PORT = int(os.getenv("LOOKUP_PORT", "8600"))
+# Lookup threads (each holding one pooled connection) shared by all requests
+DB_CONCURRENCY = int(os.getenv("LOOKUP_DB_CONCURRENCY", "4"))
+# Requests handled at once; more get 503 so clients back off
+MAX_ACTIVE_REQUESTS = int(os.getenv("LOOKUP_MAX_REQUESTS", "256"))
+MAX_IDS_PER_REQUEST = 100_000
+MAX_BODY_BYTES = 16 * 1024 * 1024
+# Lookups arriving within this window are merged into one query
+COALESCE_WINDOW = 0.005
+
+# URL target -> TABLE_OPTIONS label (same names as import.py --target)
+TARGETS = {
+    "upi": "UPI",
+    "bank": "Bank Account",
+}
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+# ================= LOOKUP =================
+@sql_label("lookup service")
+def lookup_keys(table_name, search_column, keys):
+    """Blocking lookup of canonical keys: {key: (exists, first_seen, error)}.
+
+    Same order of sources as check_ids_batch: check cache, key snapshot,
+    then one connection from the shared pool (bisecting on failure).
+    """
+    answers = {}
+    version = read_table_version(table_name)
+    cached = cache_get(table_name, keys, version)
+    for key, (found, first_seen) in cached.items():
+        answers[key] = (found, first_seen, None)
+    pending = [k for k in keys if k not in cached]
+
+    snapshot = load_snapshot(table_name)
+    if snapshot is not None and pending and is_current(snapshot, version):
+        maybe = contains(snapshot, pending)
+        answers.update((k, (False, None, None)) for k, hit in zip(pending, maybe) if not hit)
+        pending = [k for k, hit in zip(pending, maybe) if hit]
+
+    if pending:
+        conn = get_db_connection()
+        errors = {}
+        try:
+            found = bisect_existing_ids(conn, pending, table_name, search_column, errors)
+            conn.rollback()
+        except Exception as e:
+            found = {}
+            errors.update((k, str(e)) for k in pending)
+        finally:
+            conn.close()
+
+        cache_put(table_name, [k for k in pending if k not in errors], found, version)
+        for k in pending:
+            first_seen = found.get(k)
+            answers[k] = (k in found, str(first_seen) if first_seen else None, errors.get(k))
+    return answers
+
+
+# ================= COALESCING =================
+class Coalescer:
+    """Merge concurrent lookups of one table into few batched queries.
+
+    Keys requested while an identical key is queued or in flight share its
+    future, so a burst of requests costs one round-trip per COALESCE_WINDOW
+    (or per CHECK_CHUNK_SIZE keys), bounded by the shared DB semaphore.
+    """
+
+    def __init__(self, table_name, search_column, executor, db_slots):
+        self.table_name = table_name
+        self.search_column = search_column
+        self.executor = executor
+        self.db_slots = db_slots
+        self.waiting = {}     # key -> future, not yet sent
+        self.inflight = {}    # key -> future, query running
+        self.tasks = set()    # running batches; the loop only keeps weak references to tasks
+        self.flush_handle = None
+
+    async def lookup(self, keys):
+        loop = asyncio.get_running_loop()
+        futures = {}
+        for key in keys:
+            fut = self.inflight.get(key) or self.waiting.get(key)
+            if fut is None:
+                fut = loop.create_future()
+                self.waiting[key] = fut
+            futures[key] = fut
+
+        if len(self.waiting) >= CHECK_CHUNK_SIZE:
+            self._flush()
+        elif self.waiting and self.flush_handle is None:
+            self.flush_handle = loop.call_later(COALESCE_WINDOW, self._flush)
+
+        # Futures are shared with other requests: shield them so a cancelled
+        # (disconnected) request does not cancel the others' answers
+        for fut in futures.values():
+            await asyncio.shield(fut)
+        return {key: fut.result() for key, fut in futures.items()}
+
+    def _flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        while self.waiting:
+            batch = dict(list(self.waiting.items())[:CHECK_CHUNK_SIZE])
+            for key in batch:
+                del self.waiting[key]
+            self.inflight.update(batch)
+            task = asyncio.ensure_future(self._run(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            async with self.db_slots:
+                answers = await loop.run_in_executor(
+                    self.executor, lookup_keys, self.table_name, self.search_column, list(batch)
+                )
+            for key, fut in batch.items():
+                if not fut.done():
+                    fut.set_result(answers[key])
+        except Exception as e:
+            for fut in batch.values():
+                if not fut.done():
+                    fut.set_result((False, None, str(e)))
+        finally:
+            for key in batch:
+                self.inflight.pop(key, None)
+
+
+# ================= HTTP =================
+class LookupServer:
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=DB_CONCURRENCY, thread_name_prefix="lookup")
+        self.db_slots = asyncio.Semaphore(DB_CONCURRENCY)
+        self.active = 0
+        self.coalescers = {
+            name: Coalescer(TABLE_OPTIONS[label]["table_name"], TABLE_OPTIONS[label]["conflict_col"],
+                            self.executor, self.db_slots)
+            for name, label in TARGETS.items()
+        }
+
+    async def check(self, target, body):
+        """POST /check/<target> {"ids": [...]} -> per-ID exists / first_seen / error"""
+        coalescer = self.coalescers.get(target)
+        if coalescer is None:
+            return 404, {"error": f"unknown target '{target}', expected one of {sorted(TARGETS)}"}
+        try:
+            ids = json.loads(body or b"{}").get("ids")
+        except (ValueError, AttributeError):
+            return 400, {"error": "body must be a JSON object like {\"ids\": [...]}"}
+        if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+            return 400, {"error": "\"ids\" must be a list of strings"}
+        if len(ids) > MAX_IDS_PER_REQUEST:
+            return 413, {"error": f"at most {MAX_IDS_PER_REQUEST:,} ids per request"}
+
+        # Canonical form plus the legacy forms older rows may be stored in, per ID
+        forms = [canonicalize(ids, coalescer.search_column)] + legacy_forms(ids, coalescer.search_column)
+        per_id = [[k for k in dict.fromkeys(keys) if k] for keys in zip(*forms)]
+        answers = await coalescer.lookup(list(dict.fromkeys(itertools.chain.from_iterable(per_id))))
+        results = []
+        for id_val, keys in zip(ids, per_id):
+            hits = [answers[k] for k in keys if answers[k][0]]
+            if hits:
+                exists, first_seen, error = True, min((h[1] for h in hits if h[1]), default=None), None
+            else:
+                exists, first_seen = False, None
+                error = next((answers[k][2] for k in keys if answers[k][2]), None)
+            results.append({"id": id_val, "exists": exists, "first_seen": first_seen, "error": error})
+        return 200, {"table": coalescer.table_name, "results": results}
+
+    async def route(self, method, path, body):
+        if path == "/health" and method == "GET":
+            return 200, {"status": "ok", "active_requests": self.active, "pool": pool_status()}
+        if path.startswith("/check/"):
+            if method != "POST":
+                return 405, {"error": "use POST"}
+            return await self.check(path[len("/check/"):].strip("/"), body)
+        return 404, {"error": "not found"}
+
+    async def handle(self, reader, writer):
+        """Minimal HTTP/1.1 with keep-alive: request line, headers, Content-Length body"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    status, payload = 400, {"error": "invalid Content-Length"}
+                    keep_alive = False
+                elif length > MAX_BODY_BYTES:
+                    status, payload = 413, {"error": "request body too large"}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    keep_alive = headers.get("connection", "").lower() != "close"
+                    if self.active >= MAX_ACTIVE_REQUESTS:
+                        status, payload = 503, {"error": "too many concurrent requests, retry later"}
+                    else:
+                        self.active += 1
+                        try:
+                            status, payload = await self.route(method, target.split("?", 1)[0], body)
+                        except Exception as e:
+                            status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+                        finally:
+                            self.active -= 1
+
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host, port):
+    server = LookupServer()
+    listener = await asyncio.start_server(server.handle, host, port)
+    print(f"Lookup service on http://{host}:{port} (targets: {', '.join(sorted(TARGETS))})")
+    async with listener:
+        await listener.serve_forever()
+
+
+# ================= MAIN =================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP JSON service for bulk UPI / bank account ID checks")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args(argv)
+
+    if not DB_URL:
+        print("Error: DB_URL not found in .env file.")
+        return 1
+    get_engine(pool_size=DB_CONCURRENCY)
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+# ================= ENTRY =================
+if __name__ == "__main__":
+    sys.exit(main())
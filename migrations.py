@@ -0,0 +1,407 @@
+import argparse
+import sys
+from collections import namedtuple
+
+from sqlalchemy import text
+
+from checks import HANDLE_EXPR, HANDLE_INDEX, HANDLE_TABLE
+from db import DB_URL, get_engine
+from import_journal import JOURNAL_TABLE, create_journal
+from partitioning import is_partitioned, register_trigger, registry_table
+from pipeline import TABLE_OPTIONS
+from table_stats import (CHANGES_TABLE, DAILY_TABLE, REFRESH_TABLE, STATS_FUNCTION, create_stats_schema,
+                         create_stats_triggers, stats_triggers)
+
+# ================= CONFIG =================
+MIGRATIONS_TABLE = "schema_migrations"
+# pg_advisory_lock key so two servers starting at once don't both migrate
+MIGRATION_LOCK_ID = 7_370_001
+
+# Key table -> (unique index, BRIN index) names created by this module
+INDEX_NAMES = {
+    "all_upiiD": ("all_upiiD_Upi_vpa_key", "all_upiiD_Inserted_date_brin"),
+    "all_bank_acc": ("all_bank_acc_Bank_account_number_key", "all_bank_acc_Inserted_date_brin"),
+}
+
+# SQL function -> (key table, key column, array parameter) for the summary page's "new" counts
+COUNT_FUNCTIONS = {
+    "count_new_upi": ("all_upiiD", "Upi_vpa", "p_upi_array"),
+    "count_new_bank": ("all_bank_acc", "Bank_account_number", "p_bank_array"),
+}
+
+
+class SchemaError(RuntimeError):
+    """The database is missing objects the app relies on"""
+
+
+# ================= HELPERS =================
+def _key_tables():
+    return [(cfg["table_name"], cfg["conflict_col"]) for cfg in TABLE_OPTIONS.values()]
+
+
+def _exists(conn, relation):
+    return conn.execute(text("SELECT to_regclass(:r)"), {"r": f'"{relation}"'}).scalar() is not None
+
+
+def _has_unique_index(conn, table_name, column):
+    """True if some valid unique index covers exactly `column` (whatever its name)"""
+    return conn.execute(text("""
+        SELECT 1
+        FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+        WHERE i.indrelid = to_regclass(:t)
+          AND i.indisunique AND i.indisvalid
+          AND i.indnatts = 1 AND i.indexprs IS NULL
+          AND a.attname = :c
+    """), {"t": f'"{table_name}"', "c": column}).first() is not None
+
+
+def _has_brin_index(conn, table_name, column):
+    return conn.execute(text("""
+        SELECT 1
+        FROM pg_index i
+        JOIN pg_class ic ON ic.oid = i.indexrelid
+        JOIN pg_am am ON am.oid = ic.relam
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+        WHERE i.indrelid = to_regclass(:t)
+          AND am.amname = 'brin' AND i.indisvalid
+          AND a.attname = :c
+    """), {"t": f'"{table_name}"', "c": column}).first() is not None
+
+
+def _index_valid(conn, index_name):
+    """True / False for a valid / invalid index, None if it does not exist"""
+    return conn.execute(
+        text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:n)"),
+        {"n": f'"{index_name}"'}
+    ).scalar()
+
+
+def _has_trigger(conn, table_name, trigger):
+    return conn.execute(
+        text("SELECT 1 FROM pg_trigger WHERE tgname = :n AND tgrelid = to_regclass(:t)"),
+        {"n": trigger, "t": f'"{table_name}"'}
+    ).first() is not None
+
+
+def _has_column(conn, table_name, column):
+    return conn.execute(
+        text("SELECT 1 FROM pg_attribute WHERE attrelid = to_regclass(:t) AND attname = :c AND NOT attisdropped"),
+        {"t": f'"{table_name}"', "c": column}
+    ).first() is not None
+
+
+def _has_function(conn, name):
+    return conn.execute(
+        text("SELECT 1 FROM pg_proc WHERE proname = :n AND pronamespace = 'public'::regnamespace"),
+        {"n": name}
+    ).first() is not None
+
+
+def _create_index(conn, index_name, table_name, definition, unique=False):
+    """CREATE INDEX CONCURRENTLY on a live table; `conn` must be in autocommit.
+
+    The leftover of an earlier failed build (an invalid index) is dropped
+    first. Partitioned tables do not support CONCURRENTLY and are indexed
+    with a plain CREATE INDEX.
+    """
+    if _index_valid(conn, index_name) is False:
+        conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{index_name}"'))
+    concurrently = "" if is_partitioned(conn, table_name) else "CONCURRENTLY "
+    conn.execute(text(
+        f'CREATE {"UNIQUE " if unique else ""}INDEX {concurrently}IF NOT EXISTS "{index_name}" '
+        f'ON "{table_name}" {definition}'
+    ))
+
+
+# ================= MIGRATIONS =================
+# Each migration comes with a check listing what is still missing. A migration
+# whose objects already exist (e.g. created before this module) is recorded as
+# applied without running it; check_schema reports the checks' problems.
+
+def m001_key_tables(conn):
+    """Key tables (left as they are if they already exist)"""
+    for table_name, key_col in _key_tables():
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS "{table_name}" (
+                "{key_col}"     text NOT NULL,
+                "Inserted_date" date
+            )
+        """))
+
+
+def c001_key_tables(conn):
+    return [f'table "{t}" does not exist' for t, _ in _key_tables() if not _exists(conn, t)]
+
+
+def m002_unique_keys(conn):
+    """Unique index on each key column (ON CONFLICT and all lookups rely on it)"""
+    for table_name, key_col in _key_tables():
+        if is_partitioned(conn, table_name):
+            # Uniqueness is kept by the key registry (see partitioning.py)
+            continue
+        if not _has_unique_index(conn, table_name, key_col):
+            _create_index(conn, INDEX_NAMES[table_name][0], table_name, f'("{key_col}")', unique=True)
+
+
+def c002_unique_keys(conn):
+    problems = []
+    for table_name, key_col in _key_tables():
+        if not _exists(conn, table_name):
+            continue
+        if is_partitioned(conn, table_name):
+            registry = registry_table(table_name)
+            if not _has_unique_index(conn, registry, key_col):
+                problems.append(f'no key registry "{registry}"("{key_col}") for partitioned "{table_name}"')
+            if not _has_trigger(conn, table_name, register_trigger(table_name)):
+                problems.append(f'no trigger "{register_trigger(table_name)}" on partitioned "{table_name}"')
+        elif not _has_unique_index(conn, table_name, key_col):
+            problems.append(f'no valid unique index on "{table_name}"("{key_col}")')
+    return problems
+
+
+def m003_date_brin(conn):
+    """BRIN index on Inserted_date: rows arrive in date order, so it stays tiny"""
+    for table_name, _ in _key_tables():
+        if not _has_brin_index(conn, table_name, "Inserted_date"):
+            _create_index(conn, INDEX_NAMES[table_name][1], table_name, 'USING brin ("Inserted_date")')
+
+
+def c003_date_brin(conn):
+    return [
+        f'no BRIN index on "{t}"("Inserted_date")'
+        for t, _ in _key_tables() if _exists(conn, t) and not _has_brin_index(conn, t, "Inserted_date")
+    ]
+
+
+def m004_count_new_functions(conn):
+    """count_new_upi / count_new_bank, only where no function of that name exists.
+
+    Existing definitions (whatever their signature) are left untouched, so
+    the summary page keeps the semantics it was built against.
+    """
+    for name, (table_name, key_col, param) in COUNT_FUNCTIONS.items():
+        if _has_function(conn, name):
+            continue
+        conn.execute(text(f"""
+            CREATE FUNCTION "{name}"({param} text[], p_cutoff_date date)
+            RETURNS TABLE (missing_count bigint)
+            LANGUAGE sql STABLE AS $fn$
+                SELECT COUNT(*)
+                FROM (SELECT DISTINCT k FROM unnest({param}) AS k WHERE k IS NOT NULL) a
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM "{table_name}" t
+                    WHERE t."{key_col}" = a.k AND t."Inserted_date" <= p_cutoff_date
+                )
+            $fn$
+        """))
+
+
+def c004_count_new_functions(conn):
+    return [f"function {name}() does not exist" for name in COUNT_FUNCTIONS if not _has_function(conn, name)]
+
+
+def m005_import_journal(conn):
+    """Import journal (resumable chunked imports)"""
+    create_journal(conn)
+
+
+def c005_import_journal(conn):
+    return [] if _exists(conn, JOURNAL_TABLE) else [f'table "{JOURNAL_TABLE}" does not exist']
+
+
+def m006_handle_index(conn):
+    """VPA handle expression index (handle / PSP search)"""
+    _create_index(conn, HANDLE_INDEX, HANDLE_TABLE, f"({HANDLE_EXPR} text_pattern_ops)")
+
+
+def c006_handle_index(conn):
+    return [] if _index_valid(conn, HANDLE_INDEX) else [f'no valid handle index "{HANDLE_INDEX}" on "{HANDLE_TABLE}"']
+
+
+def m007_table_stats(conn):
+    """Per-day row counts kept by statement triggers (header metrics)"""
+    create_stats_schema(conn)
+    for table_name, _ in _key_tables():
+        create_stats_triggers(conn, table_name)
+
+
+def c007_table_stats(conn):
+    problems = [f'table "{t}" does not exist' for t in (DAILY_TABLE, REFRESH_TABLE) if not _exists(conn, t)]
+    if not _has_function(conn, STATS_FUNCTION):
+        problems.append(f"function {STATS_FUNCTION}() does not exist")
+    for table_name, _ in _key_tables():
+        problems += [
+            f'no trigger "{trigger}" on "{table_name}"'
+            for trigger, (event, _) in stats_triggers(table_name).items()
+            if event in ("INSERT", "DELETE") and not _has_trigger(conn, table_name, trigger)
+        ]
+    return problems
+
+
+def m008_table_stats_updates(conn):
+    """UPDATE trigger on the key tables so upserts that move Inserted_date keep the per-day counts right"""
+    create_stats_schema(conn)
+    for table_name, _ in _key_tables():
+        create_stats_triggers(conn, table_name)
+
+
+def c008_table_stats_updates(conn):
+    return [
+        f'no trigger "{trigger}" on "{table_name}"'
+        for table_name, _ in _key_tables()
+        for trigger, (event, _) in stats_triggers(table_name).items()
+        if event == "UPDATE" and not _has_trigger(conn, table_name, trigger)
+    ]
+
+
+def m009_table_versions(conn):
+    """Per-table change version (and version of each day's last change) so key snapshots can tell they are stale"""
+    create_stats_schema(conn)
+
+
+def c009_table_versions(conn):
+    problems = [] if _exists(conn, CHANGES_TABLE) else [f'table "{CHANGES_TABLE}" does not exist']
+    if _exists(conn, DAILY_TABLE) and not _has_column(conn, DAILY_TABLE, "version"):
+        problems.append(f'no column "version" on "{DAILY_TABLE}"')
+    return problems
+
+
+# version, apply, check, concurrent (runs in autocommit to build indexes CONCURRENTLY).
+# Never renumber or remove an applied one; add a new one.
+Migration = namedtuple("Migration", ["version", "apply", "check", "concurrent"])
+MIGRATIONS = [
+    Migration(1, m001_key_tables, c001_key_tables, False),
+    Migration(2, m002_unique_keys, c002_unique_keys, True),
+    Migration(3, m003_date_brin, c003_date_brin, True),
+    Migration(4, m004_count_new_functions, c004_count_new_functions, False),
+    Migration(5, m005_import_journal, c005_import_journal, False),
+    Migration(6, m006_handle_index, c006_handle_index, True),
+    Migration(7, m007_table_stats, c007_table_stats, False),
+    Migration(8, m008_table_stats_updates, c008_table_stats_updates, False),
+    Migration(9, m009_table_versions, c009_table_versions, False),
+]
+LATEST_VERSION = MIGRATIONS[-1].version
+
+# Migrations each entry point relies on; require_schema checks only these
+IMPORT_MIGRATIONS = (1, 2, 5, 7, 8, 9)     # tables, ON CONFLICT keys, journal, stats and version triggers
+APP_MIGRATIONS = IMPORT_MIGRATIONS         # handle search checks its own index
+SUMMARY_MIGRATIONS = (1, 4)                # count_new_* functions
+
+
+# ================= RUN =================
+def ensure_migrations_table(conn):
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS "{MIGRATIONS_TABLE}" (
+            "version"    integer     PRIMARY KEY,
+            "name"       text        NOT NULL,
+            "applied_at" timestamptz NOT NULL DEFAULT now()
+        )
+    """))
+
+
+def applied_versions(conn) -> set:
+    if not _exists(conn, MIGRATIONS_TABLE):
+        return set()
+    return set(conn.execute(text(f'SELECT "version" FROM "{MIGRATIONS_TABLE}"')).scalars())
+
+
+def current_version(conn) -> int:
+    return max(applied_versions(conn), default=0)
+
+
+def _record(engine, migration):
+    with engine.begin() as conn:
+        conn.execute(
+            text(f'INSERT INTO "{MIGRATIONS_TABLE}" ("version", "name") VALUES (:v, :n) ON CONFLICT DO NOTHING'),
+            {"v": migration.version, "n": migration.apply.__name__}
+        )
+
+
+def migrate(engine, log=print):
+    """Apply pending migrations in order; returns the versions actually run.
+
+    Pending migrations whose objects already exist are recorded as applied
+    (baseline of a database created before this module). Index migrations
+    build CONCURRENTLY, so imports and lookups keep running meanwhile.
+    """
+    applied = []
+    with engine.connect() as lock_conn:
+        lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+        lock_conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": MIGRATION_LOCK_ID})
+        try:
+            with engine.begin() as conn:
+                ensure_migrations_table(conn)
+                done = applied_versions(conn)
+            for migration in MIGRATIONS:
+                if migration.version in done:
+                    continue
+                with engine.connect() as conn:
+                    missing = migration.check(conn)
+                if not missing:
+                    log(f"Recording migration {migration.version:03d} as applied (already in place)")
+                    _record(engine, migration)
+                    continue
+
+                log(f"Applying migration {migration.version:03d}: {migration.apply.__doc__.splitlines()[0]}")
+                if migration.concurrent:
+                    with engine.connect() as conn:
+                        conn.execution_options(isolation_level="AUTOCOMMIT")
+                        migration.apply(conn)
+                else:
+                    with engine.begin() as conn:
+                        migration.apply(conn)
+                _record(engine, migration)
+                applied.append(migration.version)
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": MIGRATION_LOCK_ID})
+    return applied
+
+
+def check_schema(engine, versions=None) -> list:
+    """Problems that would make imports fail or lookups fall back to sequential scans.
+
+    Based on the objects themselves, not on schema_migrations, so a database
+    created before migrations were tracked passes as long as it is complete.
+    `versions` limits the checks to those migrations (default: all).
+    """
+    problems = []
+    with engine.connect() as conn:
+        for migration in MIGRATIONS:
+            if versions is not None and migration.version not in versions:
+                continue
+            problems += [f"{problem} (migration {migration.version:03d})" for problem in migration.check(conn)]
+    return problems
+
+
+def require_schema(engine, versions=None):
+    """Raise SchemaError listing every problem check_schema finds in `versions`"""
+    problems = check_schema(engine, versions)
+    if problems:
+        raise SchemaError(
+            "Database schema is not ready (run: python migrations.py):\n- " + "\n- ".join(problems)
+        )
+
+
+# ================= MAIN =================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create / upgrade the key tables, indexes and SQL functions")
+    parser.add_argument("--check", action="store_true", help="only report problems, change nothing")
+    args = parser.parse_args(argv)
+
+    if not DB_URL:
+        print("Error: DB_URL not found in .env file.")
+        return 1
+    engine = get_engine()
+    if not args.check:
+        applied = migrate(engine)
+        print(f"Applied {len(applied)} migration(s); schema version {LATEST_VERSION}")
+    problems = check_schema(engine)
+    for problem in problems:
+        print(f"PROBLEM: {problem}")
+    return 1 if problems else 0
+
+
+# ================= ENTRY =================
+if __name__ == "__main__":
+    sys.exit(main())
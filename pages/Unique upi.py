@@ -1,6 +1,8 @@
 import pandas as pd
 from datetime import timedelta
 import streamlit as st
+from canonical import canonical_loose
+from pipeline import parse_dates
 
 # ===== CONFIG =====
 INPUT_FILE = r"C:\Users\Acer\Downloads\table__v3_scraper_merchantlaundering_data_table customer__Mystery Shopping date__20251030 (1).csv"
@@ -20,12 +22,6 @@ mapping_upi.columns = mapping_upi.columns.str.strip()
 mapping_bank.columns = mapping_bank.columns.str.strip()
 rules_df.columns = rules_df.columns.str.strip()
 
-# ===== CLEANUP FUNCTION =====
-def clean_value(x):
-    if pd.isna(x):
-        return None
-    return str(x).strip().lower().replace(" ", "").replace(".", "").replace(",", "")
-
 # ===== APPLY RULES DYNAMICALLY =====
 def apply_rules(df, rules_df):
     for _, rule in rules_df.iterrows():
@@ -59,16 +55,16 @@ def apply_rules(df, rules_df):
 
 # ===== CLEAN & NORMALIZE DATA =====
 df['Upi_bank_account_wallet'] = df['Upi_bank_account_wallet'].astype(str).str.strip().str.lower()
-df['Upi_vpa_clean'] = df['Upi_vpa'].apply(clean_value)
-df['Bank_account_number_clean'] = df['Bank_account_number'].apply(clean_value)
-df['Website_url_clean'] = df['Website_url'].apply(clean_value)
+df['Upi_vpa_clean'] = canonical_loose(df['Upi_vpa'])
+df['Bank_account_number_clean'] = canonical_loose(df['Bank_account_number'])
+df['Website_url_clean'] = canonical_loose(df['Website_url'])
 
-mapping_upi['Upi_vpa_clean'] = mapping_upi['Upi_vpa'].apply(clean_value)
-mapping_bank['Bank_account_number_clean'] = mapping_bank['Bank_account_number'].apply(clean_value)
+mapping_upi['Upi_vpa_clean'] = canonical_loose(mapping_upi['Upi_vpa'])
+mapping_bank['Bank_account_number_clean'] = canonical_loose(mapping_bank['Bank_account_number'])
 
-df['Inserted_date'] = pd.to_datetime(df['Inserted_date'], errors='coerce').dt.date
-mapping_upi['Inserted_date'] = pd.to_datetime(mapping_upi['Inserted_date'], errors='coerce').dt.date
-mapping_bank['Inserted_date'] = pd.to_datetime(mapping_bank['Inserted_date'], errors='coerce').dt.date
+df['Inserted_date'] = parse_dates(df['Inserted_date']).dt.date
+mapping_upi['Inserted_date'] = parse_dates(mapping_upi['Inserted_date']).dt.date
+mapping_bank['Inserted_date'] = parse_dates(mapping_bank['Inserted_date']).dt.date
 
 # ===== APPLY RULES FROM EXCEL =====
 df = apply_rules(df, rules_df)
@@ -2,15 +2,21 @@ import streamlit as st
 import pandas as pd
 from datetime import timedelta
 from io import BytesIO
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from openpyxl import Workbook
 from openpyxl.styles import Alignment, Font, PatternFill
 from openpyxl.utils import get_column_letter
 import streamlit.components.v1 as components
-import os
 from dotenv import load_dotenv
+from canonical import canonical_bank, canonical_vpa
+from db import DB_URL, get_engine
+from latency_panel import show_latency_panel, start_sql_session
+from migrations import SUMMARY_MIGRATIONS, SchemaError, require_schema
+from pipeline import parse_dates, read_projected, sniff_header
+from upload_cache import cached_stage, file_digest
 
 load_dotenv()
+start_sql_session()
 
 st.markdown("""
 <style>
@@ -37,19 +43,24 @@ def find_column(cols, keys):
     return None
 
 
-@st.cache_resource
 def get_db_engine():
     try:
-        db_url = os.getenv("DB_URL")
-        if not db_url:
+        if not DB_URL:
             st.error("DB_URL not found in environment variables")
             return None
-        return create_engine(db_url)
+        return get_engine()
     except Exception as e:
         st.error(f"Database connection failed: {e}")
         return None
 
 
+@st.cache_resource
+def get_schema_check(_engine):
+    """require_schema once per process (a failed check is not cached and runs again)"""
+    require_schema(_engine, SUMMARY_MIGRATIONS)
+    return True
+
+
 def chunk_list(lst, n):
     for i in range(0, len(lst), n):
         yield lst[i:i + n]
@@ -93,26 +104,14 @@ def count_new_banks_for_date(engine, bank_array, cutoff_date):
         return 0
 
 
-def clean_val(x):
-    if pd.isna(x):
-        return None
-    return str(x).strip().lower().replace(" ", "")
-
-
-def clean_bank_val(x):
-    if pd.isna(x):
-        return None
-    return str(x).strip()
-
-
 def process_df(date_df, engine, cutoff_date):
     """Helper to compute UPI & Bank stats for a given sub-dataframe."""
     if date_df.empty:
         return 0, 0, 0, 0, 0, 0
 
     date_df = date_df.copy()
-    date_df["Upi_vpa_clean"] = date_df["Upi_vpa"].astype(str).str.strip().str.lower().str.replace(" ", "")
-    date_df["Bank_acc_clean"] = date_df["Bank_account_number"].apply(clean_bank_val)
+    date_df["Upi_vpa_clean"] = canonical_vpa(date_df["Upi_vpa"])
+    date_df["Bank_acc_clean"] = canonical_bank(date_df["Bank_account_number"])
 
     upi_sub = date_df[date_df["Upi_bank_account_wallet"].astype(str).str.strip().str.upper() == "UPI"]
     total_upi = len(upi_sub)
@@ -129,6 +128,23 @@ def process_df(date_df, engine, cutoff_date):
     return total_upi, unique_upi, new_upi, total_bank, unique_bank, new_bank
 
 
+def prepare_summary_frame(df):
+    """Apply the summary filters and add cleaned key/website/date columns."""
+    filtered_df = df[
+        (df["Feature_type"].astype(str).str.strip() == "BS Money Laundering") &
+        (df["Approvd_status"].astype(str).str.strip() == "1") &
+        (df["Input_user"].astype(str).str.strip().str.lower() != "automated") &
+        (df["Search_for"].astype(str).str.strip().isin(["App", "Web"])) &
+        (df["Upi_bank_account_wallet"].astype(str).str.strip().isin(["UPI", "Bank Account"]))
+    ].copy()
+
+    filtered_df["Upi_vpa_clean"] = canonical_vpa(filtered_df["Upi_vpa"])
+    filtered_df["Bank_acc_clean"] = canonical_bank(filtered_df["Bank_account_number"])
+    filtered_df["Website_url"] = canonical_vpa(filtered_df["Website_url"])
+    filtered_df["Inserted_date"] = parse_dates(filtered_df["Inserted_date"]).dt.date
+    return filtered_df
+
+
 # ================= EXCEL EXPORT =================
 def build_excel(summary_df, multiple_summary_df, freelancer_summary_df, daily_summary_df=None):
     wb = Workbook()
@@ -279,7 +295,7 @@ def build_excel(summary_df, multiple_summary_df, freelancer_summary_df, daily_su
         ]
 
         daily_dates_xl = sorted(
-            df["Inserted_date"].pipe(pd.to_datetime, errors="coerce").dt.date.dropna().unique()
+            parse_dates(df["Inserted_date"]).dt.date.dropna().unique()
         )
         daily_date_xl_str = ", ".join(str(d) for d in daily_dates_xl) if daily_dates_xl else "N/A"
 
@@ -319,32 +335,36 @@ if uploaded_file:
     if not engine:
         st.error("Cannot proceed without database connection")
         st.stop()
+    try:
+        get_schema_check(engine)
+    except SchemaError as e:
+        st.error(f"❌ {e}")
+        st.stop()
 
-    if uploaded_file.name.endswith(".csv"):
-        df = pd.read_csv(uploaded_file, dtype=str)
-    else:
-        df = pd.read_excel(uploaded_file, dtype=str)
-
-    df.columns = df.columns.str.strip()
-    st.success(f"File Loaded: {uploaded_file.name}")
-
+    # Parsed and filtered frames live in the shared upload cache:
+    # treat them as read-only here
     required_cols = [
         "Id", "Feature_type", "Approvd_status", "Input_user",
         "Inserted_date", "Website_url", "Upi_vpa",
         "Bank_account_number", "Search_for", "Upi_bank_account_wallet"
     ]
-    missing = [c for c in required_cols if c not in df.columns]
+    header = sniff_header(uploaded_file)
+    missing = [c for c in required_cols if c not in header]
     if missing:
         st.error(f"Missing columns: {missing}")
         st.stop()
 
-    filtered_df = df[
-        (df["Feature_type"].astype(str).str.strip() == "BS Money Laundering") &
-        (df["Approvd_status"].astype(str).str.strip() == "1") &
-        (df["Input_user"].astype(str).str.strip().str.lower() != "automated") &
-        (df["Search_for"].astype(str).str.strip().isin(["App", "Web"])) &
-        (df["Upi_bank_account_wallet"].astype(str).str.strip().isin(["UPI", "Bank Account"]))
-    ].copy()
+    # Only the columns this page uses are parsed (plus QC user / video URL)
+    extra_cols = [
+        c for c in (find_column(header, ["approvedby", "qcby", "qcuser"]),
+                    find_column(header, ["videourl", "video"])) if c
+    ]
+    digest = file_digest(uploaded_file)
+    df = cached_stage(digest, "parsed:summary",
+                      lambda: read_projected(uploaded_file, required_cols + extra_cols))
+    st.success(f"File Loaded: {uploaded_file.name}")
+
+    filtered_df = cached_stage(digest, "summary:filtered", lambda: prepare_summary_frame(df))
 
     if filtered_df.empty:
         st.warning("No records found after applying filters.")
@@ -352,11 +372,6 @@ if uploaded_file:
 
     st.info(f"{len(filtered_df)} rows matched filters")
 
-    filtered_df["Upi_vpa_clean"] = filtered_df["Upi_vpa"].apply(clean_val)
-    filtered_df["Bank_acc_clean"] = filtered_df["Bank_account_number"].apply(clean_bank_val)
-    filtered_df["Website_url"] = filtered_df["Website_url"].apply(clean_val)
-    filtered_df["Inserted_date"] = pd.to_datetime(filtered_df["Inserted_date"], errors="coerce").dt.date
-
     upi_df = filtered_df[
         (filtered_df["Upi_bank_account_wallet"].astype(str).str.strip().str.lower() == "upi")
     ].copy()
@@ -380,13 +395,9 @@ if uploaded_file:
     grouped = grouped.merge(bank_grouped, on="Inserted_date", how="left")
     grouped[["Bank_Total", "Bank_Unique"]] = grouped[["Bank_Total", "Bank_Unique"]].fillna(0).astype(int)
 
-    all_dates = (
-        df["Inserted_date"]
-        .pipe(pd.to_datetime, errors="coerce")
-        .dt.date
-        .dropna()
-        .unique()
-    )
+    # Inserted_date is parsed once per file and shared by every per-date step below
+    row_dates = cached_stage(digest, "summary:dates", lambda: parse_dates(df["Inserted_date"]).dt.date)
+    all_dates = row_dates.dropna().unique()
 
     target_users = [
         "Emp Sunena Yadav",
@@ -416,10 +427,8 @@ if uploaded_file:
     status_col = "Approvd_status"
 
     if qc_user_col and video_col:
-        df["_date"] = pd.to_datetime(df["Inserted_date"], errors="coerce").dt.date
-
-        for date in sorted(df["_date"].dropna().unique()):
-            day = df[df["_date"] == date].copy()
+        for date in sorted(row_dates.dropna().unique()):
+            day = df[row_dates == date].copy()
 
             daily_base = pd.DataFrame({"Name": daily_users})
 
@@ -553,8 +562,6 @@ if uploaded_file:
             day_df = pd.concat([day_df, pd.DataFrame([total_row])], ignore_index=True)
             daily_summary_all[date] = day_df
 
-        df.drop(columns=["_date"], inplace=True, errors="ignore")
-
     daily_summary_df = pd.DataFrame()  # kept for Excel export compat
 
     summary_data = []
@@ -633,23 +640,21 @@ if uploaded_file:
         for date in sorted(all_dates):
             cutoff_date = (pd.to_datetime(date) - timedelta(days=1)).strftime("%Y-%m-%d")
 
-            date_series = df["Inserted_date"].pipe(pd.to_datetime, errors="coerce").dt.date
-
             freelancer_df = df.loc[
-                (date_series == date) &
+                (row_dates == date) &
                 (df["Input_user"].astype(str).str.contains("Freelancer", case=False, na=False)) &
                 (df["Approvd_status"].astype(str).str.strip() == "1")
             ].copy()
 
             int_df = df.loc[
-                (date_series == date) &
+                (row_dates == date) &
                 (df["Input_user"].astype(str).str.contains("INT", case=False, na=False)) &
                 (~df["Input_user"].astype(str).str.contains("icuser", case=False, na=False)) &
                 (df["Approvd_status"].astype(str).str.strip() == "1")
             ].copy()
 
             emp_df = df.loc[
-                (date_series == date) &
+                (row_dates == date) &
                 (df["Input_user"].astype(str).str.contains("Emp", case=False, na=False)) &
                 (~df["Input_user"].astype(str).str.contains("icuser", case=False, na=False)) &
                 (df["Approvd_status"].astype(str).str.strip() == "1")
@@ -855,4 +860,6 @@ if uploaded_file:
     )
 
 else:
-    st.info("📤 Please upload a file to generate the report.")
\ No newline at end of file
+    st.info("📤 Please upload a file to generate the report.")
+
+show_latency_panel()
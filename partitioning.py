@@ -0,0 +1,240 @@
+import argparse
+import datetime
+import sys
+
+import pandas as pd
+from sqlalchemy import text
+
+from checks import HANDLE_EXPR, HANDLE_INDEX, HANDLE_TABLE
+from db import DB_URL, get_engine
+from pipeline import TABLE_OPTIONS
+from table_stats import create_stats_triggers
+
+# ================= CONFIG =================
+# Suffix of the original table (and its indexes) after conversion; kept until dropped by hand
+OLD_SUFFIX = "_unpartitioned"
+# Months created ahead of the newest row at conversion time
+MONTHS_AHEAD = 3
+
+
+# ================= HELPERS =================
+def registry_table(table_name):
+    """Key registry of a partitioned table: one row per key, enforces global uniqueness"""
+    return f"{table_name}_keys"
+
+
+def register_trigger(table_name):
+    """BEFORE INSERT trigger claiming each new key in the registry"""
+    return f"{table_name}_key_register"
+
+
+def _index_names(table_name, key_col):
+    # Same names migrations.py gives the key and BRIN indexes of plain tables
+    return f"{table_name}_{key_col}_key", f"{table_name}_Inserted_date_brin"
+
+
+def partition_name(table_name, month):
+    return f"{table_name}_p{month:%Y%m}"
+
+
+def _month_start(day):
+    return datetime.date(day.year, day.month, 1)
+
+
+def _next_month(month):
+    return datetime.date(month.year + (month.month == 12), month.month % 12 + 1, 1)
+
+
+def _months(first, last):
+    month = _month_start(first)
+    while month <= last:
+        yield month
+        month = _next_month(month)
+
+
+def is_partitioned(conn, table_name):
+    return conn.execute(
+        text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:t)"),
+        {"t": f'"{table_name}"'}
+    ).scalar() is True
+
+
+def _create_partition(conn, table_name, month):
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS "{partition_name(table_name, month)}"
+        PARTITION OF "{table_name}"
+        FOR VALUES FROM ('{month.isoformat()}') TO ('{_next_month(month).isoformat()}')
+    """))
+
+
+# ================= ROUTING =================
+def ensure_partitions(engine, table_name, dates):
+    """Create the monthly partitions `dates` fall in, if `table_name` is partitioned.
+
+    Called by every ingest writer before inserting, so imports route into
+    new months without manual DDL. A no-op (one catalog lookup) for plain
+    tables and for months that already exist. Creation is serialized per
+    table, so concurrent imports (e.g. --file-workers) are safe.
+    """
+    days = pd.to_datetime(pd.Series(dates), errors="coerce").dropna()
+    if days.empty:
+        return
+    with engine.connect() as conn:
+        if not is_partitioned(conn, table_name):
+            return
+        missing = [
+            month for month in _months(days.min().date(), days.max().date())
+            if conn.execute(text("SELECT to_regclass(:p)"),
+                            {"p": f'"{partition_name(table_name, month)}"'}).scalar() is None
+        ]
+    if missing:
+        with engine.begin() as conn:
+            # Two imports reaching the same new month: the second waits here and
+            # then finds the partition (IF NOT EXISTS) instead of failing on it
+            conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:k))"), {"k": f"partitions:{table_name}"})
+            for month in missing:
+                _create_partition(conn, table_name, month)
+
+
+# ================= CONVERSION =================
+def convert_to_partitioned(engine, table_name, key_col, log=print):
+    """Rebuild `table_name` as a monthly range-partitioned table, in one transaction.
+
+    - every row is copied into monthly partitions on Inserted_date (rows
+      without a date make the conversion fail: fix or delete them first);
+    - a key registry ("<table>_keys", primary key on the key) replaces the
+      unique index, which a partitioned table can only have together with
+      the partition column. A BEFORE INSERT row trigger claims the key in the
+      registry and silently skips the row if it is taken, so INSERT ... ON
+      CONFLICT DO NOTHING keeps its meaning (requires PostgreSQL 13+);
+    - the key, BRIN and (for all_upiiD) handle indexes are recreated under
+      their usual names; the original table is kept as "<table>_unpartitioned".
+    """
+    new_table = f"{table_name}__part"
+    old_table = f"{table_name}{OLD_SUFFIX}"
+    registry = registry_table(table_name)
+
+    with engine.begin() as conn:
+        if is_partitioned(conn, table_name):
+            log(f"{table_name} is already partitioned")
+            return False
+        conn.execute(text(f'LOCK TABLE "{table_name}" IN ACCESS EXCLUSIVE MODE'))
+
+        nulls = conn.execute(text(f'SELECT COUNT(*) FROM "{table_name}" WHERE "Inserted_date" IS NULL')).scalar()
+        if nulls:
+            raise ValueError(f'{nulls:,} row(s) of "{table_name}" have no Inserted_date; cannot partition')
+        first, last = conn.execute(text(f'SELECT MIN("Inserted_date"), MAX("Inserted_date") FROM "{table_name}"')).first()
+        today = datetime.date.today()
+        first = first or today
+        last = max(last or today, today)
+        for _ in range(MONTHS_AHEAD):
+            last = _next_month(_month_start(last))
+
+        log(f"Creating {new_table} with monthly partitions {first:%Y-%m} .. {last:%Y-%m}")
+        conn.execute(text(f"""
+            CREATE TABLE "{new_table}" (LIKE "{table_name}" INCLUDING DEFAULTS)
+            PARTITION BY RANGE ("Inserted_date")
+        """))
+        for month in _months(first, last):
+            conn.execute(text(f"""
+                CREATE TABLE "{partition_name(new_table, month)}"
+                PARTITION OF "{new_table}"
+                FOR VALUES FROM ('{month.isoformat()}') TO ('{_next_month(month).isoformat()}')
+            """))
+
+        log("Copying rows and building the key registry")
+        conn.execute(text(f'CREATE TABLE IF NOT EXISTS "{registry}" ("{key_col}" text PRIMARY KEY)'))
+        conn.execute(text(f'INSERT INTO "{registry}" ("{key_col}") SELECT "{key_col}" FROM "{table_name}" ON CONFLICT DO NOTHING'))
+        conn.execute(text(f'INSERT INTO "{new_table}" SELECT * FROM "{table_name}"'))
+
+        # Free the usual index names, then swap the tables
+        for (index_name,) in conn.execute(
+            text("SELECT indexname FROM pg_indexes WHERE tablename = :t AND schemaname = 'public'"),
+            {"t": table_name}
+        ).fetchall():
+            conn.execute(text(f'ALTER INDEX "{index_name}" RENAME TO "{index_name[:63 - len(OLD_SUFFIX)]}{OLD_SUFFIX}"'))
+        conn.execute(text(f'ALTER TABLE "{table_name}" RENAME TO "{old_table}"'))
+        conn.execute(text(f'ALTER TABLE "{new_table}" RENAME TO "{table_name}"'))
+        for month in _months(first, last):
+            conn.execute(text(
+                f'ALTER TABLE "{partition_name(new_table, month)}" RENAME TO "{partition_name(table_name, month)}"'
+            ))
+
+        log("Creating indexes")
+        key_index, brin_index = _index_names(table_name, key_col)
+        conn.execute(text(f'CREATE INDEX "{key_index}" ON "{table_name}" ("{key_col}")'))
+        conn.execute(text(f'CREATE INDEX "{brin_index}" ON "{table_name}" USING brin ("Inserted_date")'))
+        if table_name == HANDLE_TABLE:
+            conn.execute(text(f'CREATE INDEX "{HANDLE_INDEX}" ON "{table_name}" ({HANDLE_EXPR} text_pattern_ops)'))
+
+        conn.execute(text(f"""
+            CREATE OR REPLACE FUNCTION "{register_trigger(table_name)}"() RETURNS trigger
+            LANGUAGE plpgsql AS $fn$
+            BEGIN
+                INSERT INTO "{registry}" ("{key_col}") VALUES (NEW."{key_col}") ON CONFLICT DO NOTHING;
+                IF NOT FOUND THEN
+                    RETURN NULL;
+                END IF;
+                RETURN NEW;
+            END
+            $fn$
+        """))
+        conn.execute(text(f"""
+            CREATE OR REPLACE FUNCTION "{table_name}_key_release"() RETURNS trigger
+            LANGUAGE plpgsql AS $fn$
+            BEGIN
+                DELETE FROM "{registry}" WHERE "{key_col}" = OLD."{key_col}";
+                RETURN NULL;
+            END
+            $fn$
+        """))
+        conn.execute(text(f"""
+            CREATE TRIGGER "{register_trigger(table_name)}" BEFORE INSERT ON "{table_name}"
+            FOR EACH ROW EXECUTE FUNCTION "{register_trigger(table_name)}"()
+        """))
+        conn.execute(text(f"""
+            CREATE TRIGGER "{table_name}_key_release" AFTER DELETE ON "{table_name}"
+            FOR EACH ROW EXECUTE FUNCTION "{table_name}_key_release"()
+        """))
+        # The stats triggers stayed on the renamed original table
+        create_stats_triggers(conn, table_name)
+
+    log(f"Done: {table_name} is partitioned, the original table is {old_table}")
+    return True
+
+
+def partition_summary(engine, table_name) -> pd.DataFrame:
+    """Partitions of a table with their estimated row counts"""
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), GREATEST(c.reltuples, 0)::bigint
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(:t)
+            ORDER BY c.relname
+        """), {"t": f'"{table_name}"'}).fetchall()
+    return pd.DataFrame(rows, columns=["Partition", "Bounds", "Rows (est.)"])
+
+
+# ================= MAIN =================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Optional monthly range partitioning of the key tables")
+    parser.add_argument("action", choices=["convert", "status"])
+    parser.add_argument("--target", choices=["upi", "bank"], default="upi")
+    args = parser.parse_args(argv)
+
+    if not DB_URL:
+        print("Error: DB_URL not found in .env file.")
+        return 1
+    cfg = TABLE_OPTIONS["UPI" if args.target == "upi" else "Bank Account"]
+    engine = get_engine()
+    if args.action == "convert":
+        convert_to_partitioned(engine, cfg["table_name"], cfg["conflict_col"])
+    else:
+        print(partition_summary(engine, cfg["table_name"]).to_string(index=False))
+    return 0
+
+
+# ================= ENTRY =================
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,398 @@
+import io
+import re
+
+import pandas as pd
+from openpyxl import load_workbook
+from pandas.tseries.api import guess_datetime_format
+
+from canonical import canonicalize
+
+# ================= CONFIG =================
+FEATURE_TYPE = "BS Money Laundering"
+SEARCH_FOR_VALUES = ["App", "Web"]
+READ_CHUNK_ROWS = 200_000
+
+# Table options and their required columns + conflict column + filter value
+TABLE_OPTIONS = {
+    "UPI": {
+        "table_name": "all_upiiD",
+        "required": ["Upi_vpa", "Inserted_date"],
+        "conflict_col": "Upi_vpa",
+        "filter_value": "UPI"
+    },
+    "Bank Account": {
+        "table_name": "all_bank_acc",
+        "required": ["Bank_account_number", "Inserted_date"],
+        "conflict_col": "Bank_account_number",
+        "filter_value": "Bank Account"
+    }
+}
+
+# Check target that routes each ID to UPI or Bank Account by its shape
+MIXED_TARGET = "Auto-detect (UPI + Bank)"
+
+# Columns every import reads for its filter mask
+IMPORT_FILTER_COLS = ["Feature_type", "Upi_bank_account_wallet", "Search_for"]
+
+# Low-cardinality export columns that are read as categoricals
+CATEGORY_COLS = ["Feature_type", "Upi_bank_account_wallet", "Search_for", "Approvd_status"]
+
+# The pyarrow CSV parser is multi-threaded; fall back to the C parser without it
+try:
+    import pyarrow
+    from pyarrow import csv as pa_csv
+    CSV_ENGINE = "pyarrow"
+except ImportError:
+    CSV_ENGINE = "c"
+
+
+# ================= COLUMN MATCHING =================
+def normalize_colname(name: str) -> str:
+    return re.sub(r'[^a-z0-9]', '', str(name).lower())
+
+
+def map_columns(df_columns):
+    mapping = {}
+    for col in df_columns:
+        mapping[normalize_colname(col)] = col
+    return mapping
+
+
+def find_required_columns(df_cols, required_list):
+    mapping = map_columns(df_cols)
+    found = {}
+    missing = []
+    for req in required_list:
+        norm_req = normalize_colname(req)
+        if norm_req in mapping:
+            found[req] = mapping[norm_req]
+        else:
+            parts = re.split(r'[^a-z0-9]+', req.lower())
+            matched = None
+            for dfcol in df_cols:
+                n = normalize_colname(dfcol)
+                if all(p for p in parts if p and p in n):
+                    matched = dfcol
+                    break
+            if matched:
+                found[req] = matched
+            else:
+                missing.append(req)
+    return found, missing
+
+
+# ================= READING =================
+def _is_excel(file, name=None):
+    name = name or getattr(file, "name", file if isinstance(file, str) else "")
+    return str(name).lower().endswith((".xlsx", ".xls"))
+
+
+def _is_legacy_xls(file, name=None):
+    name = name or getattr(file, "name", file if isinstance(file, str) else "")
+    return str(name).lower().endswith(".xls")
+
+
+def _rewind(file):
+    if hasattr(file, "seek"):
+        file.seek(0)
+
+
+def _raw_header(file, name=None):
+    if _is_excel(file, name):
+        cols = pd.read_excel(file, nrows=0).columns.tolist()
+    else:
+        cols = pd.read_csv(file, nrows=0).columns.tolist()
+    _rewind(file)
+    return cols
+
+
+def sniff_header(file, name=None):
+    """Return the stripped column names of a CSV/Excel upload without reading its rows"""
+    return [str(c).strip() for c in _raw_header(file, name)]
+
+
+def _projection(file, columns, categories, dtype, name=None):
+    """Map wanted (stripped) names to raw header names and a per-column dtype dict.
+
+    Category columns are read as strings too and converted afterwards (see
+    _to_categories), so a blank cell cannot turn "1" into a float "1.0".
+    """
+    wanted = set(columns)
+    usecols = [c for c in _raw_header(file, name) if str(c).strip() in wanted]
+    dtypes = {}
+    for c in usecols:
+        if str(c).strip() in categories:
+            dtypes[c] = str
+        elif dtype is not None:
+            dtypes[c] = dtype
+    return usecols, dtypes
+
+
+def _to_categories(df, categories):
+    for c in df.columns:
+        if c in categories:
+            df[c] = df[c].astype("category")
+    return df
+
+
+def _read_csv_text(file, usecols):
+    """Read `usecols` of a CSV as strings, keeping leading zeros.
+
+    pandas' pyarrow engine infers types before applying dtype (so
+    "0012345678" would come back as "12345678"); pyarrow's own reader is
+    given string column types up front instead.
+    """
+    if CSV_ENGINE == "pyarrow" and not isinstance(file, io.TextIOBase):
+        table = pa_csv.read_csv(file, convert_options=pa_csv.ConvertOptions(
+            include_columns=usecols,
+            column_types={c: pyarrow.string() for c in usecols},
+            strings_can_be_null=True,
+        ))
+        return table.to_pandas()
+    return pd.read_csv(file, usecols=usecols, dtype=str)
+
+
+def read_projected(file, columns, categories=CATEGORY_COLS, dtype=str, name=None):
+    """Read only `columns` (stripped header names) of a CSV/Excel upload.
+
+    Columns in `categories` come in as categoricals; the rest use `dtype`
+    (None lets pandas infer). String CSV reads go through pyarrow when it is
+    installed. Columns not present in the file are simply not returned.
+    """
+    usecols, dtypes = _projection(file, columns, categories, dtype, name)
+    if _is_excel(file, name):
+        df = pd.read_excel(file, usecols=usecols, dtype=dtypes or None)
+    elif dtype is str:
+        df = _read_csv_text(file, usecols)
+    else:
+        # Inferred columns: the C engine applies the string dtypes while parsing
+        df = pd.read_csv(file, usecols=usecols, dtype=dtypes or None)
+    df.columns = df.columns.str.strip()
+    return _to_categories(df, categories)
+
+
+def import_columns(header, target_cfg, apply_filter=True):
+    """Columns the import pipeline needs from a file with this (stripped) header"""
+    found, missing = find_required_columns(header, target_cfg["required"])
+    if missing:
+        return None
+    filter_cols = IMPORT_FILTER_COLS if apply_filter else []
+    return filter_cols + [found[c] for c in target_cfg["required"]]
+
+
+def read_import_upload(file, target_cfg, name=None, apply_filter=True):
+    """Read just the filter and required columns an import of `target_cfg` uses.
+
+    When required columns are missing, returns an empty frame with the full
+    header so that clean_import_frame can report what is available.
+    """
+    header = sniff_header(file, name)
+    columns = import_columns(header, target_cfg, apply_filter)
+    if columns is None:
+        return pd.DataFrame(columns=header)
+    return read_projected(file, columns, name=name)
+
+
+# ================= DATES =================
+def _guess_format(values):
+    for v in values:
+        if isinstance(v, str) and v.strip():
+            return guess_datetime_format(v.strip())
+    return None
+
+
+def parse_dates(values):
+    """Drop-in for pd.to_datetime(values, errors="coerce") on a date-string column.
+
+    Export date columns hold a few hundred distinct values across millions of
+    rows, so the format is inferred once, only the distinct values are parsed,
+    and the result is mapped back through factorized codes. Like
+    pd.to_datetime, values that do not match the inferred format become NaT
+    (no per-value fallback that could read 02/01 and 13/01 in different
+    day/month orders).
+    """
+    values = pd.Series(values)
+    if not (pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values)):
+        return pd.to_datetime(values, errors="coerce")
+
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques, dtype=object)
+    parsed = pd.to_datetime(uniques, format=_guess_format(uniques), errors="coerce")
+
+    # Code -1 (missing) becomes NaT; .array keeps timezone-aware dtypes
+    return pd.Series(parsed.array.take(codes, allow_fill=True), index=values.index, name=values.name)
+
+
+# ================= IMPORT CLEANING =================
+def _empty_stats():
+    return {"rows": 0, "filtered": 0, "cleaned": 0, "nat": 0, "missing": [], "columns": []}
+
+
+def clean_import_frame(df, target_cfg, seen=None, apply_filter=True):
+    """Filter, project, clean, dedup and date-normalize one frame of an export.
+
+    `seen` is a set of keys already kept from earlier frames; it is updated in
+    place so that chunks of one file dedup against each other (first wins).
+    apply_filter=False skips the Feature_type/wallet/Search_for mask for files
+    that are already filtered (e.g. two-column backfill sheets).
+    Returns (df_clean, stats). If required columns are missing, df_clean is
+    None and stats["missing"] lists them.
+    """
+    required = target_cfg["required"]
+    key_col = target_cfg["conflict_col"]
+    stats = _empty_stats()
+    stats["rows"] = len(df)
+    stats["columns"] = df.columns.tolist()
+
+    if apply_filter:
+        mask = (
+            (df["Feature_type"].astype(str).str.strip() == FEATURE_TYPE) &
+            (df["Upi_bank_account_wallet"].astype(str).str.strip().isin([target_cfg["filter_value"]])) &
+            (df["Search_for"].astype(str).str.strip().isin(SEARCH_FOR_VALUES))
+        )
+        filtered_df = df[mask]
+    else:
+        filtered_df = df
+    stats["filtered"] = len(filtered_df)
+
+    # Select and rename required columns
+    found_cols_map, missing = find_required_columns(df.columns.tolist(), required)
+    if missing:
+        stats["missing"] = missing
+        return None, stats
+
+    df_clean = filtered_df[[found_cols_map[c] for c in required]].copy()
+    df_clean = df_clean.rename(columns={found_cols_map[c]: c for c in required})
+
+    # ---------- CLEANING ----------
+    df_clean = df_clean.dropna(subset=[key_col])
+    df_clean[key_col] = canonicalize(df_clean[key_col], key_col)
+    df_clean = df_clean[df_clean[key_col] != ""]
+    df_clean = df_clean.drop_duplicates(subset=[key_col])
+
+    if seen is not None:
+        df_clean = df_clean[~df_clean[key_col].isin(seen)]
+        seen.update(df_clean[key_col])
+
+    stats["cleaned"] = len(df_clean)
+    if df_clean.empty:
+        return df_clean, stats
+
+    # ---------- INSERTED_DATE NORMALIZE ----------
+    if "Inserted_date" in df_clean.columns:
+        parsed_dates = parse_dates(df_clean["Inserted_date"])
+
+        nat_mask = parsed_dates.isna()
+        stats["nat"] = int(nat_mask.sum())
+        if stats["nat"] > 0:
+            df_clean = df_clean[~nat_mask].copy()
+            parsed_dates = parsed_dates[~nat_mask]
+
+        # Python date object — matches PostgreSQL date type
+        df_clean["Inserted_date"] = parsed_dates.dt.date
+
+    return df_clean, stats
+
+
+def iter_xlsx_frames(file, columns, chunk_rows=READ_CHUNK_ROWS, categories=CATEGORY_COLS):
+    """Yield bounded string DataFrames of `columns` from the first sheet of a workbook.
+
+    Uses openpyxl's read-only mode, so rows are streamed from the file instead
+    of building the whole workbook in memory. Cells are converted to strings
+    like pd.read_excel(dtype=str); blank rows are skipped.
+    """
+    wb = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = [str(c).strip() if c is not None else "" for c in next(rows, ())]
+        wanted = set(columns)
+        idx = [i for i, c in enumerate(header) if c in wanted]
+        names = [header[i] for i in idx]
+
+        def to_frame(batch):
+            df = pd.DataFrame(batch, columns=names, dtype=object)
+            for c in names:
+                if c in categories:
+                    df[c] = df[c].astype("category")
+            return df
+
+        batch = []
+        for row in rows:
+            if all(v is None for v in row):
+                continue
+            batch.append([
+                None if i >= len(row) or row[i] is None else str(row[i])
+                for i in idx
+            ])
+            if len(batch) >= chunk_rows:
+                yield to_frame(batch)
+                batch = []
+        if batch:
+            yield to_frame(batch)
+    finally:
+        wb.close()
+
+
+def iter_import_batches(file, target_cfg, chunk_rows=READ_CHUNK_ROWS, apply_filter=True, name=None):
+    """Yield (df_clean, stats) for each bounded batch of a CSV or XLSX export.
+
+    Only the filter and required columns are parsed, and batches are deduped
+    against each other on the key column, so each batch can be inserted as
+    soon as it is yielded. Legacy .xls files cannot be streamed and come back
+    as a single batch.
+    """
+    header = sniff_header(file, name)
+    columns = import_columns(header, target_cfg, apply_filter)
+    if columns is None:
+        yield clean_import_frame(pd.DataFrame(columns=header), target_cfg, apply_filter=apply_filter)
+        return
+
+    if _is_legacy_xls(file, name):
+        # openpyxl (read-only streaming) cannot open .xls: read it whole, as one batch
+        df = read_projected(file, columns, name=name)
+        yield clean_import_frame(df, target_cfg, apply_filter=apply_filter)
+        return
+
+    if _is_excel(file, name):
+        frames = iter_xlsx_frames(file, columns, chunk_rows)
+    else:
+        usecols, dtypes = _projection(file, columns, CATEGORY_COLS, str, name)
+        frames = pd.read_csv(file, usecols=usecols, dtype=dtypes, chunksize=chunk_rows)
+
+    seen = set()
+    for chunk in frames:
+        chunk.columns = chunk.columns.str.strip()
+        _to_categories(chunk, CATEGORY_COLS)
+        yield clean_import_frame(chunk, target_cfg, seen=seen, apply_filter=apply_filter)
+
+
+def add_stats(totals, stats):
+    """Accumulate per-batch stats into `totals` (in place)"""
+    totals["columns"] = stats["columns"]
+    totals["missing"] = stats["missing"]
+    for k in ("rows", "filtered", "cleaned", "nat"):
+        totals[k] += stats[k]
+    return totals
+
+
+def read_import_csv_streaming(file, target_cfg, chunk_rows=READ_CHUNK_ROWS, apply_filter=True):
+    """Read an export CSV in bounded chunks and clean each chunk as it arrives.
+
+    Only the surviving (deduplicated) key/date rows are kept between chunks,
+    so peak memory follows the number of unique keys instead of file size.
+    Returns (df_clean, stats) with stats summed over all chunks.
+    """
+    totals = _empty_stats()
+    parts = []
+
+    for part, stats in iter_import_batches(file, target_cfg, chunk_rows, apply_filter):
+        add_stats(totals, stats)
+        if stats["missing"]:
+            return None, totals
+        parts.append(part)
+
+    if not parts:
+        return None, totals
+
+    df_clean = pd.concat(parts, ignore_index=True)
+    return df_clean, totals
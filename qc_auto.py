@@ -2,6 +2,7 @@ import pandas as pd
 import tkinter as tk
 from tkinter import filedialog, messagebox
 import os, sys
+from pipeline import read_projected, sniff_header
 
 
 # ---------------- HELPERS ----------------
@@ -30,8 +31,17 @@ def process_file():
         if not path:
             return
 
-        df = pd.read_csv(path) if path.endswith(".csv") else pd.read_excel(path)
-        df.columns = df.columns.str.strip()
+        # Read only the columns this report uses
+        header = sniff_header(path)
+        used_cols = [
+            "Input_user", "Search_for", "Upi_bank_account_wallet", "Approvd_status",
+            find_column(header, ["approvedby", "qcby", "qcuser"]),
+            find_column(header, ["videourl", "video"]),
+        ]
+        df = read_projected(
+            path, [c for c in used_cols if c],
+            categories=["Search_for", "Upi_bank_account_wallet"], dtype=None
+        )
 
         # -------- REQUIRED COLUMNS --------
         input_col = "Input_user"
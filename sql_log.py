@@ -0,0 +1,206 @@
+import contextlib
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+
+import pandas as pd
+import psycopg2.extensions
+
+# ================= CONFIG =================
+# JSON-lines log of every statement; empty disables the file (the in-memory panel still works)
+SQL_LOG_PATH = os.getenv("SQL_LOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".sql_log.jsonl"))
+# The log is moved to "<path>.1" (replacing an older one) when it grows past this
+SQL_LOG_MAX_BYTES = int(os.getenv("SQL_LOG_MAX_MB", "100")) * 1024 * 1024
+# Statements kept in memory for the latency panel, across all sessions
+RECENT_RECORDS = 20_000
+SQL_PREVIEW_CHARS = 200
+
+_label = contextvars.ContextVar("sql_label", default=None)
+_session = contextvars.ContextVar("sql_session", default=None)
+_local = threading.local()
+_recent = deque(maxlen=RECENT_RECORDS)
+_file_lock = threading.Lock()
+_file = None
+
+_VERB = re.compile(r"^\s*(\w+)")
+# execute_values sends fully rendered rows; nothing after VALUES is recorded
+_VALUES = re.compile(r"\bVALUES\b", re.I)
+_OBJECT = re.compile(
+    r'\b(?:FROM|INTO|UPDATE|TABLE|INDEX|FUNCTION|TRIGGER)\s+'
+    r'(?:IF\s+(?:NOT\s+)?EXISTS\s+|ONLY\s+|CONCURRENTLY\s+)*"?([\w.]+)',
+    re.I
+)
+
+
+# ================= CONTEXT =================
+@contextlib.contextmanager
+def sql_label(name):
+    """Tag statements run inside the block (in this thread / context) with `name`"""
+    token = _label.set(name)
+    try:
+        yield
+    finally:
+        _label.reset(token)
+
+
+def set_session(session_id):
+    """Tag statements of the current context with a session id (one per Streamlit session)"""
+    _session.set(session_id)
+
+
+def note_checkout(seconds):
+    """Pool wait of this thread's latest checkout; charged to its next statement"""
+    _local.checkout = seconds
+
+
+# ================= RECORDING =================
+def _statement_text(query):
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    elif not isinstance(query, str):
+        query = str(query)
+    return " ".join(query[:SQL_PREVIEW_CHARS * 4].split())
+
+
+def redact(sql):
+    """Statement text safe to log: cut after VALUES so inlined keys (VPAs, accounts) never reach the log"""
+    match = _VALUES.search(sql)
+    return sql[:match.end()] + " ..." if match else sql
+
+
+def describe(sql):
+    """Default label of a statement: its verb and first table / function, e.g. "INSERT all_upiiD" """
+    verb = _VERB.match(sql)
+    target = _OBJECT.search(sql)
+    words = [verb.group(1).upper() if verb else "SQL"]
+    if target:
+        words.append(target.group(1))
+    return " ".join(words)
+
+
+def _rows_in(params, many=False):
+    """Parameter rows of a call: rows for executemany, longest array parameter otherwise"""
+    if not params:
+        return None
+    if many:
+        return len(params)
+    values = params.values() if isinstance(params, dict) else params
+    lengths = [len(v) for v in values if isinstance(v, (list, tuple))]
+    return max(lengths) if lengths else 1
+
+
+def _write(record):
+    global _file
+    line = json.dumps(record, default=str) + "\n"
+    with _file_lock:
+        try:
+            if _file is None:
+                _file = open(SQL_LOG_PATH, "a", encoding="utf-8")
+            if _file.tell() > SQL_LOG_MAX_BYTES:
+                _file.close()
+                os.replace(SQL_LOG_PATH, SQL_LOG_PATH + ".1")
+                _file = open(SQL_LOG_PATH, "a", encoding="utf-8")
+            _file.write(line)
+            _file.flush()
+        except OSError:
+            # Logging must never break a query
+            pass
+
+
+def record(sql, rows_in, rows_out, exec_seconds, error=None):
+    checkout = getattr(_local, "checkout", None)
+    _local.checkout = None
+    label = _label.get()
+    entry = {
+        "ts": time.time(),
+        "session": _session.get(),
+        "label": f"{label}: {describe(sql)}" if label else describe(sql),
+        "sql": redact(sql)[:SQL_PREVIEW_CHARS],
+        "rows_in": rows_in,
+        "rows_out": rows_out,
+        "checkout_ms": round(checkout * 1000, 3) if checkout is not None else None,
+        "exec_ms": round(exec_seconds * 1000, 3),
+        "error": error,
+        "thread": threading.current_thread().name,
+    }
+    _recent.append(entry)
+    if SQL_LOG_PATH:
+        _write(entry)
+
+
+# ================= CURSORS =================
+class TimedCursorMixin:
+    """Times every execute / executemany / copy_expert of a psycopg2 cursor.
+
+    Installed as the connections' default cursor_factory, so it sees raw
+    psycopg2 calls and SQLAlchemy statements alike. The pool's pre-ping
+    ("SELECT 1") is not recorded.
+    """
+
+    def _timed(self, call, query, rows_in, *args):
+        sql = _statement_text(query)
+        if sql == "SELECT 1":
+            return call(query, *args)
+        start = time.perf_counter()
+        try:
+            result = call(query, *args)
+        except Exception as e:
+            # First line only: DETAIL lines quote key values
+            message = (str(e).splitlines() or [""])[0]
+            record(sql, rows_in, None, time.perf_counter() - start, f"{type(e).__name__}: {message}")
+            raise
+        rows_out = self.rowcount if self.rowcount >= 0 else None
+        if sql.upper().startswith("COPY") and " FROM " in sql.upper():
+            rows_in, rows_out = rows_out, None
+        record(sql, rows_in, rows_out, time.perf_counter() - start)
+        return result
+
+    def execute(self, query, vars=None):
+        return self._timed(super().execute, query, _rows_in(vars), vars)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        return self._timed(super().executemany, query, _rows_in(vars_list, many=True), vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._timed(super().copy_expert, sql, None, file, size)
+
+
+class TimedCursor(TimedCursorMixin, psycopg2.extensions.cursor):
+    pass
+
+
+# ================= SUMMARY =================
+def recent_records(session=None, since=0.0):
+    """In-memory records, optionally of one session and newer than `since` (epoch seconds)"""
+    return [r for r in list(_recent)
+            if r["ts"] >= since and (session is None or r["session"] == session)]
+
+
+def latency_summary(records) -> pd.DataFrame:
+    """p50 / p95 execution time and checkout wait per label, slowest p95 first"""
+    columns = ["Label", "Calls", "p50 ms", "p95 ms", "Max ms", "Total ms",
+               "Checkout p95 ms", "Rows in", "Rows out", "Errors"]
+    if not records:
+        return pd.DataFrame(columns=columns)
+    df = pd.DataFrame(records)
+    for col in ("exec_ms", "checkout_ms", "rows_in", "rows_out"):
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    grouped = df.groupby("label")
+    summary = pd.DataFrame({
+        "Calls": grouped.size(),
+        "p50 ms": grouped["exec_ms"].quantile(0.5),
+        "p95 ms": grouped["exec_ms"].quantile(0.95),
+        "Max ms": grouped["exec_ms"].max(),
+        "Total ms": grouped["exec_ms"].sum(),
+        "Checkout p95 ms": grouped["checkout_ms"].quantile(0.95),
+        "Rows in": grouped["rows_in"].sum(min_count=1),
+        "Rows out": grouped["rows_out"].sum(min_count=1),
+        "Errors": grouped["error"].count(),
+    })
+    summary = summary.rename_axis("Label").reset_index()
+    return summary.sort_values("p95 ms", ascending=False, ignore_index=True)[columns].round(2)
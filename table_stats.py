@@ -0,0 +1,286 @@
+import threading
+
+from sqlalchemy import text
+
+from db import get_db_connection
+
+# ================= CONFIG =================
+# Rows per (table, Inserted_date) kept current by statement triggers
+DAILY_TABLE = "key_table_daily"
+# One row per table once an exact refresh has seeded DAILY_TABLE
+REFRESH_TABLE = "key_table_refresh"
+# Per-table change counter bumped by every statement that changes rows;
+# DAILY_TABLE."version" is the counter value of each day's last change
+CHANGES_TABLE = "key_table_changes"
+STATS_FUNCTION = "key_table_daily_apply"
+# Day used for rows without an Inserted_date (excluded from "latest")
+NO_DATE = "-infinity"
+
+_refreshing = set()
+_refresh_errors = {}   # table_name -> message of its last failed background refresh
+_refresh_lock = threading.Lock()
+
+
+# ================= SCHEMA =================
+def create_stats_schema(conn):
+    """Create the stats tables and the trigger function (run by migrations.py)"""
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS "{DAILY_TABLE}" (
+            "table_name" text   NOT NULL,
+            "day"        date   NOT NULL,
+            "rows"       bigint NOT NULL,
+            PRIMARY KEY ("table_name", "day")
+        )
+    """))
+    conn.execute(text(f'ALTER TABLE "{DAILY_TABLE}" ADD COLUMN IF NOT EXISTS "version" bigint NOT NULL DEFAULT 0'))
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS "{REFRESH_TABLE}" (
+            "table_name"   text        PRIMARY KEY,
+            "refreshed_at" timestamptz NOT NULL DEFAULT now()
+        )
+    """))
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS "{CHANGES_TABLE}" (
+            "table_name" text        PRIMARY KEY,
+            "version"    bigint      NOT NULL,
+            "changed_at" timestamptz NOT NULL DEFAULT now()
+        )
+    """))
+    conn.execute(text(f"""
+        CREATE OR REPLACE FUNCTION "{STATS_FUNCTION}"() RETURNS trigger
+        LANGUAGE plpgsql AS $fn$
+        DECLARE
+            v bigint;
+        BEGIN
+            -- Statements that changed nothing (e.g. ON CONFLICT DO NOTHING on
+            -- duplicates only) leave the table's version alone
+            IF TG_OP = 'INSERT' THEN
+                IF NOT EXISTS (SELECT 1 FROM new_rows) THEN
+                    RETURN NULL;
+                END IF;
+            ELSIF NOT EXISTS (SELECT 1 FROM old_rows) THEN
+                RETURN NULL;
+            END IF;
+
+            INSERT INTO "{CHANGES_TABLE}" ("table_name", "version") VALUES (TG_TABLE_NAME, 1)
+            ON CONFLICT ("table_name")
+            DO UPDATE SET "version" = "{CHANGES_TABLE}"."version" + 1, "changed_at" = now()
+            RETURNING "version" INTO v;
+
+            -- An UPDATE (e.g. an upsert moving Inserted_date) is a delete of
+            -- its old rows plus an insert of its new ones
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                -- Upserted (not just updated) so a day without a row yet
+                -- keeps the decrement for the next refresh to reconcile
+                INSERT INTO "{DAILY_TABLE}" ("table_name", "day", "rows", "version")
+                SELECT TG_TABLE_NAME, COALESCE("Inserted_date"::date, '{NO_DATE}'), -COUNT(*), v
+                FROM old_rows GROUP BY 2
+                ON CONFLICT ("table_name", "day")
+                DO UPDATE SET "rows" = "{DAILY_TABLE}"."rows" + EXCLUDED."rows", "version" = v;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO "{DAILY_TABLE}" ("table_name", "day", "rows", "version")
+                SELECT TG_TABLE_NAME, COALESCE("Inserted_date"::date, '{NO_DATE}'), COUNT(*), v
+                FROM new_rows GROUP BY 2
+                ON CONFLICT ("table_name", "day")
+                DO UPDATE SET "rows" = "{DAILY_TABLE}"."rows" + EXCLUDED."rows", "version" = v;
+            END IF;
+            RETURN NULL;
+        END
+        $fn$
+    """))
+
+
+def stats_triggers(table_name):
+    """{trigger name: (event, REFERENCING clause)} kept on a key table"""
+    return {
+        f"{table_name}_stats_insert": ("INSERT", "NEW TABLE AS new_rows"),
+        f"{table_name}_stats_delete": ("DELETE", "OLD TABLE AS old_rows"),
+        f"{table_name}_stats_update": ("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+    }
+
+
+def create_stats_triggers(conn, table_name):
+    """Create the missing stats triggers on `table_name`.
+
+    Statement-level triggers read the transition tables of each INSERT,
+    UPDATE or DELETE, so rows skipped by ON CONFLICT DO NOTHING are not
+    counted and a 10,000-row chunk costs one grouped upsert, not 10,000
+    row triggers.
+    """
+    for trigger, (event, ref) in stats_triggers(table_name).items():
+        exists = conn.execute(
+            text("SELECT 1 FROM pg_trigger WHERE tgname = :n AND tgrelid = to_regclass(:t)"),
+            {"n": trigger, "t": f'"{table_name}"'}
+        ).first()
+        if exists:
+            continue
+        conn.execute(text(f"""
+            CREATE TRIGGER "{trigger}"
+            AFTER {event} ON "{table_name}"
+            REFERENCING {ref}
+            FOR EACH STATEMENT EXECUTE FUNCTION "{STATS_FUNCTION}"()
+        """))
+
+
+# ================= VERSIONS =================
+def table_version(cur, table_name):
+    """Current change counter of `table_name` (0 if it never changed); `cur` is a DB-API cursor"""
+    cur.execute(f'SELECT "version" FROM "{CHANGES_TABLE}" WHERE "table_name" = %s', (table_name,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def read_table_version(table_name):
+    """table_version on a pooled connection of its own; None if it cannot be read"""
+    try:
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            return table_version(cur, table_name)
+        finally:
+            conn.rollback()
+            conn.close()
+    except Exception:
+        return None
+
+
+def changed_days_since(cur, table_name, version):
+    """Days whose rows changed after `version`, oldest first (NO_DATE rows as None)"""
+    cur.execute(
+        f'SELECT NULLIF("day", \'{NO_DATE}\')::date FROM "{DAILY_TABLE}" '
+        f'WHERE "table_name" = %s AND "version" > %s ORDER BY "day"',
+        (table_name, version)
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+# ================= REFRESH =================
+def refresh_stats(engine, table_name):
+    """Recount `table_name` exactly without blocking imports.
+
+    The scan runs in a REPEATABLE READ snapshot and compares its counts with
+    the per-day rows as of the same snapshot; only the difference is then
+    added to the live rows. Changes committed after the snapshot were counted
+    by the triggers on top of those rows, so they are neither lost nor
+    counted twice, and no table lock is needed. An advisory lock keeps two
+    refreshes of the same table from applying their corrections twice.
+    """
+    with engine.connect() as lock_conn:
+        lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+        lock_conn.execute(text("SELECT pg_advisory_lock(hashtext(:k))"), {"k": f"{REFRESH_TABLE}:{table_name}"})
+        try:
+            _apply_recount(engine, table_name)
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(hashtext(:k))"), {"k": f"{REFRESH_TABLE}:{table_name}"})
+
+
+def _apply_recount(engine, table_name):
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="REPEATABLE READ")
+        with conn.begin():
+            corrections = conn.execute(text(f"""
+                SELECT COALESCE(c.day, d."day")::text, COALESCE(c.n, 0) - COALESCE(d."rows", 0)
+                FROM (
+                    SELECT COALESCE("Inserted_date"::date, '{NO_DATE}') AS day, COUNT(*) AS n
+                    FROM "{table_name}" GROUP BY 1
+                ) c
+                FULL JOIN (
+                    SELECT "day", "rows" FROM "{DAILY_TABLE}" WHERE "table_name" = :t
+                ) d ON d."day" = c.day
+            """), {"t": table_name}).fetchall()
+    corrections = [(day, delta) for day, delta in corrections if delta]
+
+    with engine.begin() as conn:
+        if corrections:
+            # Days travel as text: '-infinity' has no Python date
+            conn.execute(text(f"""
+                INSERT INTO "{DAILY_TABLE}" ("table_name", "day", "rows")
+                SELECT :t, c.day::date, c.delta
+                FROM unnest(CAST(:days AS text[]), CAST(:deltas AS bigint[])) AS c(day, delta)
+                ON CONFLICT ("table_name", "day")
+                DO UPDATE SET "rows" = "{DAILY_TABLE}"."rows" + EXCLUDED."rows"
+            """), {"t": table_name, "days": [d for d, _ in corrections], "deltas": [n for _, n in corrections]})
+        conn.execute(text(f"""
+            INSERT INTO "{REFRESH_TABLE}" ("table_name", "refreshed_at") VALUES (:t, now())
+            ON CONFLICT ("table_name") DO UPDATE SET "refreshed_at" = EXCLUDED."refreshed_at"
+        """), {"t": table_name})
+
+
+def refresh_in_background(engine, table_name):
+    """Start refresh_stats in a daemon thread unless this process already runs one for the table"""
+    with _refresh_lock:
+        if table_name in _refreshing:
+            return False
+        _refreshing.add(table_name)
+
+    def run():
+        error = None
+        try:
+            refresh_stats(engine, table_name)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            with _refresh_lock:
+                _refreshing.discard(table_name)
+                if error:
+                    _refresh_errors[table_name] = error
+                else:
+                    _refresh_errors.pop(table_name, None)
+
+    threading.Thread(target=run, daemon=True, name=f"stats-refresh-{table_name}").start()
+    return True
+
+
+def refresh_error(table_name):
+    """Message of the last failed background refresh of `table_name` in this process, or None"""
+    with _refresh_lock:
+        return _refresh_errors.get(table_name)
+
+
+# ================= READ =================
+def estimate_rows(conn, table_name) -> int:
+    """Planner estimate from pg_class.reltuples (summed over partitions, if any)"""
+    return conn.execute(text("""
+        SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)::bigint
+        FROM pg_class c
+        WHERE c.oid = to_regclass(:t)
+           OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(:t))
+    """), {"t": f'"{table_name}"'}).scalar()
+
+
+def read_estimates(engine, table_names) -> dict:
+    """{table: {"count", "latest", "exact"}} from reltuples only (stats tables unavailable)"""
+    with engine.connect() as conn:
+        return {t: {"count": estimate_rows(conn, t), "latest": None, "exact": False} for t in table_names}
+
+
+def read_stats(engine, table_names) -> dict:
+    """{table: {"count", "latest", "exact"}} without scanning the key tables.
+
+    Seeded tables are read from the per-day stats; the others get a
+    reltuples estimate (exact=False, latest=None) until a refresh has run.
+    """
+    stats = {}
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"""
+            SELECT d."table_name", SUM(d."rows")::bigint,
+                   MAX(d."day") FILTER (WHERE d."day" > '{NO_DATE}' AND d."rows" > 0)
+            FROM "{DAILY_TABLE}" d
+            JOIN "{REFRESH_TABLE}" r USING ("table_name")
+            WHERE d."table_name" = ANY(:tables)
+            GROUP BY d."table_name"
+        """), {"tables": list(table_names)}).fetchall()
+        seeded = set(conn.execute(
+            text(f'SELECT "table_name" FROM "{REFRESH_TABLE}" WHERE "table_name" = ANY(:tables)'),
+            {"tables": list(table_names)}
+        ).scalars())
+        for table_name, count, latest in rows:
+            stats[table_name] = {"count": int(count or 0), "latest": latest, "exact": True}
+        for table_name in table_names:
+            if table_name in seeded and table_name not in stats:
+                stats[table_name] = {"count": 0, "latest": None, "exact": True}
+            elif table_name not in stats:
+                stats[table_name] = {"count": estimate_rows(conn, table_name), "latest": None, "exact": False}
+    return stats
+
@@ -0,0 +1,35 @@
+import pandas as pd
+
+from canonical import canonical_bank, canonical_loose, canonical_vpa, canonicalize, legacy_forms
+
+
+def test_canonical_vpa():
+    values = pd.Series([" Foo Bar@OkAxis ", "foo@okaxis", None], index=[5, 6, 7], name="Upi_vpa")
+    out = canonical_vpa(values)
+    assert out.tolist() == ["foobar@okaxis", "foo@okaxis", None]
+    assert out.index.tolist() == [5, 6, 7]
+    assert out.name == "Upi_vpa"
+
+
+def test_canonical_bank_keeps_zeros_and_case():
+    assert canonical_bank([" 0012345678 ", "AB12"]).tolist() == ["0012345678", "AB12"]
+
+
+def test_canonical_loose():
+    assert canonical_loose(["Shop.Example.com, ", "A B@x"]).tolist() == ["shopexamplecom", "ab@x"]
+
+
+def test_canonicalize_by_column():
+    assert canonicalize([" A@B "], "Upi_vpa").tolist() == ["a@b"]
+    assert canonicalize([" A@B "], "Bank_account_number").tolist() == ["A@B"]
+    assert canonicalize([" A@B "], "Other").tolist() == ["A@B"]
+
+
+def test_legacy_forms():
+    forms = legacy_forms([" Foo Bar@X ", None], "Upi_vpa")
+    assert [f.tolist() for f in forms] == [["Foo Bar@X", None], ["foo bar@x", None]]
+    assert legacy_forms(["1"], "Bank_account_number") == []
+
+
+def test_empty_input():
+    assert canonical_vpa([]).tolist() == []
@@ -0,0 +1,57 @@
+import itertools
+import sqlite3
+import types
+
+import pytest
+
+import check_cache
+from check_cache import cache_get, cache_put
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(check_cache, "CACHE_PATH", str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(check_cache, "_local", check_cache.threading.local())
+
+
+def test_answers_are_reused_at_their_version_only():
+    cache_put("t", ["a", "b"], {"a": "2024-01-05"}, version=3)
+    assert cache_get("t", ["a", "b", "c"], 3) == {"a": (True, "2024-01-05"), "b": (False, None)}
+    assert cache_get("t", ["a", "b"], 4) == {}
+    assert cache_get("t", ["a", "b"], None) == {}
+
+
+def test_unknown_version_is_not_stored():
+    cache_put("t", ["a"], {}, version=None)
+    assert cache_get("t", ["a"], 0) == {}
+
+
+def test_older_versions_are_dropped_on_write():
+    cache_put("t", ["a"], {}, version=1)
+    cache_put("t", ["b"], {}, version=2)
+    rows = check_cache._get_conn().execute("SELECT id, version FROM check_cache").fetchall()
+    assert rows == [("b", 2)]
+
+
+def test_ttl_and_size_bounds(monkeypatch):
+    clock = itertools.count(1_000_000)
+    monkeypatch.setattr(check_cache, "time", types.SimpleNamespace(time=lambda: next(clock)))
+    monkeypatch.setattr(check_cache, "CACHE_MAX_ROWS", 2)
+    cache_put("t", ["a"], {}, version=1)
+    cache_put("t", ["b"], {}, version=1)
+    cache_put("t", ["c"], {}, version=1)
+    assert set(cache_get("t", ["a", "b", "c"], 1)) == {"b", "c"}
+
+    monkeypatch.setattr(check_cache, "CACHE_TTL", -1)
+    assert cache_get("t", ["b", "c"], 1) == {}
+
+
+def test_unversioned_cache_file_is_replaced():
+    conn = sqlite3.connect(check_cache.CACHE_PATH)
+    conn.execute("CREATE TABLE check_cache (table_name TEXT, id TEXT, found INTEGER, first_seen TEXT, checked_at REAL)")
+    conn.execute("INSERT INTO check_cache VALUES ('t', 'a', 0, NULL, 1e12)")
+    conn.commit()
+    conn.close()
+    assert cache_get("t", ["a"], 0) == {}
+    cache_put("t", ["a"], {"a": "2024-01-05"}, version=0)
+    assert cache_get("t", ["a"], 0) == {"a": (True, "2024-01-05")}
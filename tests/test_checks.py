@@ -0,0 +1,172 @@
+import pandas as pd
+import pytest
+
+import checks
+from checks import check_ids_batch
+
+
+class StubCursor:
+    """Answers "= ANY(array)" lookups from a dict of stored keys"""
+
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+
+    def execute(self, query, params=None):
+        self.db.queries.append(list(params[0]))
+        if self.db.fail and self.db.fail(params[0]):
+            raise RuntimeError("bad batch")
+        self.rows = [(k, self.db.rows[k]) for k in params[0] if k in self.db.rows]
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class StubConnection:
+    closed = False
+
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self):
+        return StubCursor(self.db)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class StubDB:
+    def __init__(self, rows, fail=None):
+        self.rows = rows
+        self.fail = fail
+        self.queries = []
+
+    def connect(self):
+        return StubConnection(self)
+
+
+@pytest.fixture
+def stub_db(monkeypatch):
+    def install(rows, fail=None):
+        db = StubDB(rows, fail)
+        monkeypatch.setattr(checks, "get_db_connection", db.connect)
+        monkeypatch.setattr(checks, "read_table_version", lambda table_name: None)
+        return db
+    return install
+
+
+def test_legacy_stored_vpas_are_found(stub_db):
+    stub_db({"Foo@Bank": "2024-01-01", "bar baz@x": "2024-01-02"})
+    res = check_ids_batch([" Foo@Bank", "foo@bank", "Bar Baz@x", "bar baz@x"], "all_upiiD", "Upi_vpa", use_cache=False)
+    assert res["Exists"].tolist() == [True, False, True, True]
+    assert res["First Seen"].iloc[0] == pd.Timestamp("2024-01-01")
+
+
+def test_canonical_and_legacy_forms_take_earliest_date(stub_db):
+    stub_db({"Foo@Bank": "2024-03-01", "foo@bank": "2024-01-01"})
+    res = check_ids_batch(["Foo@Bank"], "all_upiiD", "Upi_vpa", use_cache=False)
+    assert res["First Seen"].iloc[0] == pd.Timestamp("2024-01-01")
+
+
+def test_classify_ids():
+    kinds = checks.classify_ids(["a@ok", "123-45", " 123 45 ", "12a", None])
+    assert kinds.tolist() == ["UPI", "Bank Account", "Bank Account", checks.UNKNOWN_TYPE, checks.UNKNOWN_TYPE]
+
+
+def test_mixed_check_strips_account_separators_and_merges(stub_db):
+    stub_db({"12345": "2024-01-01", "a@ok": "2024-01-02", "x1": "2024-01-03"})
+    res = checks.check_ids_mixed(["123-45", "a@ok", "b@ok", "123 45", "x1"], use_cache=False)
+    assert res["ID"].tolist() == ["123-45", "a@ok", "b@ok", "123 45", "x1"]
+    assert res["Exists"].tolist() == [True, True, False, True, True]
+    assert res["Table"].astype(object).where(res["Table"].notna(), None).tolist()[:4] == \
+        ["all_bank_acc", "all_upiiD", None, "all_bank_acc"]
+    assert res["Type"].tolist()[4] == checks.UNKNOWN_TYPE
+    assert res["First Seen"].iloc[1] == pd.Timestamp("2024-01-02")
+
+
+def test_result_shape_order_and_duplicates(stub_db):
+    db = stub_db({"0012": "2024-01-01", "77": "2024-02-01"})
+    ids = ["77", " 0012", "missing", "77", None, ""]
+    res = check_ids_batch(ids, "all_bank_acc", "Bank_account_number", use_cache=False)
+    assert res.columns.tolist() == ["ID", "Exists", "Status", "First Seen", "Error"]
+    assert res["ID"].tolist() == ids
+    assert res["Exists"].tolist() == [True, True, False, True, False, False]
+    assert res["Status"].tolist() == ["Found", "Found", "Not Found", "Found", "Not Found", "Not Found"]
+    assert list(res["Status"].cat.categories) == checks.RESULT_STATUSES
+    assert res["First Seen"].iloc[3] == pd.Timestamp("2024-02-01")
+    assert res["Error"].isna().all()
+    # Distinct, non-empty keys only, in one statement
+    assert db.queries == [["77", "0012", "missing"]]
+
+
+def test_failed_batch_is_bisected_to_the_bad_id(stub_db):
+    db = stub_db({"1": "2024-01-01", "3": "2024-01-03"}, fail=lambda ids: "bad" in ids)
+    warnings = []
+    res = check_ids_batch(["1", "2", "bad", "3"], "all_bank_acc", "Bank_account_number",
+                          on_warning=warnings.append, use_cache=False)
+    assert res["Status"].tolist() == ["Found", "Not Found", "Error", "Found"]
+    assert res["Error"].iloc[2] == "bad batch"
+    assert res["Error"].iloc[[0, 1, 3]].isna().all()
+    assert len(warnings) == 1
+    # One failed batch, then halves until "bad" stands alone
+    assert ["bad"] in db.queries and len(db.queries) <= 6
+
+
+def test_bisect_reraises_when_the_connection_is_lost():
+    class LostConnection(StubConnection):
+        closed = True
+
+    db = StubDB({}, fail=lambda ids: True)
+    with pytest.raises(RuntimeError):
+        checks.bisect_existing_ids(LostConnection(db), ["1", "2"], "all_bank_acc", "Bank_account_number", {})
+
+
+def test_cached_answers_skip_the_database(stub_db, tmp_path, monkeypatch):
+    import check_cache
+    monkeypatch.setattr(check_cache, "CACHE_PATH", str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(check_cache, "_local", check_cache.threading.local())
+    db = stub_db({"1": "2024-01-01"})
+    monkeypatch.setattr(checks, "read_table_version", lambda table_name: 5)
+
+    first = check_ids_batch(["1", "2"], "all_bank_acc", "Bank_account_number")
+    second = check_ids_batch(["1", "2"], "all_bank_acc", "Bank_account_number")
+    assert first["Exists"].tolist() == second["Exists"].tolist() == [True, False]
+    assert db.queries == [["1", "2"]]
+
+    monkeypatch.setattr(checks, "read_table_version", lambda table_name: 6)
+    check_ids_batch(["1", "2"], "all_bank_acc", "Bank_account_number")
+    assert len(db.queries) == 2
+
+
+def test_current_snapshot_answers_misses(stub_db, monkeypatch):
+    import numpy as np
+    from key_snapshot import hash_keys
+
+    db = stub_db({"1": "2024-01-01"})
+    monkeypatch.setattr(checks, "read_table_version", lambda table_name: 3)
+    snapshot = {"table_name": "all_bank_acc", "version": 3, "hashes": np.sort(hash_keys(["1"]))}
+    res = check_ids_batch(["1", "2"], "all_bank_acc", "Bank_account_number", snapshot=snapshot, use_cache=False)
+    assert res["Exists"].tolist() == [True, False]
+    assert db.queries == [["1"]]
+
+    # A newer table version makes the snapshot stale: every key goes to the database
+    monkeypatch.setattr(checks, "read_table_version", lambda table_name: 4)
+    check_ids_batch(["1", "2"], "all_bank_acc", "Bank_account_number", snapshot=snapshot, use_cache=False)
+    assert db.queries[-1] == ["1", "2"]
+
+
+@pytest.mark.parametrize("prefix, bounds", [
+    ("abc", ("abc", "abd")),
+    ("a", ("a", "b")),
+    ("ab9", ("ab9", "ab:")),
+])
+def test_handle_bounds(prefix, bounds):
+    lo, hi = checks._handle_bounds(prefix)
+    assert (lo, hi) == bounds
+    assert lo <= prefix + "zzz" < hi
@@ -0,0 +1,64 @@
+import asyncio
+import json
+
+import lookup_service
+
+
+class FakeWriter:
+    def __init__(self):
+        self.data = b""
+        self.closed = False
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def _request(server, raw):
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw)
+        reader.feed_eof()
+        writer = FakeWriter()
+        await server.handle(reader, writer)
+        return writer
+    return asyncio.run(run())
+
+
+def test_route_error_returns_500(monkeypatch):
+    def broken():
+        raise RuntimeError("pool gone")
+    monkeypatch.setattr(lookup_service, "pool_status", broken)
+    writer = _request(lookup_service.LookupServer(), b"GET /health HTTP/1.1\r\nConnection: close\r\n\r\n")
+    head, _, body = writer.data.partition(b"\r\n\r\n")
+    assert head.startswith(b"HTTP/1.1 500 Internal Server Error")
+    assert json.loads(body)["error"] == "RuntimeError: pool gone"
+    assert writer.closed
+
+
+def test_bad_content_length_returns_400():
+    writer = _request(lookup_service.LookupServer(), b"POST /check/upi HTTP/1.1\r\nContent-Length: -5\r\n\r\n")
+    assert writer.data.startswith(b"HTTP/1.1 400 ")
+
+
+def test_coalescer_keeps_batch_tasks_until_done(monkeypatch):
+    monkeypatch.setattr(lookup_service, "lookup_keys",
+                        lambda table, column, keys: {k: (k == "a@ok", None, None) for k in keys})
+
+    async def run():
+        coalescer = lookup_service.Coalescer("all_upiiD", "Upi_vpa", None, asyncio.Semaphore(1))
+        first = asyncio.ensure_future(coalescer.lookup(["a@ok", "b@ok"]))
+        second = asyncio.ensure_future(coalescer.lookup(["a@ok"]))
+        await asyncio.sleep(0)
+        answers = await asyncio.gather(first, second)
+        assert not coalescer.tasks
+        return answers
+
+    first, second = asyncio.run(run())
+    assert first == {"a@ok": (True, None, None), "b@ok": (False, None, None)}
+    assert second == {"a@ok": (True, None, None)}
@@ -0,0 +1,107 @@
+import io
+import warnings
+
+import pandas as pd
+import pytest
+
+import pipeline
+from pipeline import TABLE_OPTIONS, read_import_csv_streaming, read_import_upload, read_projected
+
+HEADER = "Feature_type,Upi_bank_account_wallet,Search_for,Upi_vpa,Inserted_date\n"
+
+
+def _row(wallet, vpa, date="2024-01-05"):
+    return f"BS Money Laundering,{wallet},App,{vpa},{date}\n"
+
+
+def test_streaming_with_all_filtered_first_chunk():
+    csv = HEADER + "".join([
+        _row("Bank Account", "skip1@ok"),
+        _row("Bank Account", "skip2@ok"),
+        _row("Bank Account", "skip3@ok"),
+        _row("UPI", "a@ok"),
+        _row("UPI", "b@ok"),
+        _row("UPI", "A@OK"),
+    ])
+    for chunk_rows in (2, 3):
+        df_clean, stats = read_import_csv_streaming(io.StringIO(csv), TABLE_OPTIONS["UPI"], chunk_rows=chunk_rows)
+        assert sorted(df_clean["Upi_vpa"]) == ["a@ok", "b@ok"]
+        assert stats["rows"] == 6
+        assert stats["cleaned"] == 2
+
+
+def test_streaming_dedups_across_chunks():
+    csv = HEADER + _row("UPI", "a@ok") + _row("UPI", "b@ok") + _row("UPI", "a@ok", "2024-02-01")
+    df_clean, _ = read_import_csv_streaming(io.StringIO(csv), TABLE_OPTIONS["UPI"], chunk_rows=2)
+    assert df_clean["Upi_vpa"].tolist() == ["a@ok", "b@ok"]
+    assert str(df_clean["Inserted_date"].iloc[0]) == "2024-01-05"
+
+
+def test_xls_batches_are_read_whole(monkeypatch):
+    frame = pd.DataFrame({
+        "Feature_type": ["BS Money Laundering"] * 2,
+        "Upi_bank_account_wallet": ["UPI"] * 2,
+        "Search_for": ["App"] * 2,
+        "Upi_vpa": ["a@ok", "b@ok"],
+        "Inserted_date": ["2024-01-05"] * 2,
+    })
+    monkeypatch.setattr(pipeline, "sniff_header", lambda file, name=None: frame.columns.tolist())
+    monkeypatch.setattr(pipeline, "read_projected", lambda file, columns, name=None: frame[columns])
+    monkeypatch.setattr(pipeline, "iter_xlsx_frames", lambda *a, **k: pytest.fail("streamed an .xls"))
+
+    batches = list(pipeline.iter_import_batches("export.xls", TABLE_OPTIONS["UPI"], chunk_rows=1))
+    assert len(batches) == 1
+    assert batches[0][0]["Upi_vpa"].tolist() == ["a@ok", "b@ok"]
+
+
+BANK_CSV = (
+    "Feature_type,Upi_bank_account_wallet,Search_for,Bank_account_number,Inserted_date\n"
+    "BS Money Laundering,Bank Account,App,0012345678,2024-01-05\n"
+    "BS Money Laundering,Bank Account,App,12345678,2024-01-05\n"
+)
+
+
+def test_projected_read_keeps_leading_zeros(tmp_path):
+    path = tmp_path / "bank.csv"
+    path.write_text(BANK_CSV)
+    for source in (str(path), io.BytesIO(BANK_CSV.encode())):
+        df = read_import_upload(source, TABLE_OPTIONS["Bank Account"])
+        assert df["Bank_account_number"].tolist() == ["0012345678", "12345678"]
+
+
+def test_projected_and_streamed_reads_agree(tmp_path):
+    path = tmp_path / "bank.csv"
+    path.write_text(BANK_CSV)
+    cfg = TABLE_OPTIONS["Bank Account"]
+    whole, _ = pipeline.clean_import_frame(read_import_upload(str(path), cfg), cfg)
+    streamed, _ = read_import_csv_streaming(str(path), cfg, chunk_rows=1)
+    assert sorted(whole["Bank_account_number"]) == sorted(streamed["Bank_account_number"]) == ["0012345678", "12345678"]
+
+
+def test_blank_category_values_stay_strings():
+    csv = "Input_user,Approvd_status\nu1,1\nu2,\nu3,0\n"
+    df = read_projected(io.BytesIO(csv.encode()), ["Input_user", "Approvd_status"])
+    assert isinstance(df["Approvd_status"].dtype, pd.CategoricalDtype)
+    assert (df["Approvd_status"] == "1").sum() == 1
+    assert df["Approvd_status"].isna().sum() == 1
+
+
+@pytest.mark.parametrize("values", [
+    ["02/01/2024", "13/01/2024", "02/01/2024", None],
+    ["2024-01-05", "2024-01-05 10:30:00", "bad", ""],
+    ["2024-01-05T10:00:00+05:30", "2024-01-06T10:00:00+05:30", None],
+])
+def test_parse_dates_matches_to_datetime(values):
+    series = pd.Series(values, dtype=object, name="Inserted_date")
+    with warnings.catch_warnings():
+        # "Could not infer format" / dayfirst warnings come from both sides alike
+        warnings.simplefilter("ignore", UserWarning)
+        expected = pd.to_datetime(series, errors="coerce")
+        parsed = pipeline.parse_dates(series)
+    pd.testing.assert_series_equal(parsed, expected)
+
+
+def test_parse_dates_does_not_mix_day_month_orders():
+    parsed = pipeline.parse_dates(pd.Series(["02/01/2024", "13/01/2024"], dtype=object))
+    assert parsed.iloc[0] == pd.Timestamp("2024-02-01")
+    assert parsed.isna().iloc[1]
@@ -0,0 +1,16 @@
+import sql_log
+
+
+def test_rendered_values_are_not_logged(monkeypatch):
+    monkeypatch.setattr(sql_log, "SQL_LOG_PATH", "")
+    sql = 'INSERT INTO "all_upiiD" ("Upi_vpa", "Inserted_date") VALUES (\'secret@upi\', \'2024-01-05\') ON CONFLICT DO NOTHING'
+    sql_log.record(sql, None, 1, 0.01)
+    entry = sql_log.recent_records()[-1]
+    assert "secret@upi" not in entry["sql"]
+    assert entry["sql"] == 'INSERT INTO "all_upiiD" ("Upi_vpa", "Inserted_date") VALUES ...'
+    assert entry["label"] == "INSERT all_upiiD"
+
+
+def test_parameterized_statements_are_kept():
+    sql = 'SELECT "Upi_vpa" FROM "all_upiiD" WHERE "Upi_vpa" = ANY(%s::text[])'
+    assert sql_log.redact(sql) == sql
@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+
+from upload_cache import FrameCache, _approx_nbytes  # noqa: E402
+
+
+def _frame(n):
+    return pd.DataFrame({"k": [f"key{i:06d}" for i in range(n)]})
+
+
+def test_least_recently_used_frame_is_evicted():
+    a, b, c = _frame(100), _frame(100), _frame(100)
+    cache = FrameCache(max_bytes=_approx_nbytes(a) * 2)
+    cache.put("a", a)
+    cache.put("b", b)
+    assert cache.get("a") is a
+    cache.put("c", c)
+    assert cache.get("b") is None
+    assert cache.get("a") is a and cache.get("c") is c
+    assert cache.stats() == {"entries": 2, "bytes": _approx_nbytes(a) * 2}
+
+
+def test_oversized_value_is_not_cached():
+    cache = FrameCache(max_bytes=10)
+    cache.put("big", _frame(100))
+    assert cache.get("big") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_replacing_a_key_keeps_the_byte_count():
+    frame = _frame(10)
+    cache = FrameCache(max_bytes=10 ** 6)
+    cache.put("a", frame)
+    cache.put("a", frame)
+    assert cache.stats() == {"entries": 1, "bytes": _approx_nbytes(frame)}
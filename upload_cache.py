@@ -0,0 +1,91 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import streamlit as st
+
+# ================= CONFIG =================
+# Memory cap for cached frames, shared by every session and page of this server
+CACHE_MAX_MB = int(os.getenv("UPLOAD_CACHE_MAX_MB", "1024"))
+
+
+# ================= HELPERS =================
+def file_digest(file) -> str:
+    """SHA-256 of an uploaded file's content (Streamlit UploadedFile or file-like)"""
+    if hasattr(file, "getvalue"):
+        data = file.getvalue()
+    else:
+        pos = file.tell()
+        data = file.read()
+        file.seek(pos)
+    return hashlib.sha256(data).hexdigest()
+
+
+def _approx_nbytes(value) -> int:
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, (tuple, list)):
+        return sum(_approx_nbytes(v) for v in value)
+    if isinstance(value, dict):
+        return sum(_approx_nbytes(v) for v in value.values())
+    return 64
+
+
+# ================= CACHE =================
+class FrameCache:
+    """Thread-safe LRU of derived upload stages keyed by (file digest, stage).
+
+    Values are shared between sessions: callers must treat them as read-only
+    and copy before mutating in place.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()   # key -> (value, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            self._items.move_to_end(key)
+            return item[0]
+
+    def put(self, key, value):
+        nbytes = _approx_nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self._bytes -= self._items.pop(key)[1]
+            self._items[key] = (value, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self._bytes -= evicted
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self._bytes}
+
+
+@st.cache_resource
+def get_frame_cache():
+    return FrameCache(CACHE_MAX_MB * 1024 * 1024)
+
+
+def cached_stage(digest, stage, build):
+    """Return the cached value for (digest, stage), building and storing it on a miss"""
+    cache = get_frame_cache()
+    key = (digest, stage)
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.put(key, value)
+    return value